@@ -1,9 +1,15 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import click
+from flask import Flask, request, jsonify, send_from_directory, Response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token
 from flask_cors import CORS
+from server.auth import Auth, current_user_id
+from server.catalog_cache import CatalogCache
+from server.cart_store import create_cart_store
+from server.db_engine import configure_app_engine, init_engine
 
 app = Flask(__name__, static_folder='client/build', static_url_path='')
 CORS(app)
@@ -13,10 +19,20 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:/
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
 app.config['JWT_SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
+app.config['CATALOG_CACHE_TTL'] = float(os.environ.get('CATALOG_CACHE_TTL', 30))
+# memory (per process) or file (SQLite file shared by the workers on one host)
+app.config['CART_BACKEND'] = os.environ.get('CART_BACKEND', 'memory')
+app.config['CART_STORE_PATH'] = os.environ.get('CART_STORE_PATH', os.path.join(app.instance_path, 'carts.db'))
+
+configure_app_engine(app)
 
 db = SQLAlchemy(app)
+init_engine(app, db)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
+# Token checks go through the cached auth layer; this app keeps no revocation table
+auth = Auth().watch()
+auth.init_app(app)
 
 # Models
 class User(db.Model):
@@ -32,7 +48,7 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False)
 
 # In-memory storage
-user_carts = {}
+cart_store = create_cart_store(app.config['CART_BACKEND'], path=app.config['CART_STORE_PATH'])
 user_orders = {}
 
 # Serve React App - must be AFTER all API routes
@@ -50,31 +66,46 @@ def serve_react_app(path):
     # Otherwise serve index.html for React Router
     return send_from_directory(app.static_folder, 'index.html')
 
+# Fallback products - 12 items
+FALLBACK_PRODUCTS = [
+    {"id": 1, "name": "Tomato", "description": "Fresh red tomatoes", "price": 3.5},
+    {"id": 2, "name": "Cabbage", "description": "Green cabbage", "price": 2.0},
+    {"id": 3, "name": "Onion", "description": "White onions", "price": 1.5},
+    {"id": 4, "name": "Potato", "description": "Fresh potatoes", "price": 4.0},
+    {"id": 5, "name": "Carrot", "description": "Organic carrots", "price": 3.0},
+    {"id": 6, "name": "Spinach", "description": "Fresh spinach", "price": 2.5},
+    {"id": 7, "name": "Kale", "description": "Organic kale", "price": 3.0},
+    {"id": 8, "name": "Lettuce", "description": "Crispy lettuce", "price": 2.0},
+    {"id": 9, "name": "Cucumber", "description": "Fresh cucumber", "price": 1.5},
+    {"id": 10, "name": "Bell Pepper", "description": "Colorful peppers", "price": 4.5},
+    {"id": 11, "name": "Broccoli", "description": "Fresh broccoli", "price": 3.5},
+    {"id": 12, "name": "Cauliflower", "description": "White cauliflower", "price": 3.0}
+]
+FALLBACK_PRODUCTS_BY_ID = {p["id"]: p for p in FALLBACK_PRODUCTS}
+
+def load_catalog(key):
+    products = Product.query.order_by(Product.id).all()
+    if products:
+        return [{"id": p.id, "name": p.name, "description": p.description, "price": p.price} for p in products], None
+    return FALLBACK_PRODUCTS, None
+
+catalog_cache = CatalogCache(load_catalog, ttl=app.config['CATALOG_CACHE_TTL']).watch(Product)
+
 # API Routes
 @app.route('/api/products')
 def get_products():
     try:
-        products = Product.query.all()
-        if products:
-            return jsonify([{"id": p.id, "name": p.name, "description": p.description, "price": p.price} for p in products])
+        entry = catalog_cache.get()
     except:
-        pass
-    
-    # Fallback products - 12 items
-    return jsonify([
-        {"id": 1, "name": "Tomato", "description": "Fresh red tomatoes", "price": 3.5},
-        {"id": 2, "name": "Cabbage", "description": "Green cabbage", "price": 2.0},
-        {"id": 3, "name": "Onion", "description": "White onions", "price": 1.5},
-        {"id": 4, "name": "Potato", "description": "Fresh potatoes", "price": 4.0},
-        {"id": 5, "name": "Carrot", "description": "Organic carrots", "price": 3.0},
-        {"id": 6, "name": "Spinach", "description": "Fresh spinach", "price": 2.5},
-        {"id": 7, "name": "Kale", "description": "Organic kale", "price": 3.0},
-        {"id": 8, "name": "Lettuce", "description": "Crispy lettuce", "price": 2.0},
-        {"id": 9, "name": "Cucumber", "description": "Fresh cucumber", "price": 1.5},
-        {"id": 10, "name": "Bell Pepper", "description": "Colorful peppers", "price": 4.5},
-        {"id": 11, "name": "Broccoli", "description": "Fresh broccoli", "price": 3.5},
-        {"id": 12, "name": "Cauliflower", "description": "White cauliflower", "price": 3.0}
-    ])
+        return jsonify(FALLBACK_PRODUCTS)
+
+    if request.if_none_match.contains(entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -130,9 +161,9 @@ def login():
         except:
             pass
         
-        # Demo login - accept any email/password for testing
+        # Demo login - accept any email/password for testing; demo users share user 0
         if email and password:
-            token = create_access_token(identity='demo_user')
+            token = create_access_token(identity='0')
             return jsonify({'token': token}), 200
             
         return jsonify({"message": "Invalid credentials"}), 401
@@ -140,52 +171,32 @@ def login():
         return jsonify({"message": "Login failed"}), 401
 
 @app.route('/api/cart', methods=['GET'])
+@auth.required()
 def get_cart():
     try:
-        # Check if user is authenticated
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify([]), 200  # Return empty cart if not logged in
-        
-        from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-        try:
-            verify_jwt_in_request()
-            user_id = get_jwt_identity()
-        except:
-            return jsonify([]), 200  # Return empty cart if token invalid
-        
-        cart_items = user_carts.get(user_id, [])
+        user_id = current_user_id()
+        cart_items = cart_store.items(user_id)
         
         # Format cart items properly
         formatted_cart = []
-        for item in cart_items:
-            if isinstance(item, dict) and 'product_id' in item:
-                formatted_cart.append({
-                    'product_id': item['product_id'],
-                    'product_name': item.get('product_name', f'Product {item["product_id"]}'),
-                    'price': item.get('price', 0),
-                    'quantity': item.get('quantity', 1)
-                })
+        for product_id, quantity in cart_items.items():
+            product = FALLBACK_PRODUCTS_BY_ID.get(product_id, {})
+            formatted_cart.append({
+                'product_id': product_id,
+                'product_name': product.get('name', f'Product {product_id}'),
+                'price': product.get('price', 0),
+                'quantity': quantity
+            })
         
         return jsonify(formatted_cart)
     except Exception as e:
         return jsonify([]), 200  # Return empty cart on any error
 
 @app.route('/api/cart', methods=['POST'])
+@auth.required()
 def add_to_cart():
     try:
-        # Check if user is authenticated
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify({"message": "Please log in to add items to cart"}), 401
-        
-        from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-        try:
-            verify_jwt_in_request()
-            user_id = get_jwt_identity()
-        except:
-            return jsonify({"message": "Please log in to add items to cart"}), 401
-        
+        user_id = current_user_id()
         data = request.get_json()
         
         if not data or 'product_id' not in data:
@@ -194,87 +205,49 @@ def add_to_cart():
         product_id = data['product_id']
         quantity = data.get('quantity', 1)
         
-        # Get product details from fallback data
-        products = {
-            1: {"name": "Tomato", "price": 3.5},
-            2: {"name": "Cabbage", "price": 2.0},
-            3: {"name": "Onion", "price": 1.5},
-            4: {"name": "Potato", "price": 4.0},
-            5: {"name": "Carrot", "price": 3.0},
-            6: {"name": "Spinach", "price": 2.5},
-            7: {"name": "Kale", "price": 3.0},
-            8: {"name": "Lettuce", "price": 2.0},
-            9: {"name": "Cucumber", "price": 1.5},
-            10: {"name": "Bell Pepper", "price": 4.5},
-            11: {"name": "Broccoli", "price": 3.5},
-            12: {"name": "Cauliflower", "price": 3.0}
-        }
-        
-        if product_id not in products:
+        if product_id not in FALLBACK_PRODUCTS_BY_ID:
             return jsonify({"message": "Product not found"}), 404
         
-        if user_id not in user_carts:
-            user_carts[user_id] = []
-        
-        # Check if product already in cart
-        existing_item = None
-        for item in user_carts[user_id]:
-            if item.get('product_id') == product_id:
-                existing_item = item
-                break
-        
-        if existing_item:
-            existing_item['quantity'] += quantity
-        else:
-            user_carts[user_id].append({
-                'product_id': product_id,
-                'product_name': products[product_id]['name'],
-                'price': products[product_id]['price'],
-                'quantity': quantity
-            })
+        cart_store.add(user_id, product_id, quantity)
         
         return jsonify({"message": "Added to cart"}), 201
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 @app.route('/api/order', methods=['POST'])
-@jwt_required()
+@auth.required()
 def place_order():
-    user_id = get_jwt_identity()
+    user_id = current_user_id()
     data = request.get_json()
     if user_id not in user_orders:
         user_orders[user_id] = []
     user_orders[user_id].extend(data['cart_items'])
-    user_carts[user_id] = []
+    cart_store.clear(user_id)
     return jsonify({"message": "Order placed"}), 201
 
 @app.route('/api/orders', methods=['GET'])
-@jwt_required()
+@auth.required()
 def get_orders():
-    user_id = get_jwt_identity()
+    user_id = current_user_id()
     return jsonify(user_orders.get(user_id, []))
 
-# Initialize database
-with app.app_context():
+# Schema and sample data are set up once per deploy, not on every worker import
+@app.cli.command('init-db')
+def init_db_command():
+    """Create any missing tables."""
     db.create_all()
-    if Product.query.count() == 0:
-        products = [
-            Product(name="Tomato", description="Fresh red tomatoes", price=3.5),
-            Product(name="Cabbage", description="Green cabbage", price=2.0),
-            Product(name="Onion", description="White onions", price=1.5),
-            Product(name="Potato", description="Fresh potatoes", price=4.0),
-            Product(name="Carrot", description="Organic carrots", price=3.0),
-            Product(name="Spinach", description="Fresh spinach", price=2.5),
-            Product(name="Kale", description="Organic kale", price=3.0),
-            Product(name="Lettuce", description="Crispy lettuce", price=2.0),
-            Product(name="Cucumber", description="Fresh cucumber", price=1.5),
-            Product(name="Bell Pepper", description="Colorful peppers", price=4.5),
-            Product(name="Broccoli", description="Fresh broccoli", price=3.5),
-            Product(name="Cauliflower", description="White cauliflower", price=3.0),
-        ]
-        for product in products:
-            db.session.add(product)
-        db.session.commit()
+    click.echo("✓ Database tables created")
+
+@app.cli.command('seed')
+def seed_command():
+    """Add the sample products to an empty database in one INSERT."""
+    if db.session.query(Product.id).limit(1).first() is not None:
+        click.echo("Products already exist in database")
+        return
+    rows = [{k: v for k, v in product.items() if k != 'id'} for product in FALLBACK_PRODUCTS]
+    db.session.execute(insert(Product).values(rows))
+    db.session.commit()
+    click.echo(f"✓ Added {len(rows)} products")
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
@@ -11,4 +11,8 @@ npm install
 echo "Building React app..."
 npm run build
 
+echo "Precompressing React build..."
+cd ../server
+flask --app app compress-static
+
 echo "Build completed successfully!"
\ No newline at end of file
@@ -47,6 +47,42 @@ const OrdersList = () => {
       });
   }, [token, navigate]);
 
+  // Live status changes instead of re-polling /orders
+  useEffect(() => {
+    if (!token || typeof EventSource === "undefined") {
+      return undefined;
+    }
+    const source = new EventSource(
+      `${process.env.REACT_APP_API_URL}/orders/stream?jwt=${encodeURIComponent(token)}`
+    );
+    const applyChange = (event) => {
+      const change = JSON.parse(event.data);
+      setOrders((current) =>
+        current.map((order) =>
+          order.id === change.order_id
+            ? {
+                ...order,
+                ...(change.status && { status: change.status }),
+                ...(change.delivery_status && { delivery_status: change.delivery_status }),
+              }
+            : order
+        )
+      );
+    };
+    const resync = () => {
+      axios
+        .get(`${process.env.REACT_APP_API_URL}/orders`, {
+          headers: { Authorization: `Bearer ${token}` },
+        })
+        .then((response) => setOrders(response.data))
+        .catch((error) => console.error("Error refreshing orders:", error));
+    };
+    source.addEventListener("order", applyChange);
+    source.addEventListener("delivery", applyChange);
+    source.addEventListener("resync", resync);
+    return () => source.close();
+  }, [token]);
+
   const handleViewDetails = (orderId) => {
     navigate(`/order-details/${orderId}`);
   };
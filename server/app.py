@@ -1,68 +1,152 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory, send_file
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
+import hmac
+import json
+import logging
+import click
+from datetime import date, datetime, timedelta
+from flask import Flask, Blueprint, current_app, request, jsonify, send_file, Response
+from flask_migrate import Migrate, upgrade
+from flask_jwt_extended import JWTManager, create_access_token, decode_token
 from flask_cors import CORS
+from werkzeug.local import LocalProxy
+from werkzeug.middleware.proxy_fix import ProxyFix
+from catalog_cache import CatalogCache
+from catalog_query import (
+    CatalogQueryError, parse_product_query, parse_location, product_page, add_pagination_headers, encode_cursor,
+    decode_cursor,
+)
+from search_index import ProductSearchIndex
+from spatial_index import VendorLocationIndex, DeliveryZoneIndex
+from password_hashing import PasswordHasher, HasherBusy
+from cart_store import create_cart_store
+from db_engine import configure_app_engine, init_engine
+from order_events import event_bus, StreamsFull
+from jobs import Worker, queue_counts, requeue_dead
+from inventory import set_stock
+from request_metrics import request_metrics
+from static_files import StaticFiles, compress_tree
+from utils import FastJSONProvider, response_compressor
+from auth import auth, current_claims, current_user_id
+from rate_limit import create_bucket_store, rate_limiter
+from orders import (
+    OrderError, HISTORY_PAGE_SIZE, place_cart_order, order_history, checkout as checkout_orders, advance_delivery,
+    fill_missing_pickups,
+)
+from order_archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH, archive_orders, archived_history
+from sales_rollup import REBUILD_WINDOW, REPORT_MAX_DAYS, rebuild_sales, sales_report
+import logging_config
+import seed_data
+from models import db, User, Product, Cart, RateLimitBucket, RevokedToken, Delivery, Rider, DeliveryZone, ACTIVE_DELIVERY_STATUSES
 
-app = Flask(__name__, static_folder='../client/build', static_url_path='')
-CORS(app, origins=["*"], supports_credentials=True)
-
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///mama_mboga.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
-app.config['JWT_SECRET_KEY'] = os.environ.get('SECRET_KEY', 'jwt-secret-string')
-
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
-
-# In-memory storage (for demo purposes)
-user_carts = {}
-user_orders = {}
-
-# Models
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(50), nullable=False)
-
-class Product(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.String(200), nullable=True)
-    price = db.Column(db.Float, nullable=False)
-    vendor_id = db.Column(db.Integer, nullable=False, default=1)
-
-# Serve React App
-@app.route('/')
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+migrate = Migrate()
+password_hasher = PasswordHasher()
+jwt = JWTManager()
+# cli_group=None puts the blueprint's commands at the top level: flask seed
+bp = Blueprint('main', __name__, cli_group=None)
+log = logging.getLogger(__name__)
+
+# Riders are dispatched to only while available
+RIDER_STATUSES = ('available', 'offline')
+
+# The store configured for the current app, see create_app()
+cart_store = LocalProxy(lambda: current_app.extensions['cart_store'])
+
+# Serve React App: from the index built in create_app(), see static_files.py
+static_files = LocalProxy(lambda: current_app.extensions['static_files'])
+
+@bp.route('/')
 def serve_react_app():
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_files.serve(request, 'index.html')
 
-@app.route('/<path:path>')
+@bp.route('/<path:path>')
 def serve_static_files(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    return static_files.serve(request, path)
 
 # API Routes
-@app.route('/api')
+@bp.route('/api')
 def api_home():
     return jsonify({"message": "Mama Mboga Delivery App API is running!", "status": "success"})
 
-@app.route('/api/products')
+@bp.route('/api/metrics/db-pool')
+def db_pool_metrics():
+    """Connection pool checkout waits and occupancy for this worker"""
+    return jsonify(current_app.extensions['pool_metrics'].snapshot())
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Request timings and connection pool statistics for this worker, for Prometheus"""
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({"message": "Unauthorized"}), 401
+    body = current_app.extensions['request_metrics'].render(current_app.extensions['pool_metrics'].snapshot())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+def serialize_product(p):
+    return {
+        "id": p.id,
+        "name": p.name,
+        "description": p.description,
+        "price": p.price
+    }
+
+def nearby_vendor_ids(near):
+    """Ids of the vendors within `near` = (latitude, longitude, radius_km)"""
+    vendor_index.ensure_built()
+    lat, lon, radius_km = near
+    return [vendor_id for vendor_id, _ in vendor_index.within(lat, lon, radius_km, limit=NEARBY_VENDOR_LIMIT)]
+
+def load_catalog(params):
+    near = params[-1]
+    vendor_ids = nearby_vendor_ids(near) if near else None
+    products, next_cursor = product_page(Product, params, vendor_ids=vendor_ids)
+    return [serialize_product(p) for p in products], {"next_cursor": next_cursor}
+
+def load_search_documents():
+    rows = db.session.query(Product.id, Product.name, Product.description, Product.price)
+    return [serialize_product(row) for row in rows]
+
+# TTL and refresh interval are set from the app config in create_app()
+catalog_cache = CatalogCache(load_catalog).watch(Product)
+search_index = ProductSearchIndex(load_search_documents).watch(Product, serialize_product)
+
+def load_vendor_locations():
+    return db.session.query(User.id, User.latitude, User.longitude).filter(
+        User.role == 'vendor', User.latitude.isnot(None), User.longitude.isnot(None)
+    ).all()
+
+def load_delivery_zones():
+    return [
+        {'id': zone.id, 'name': zone.name, 'polygon': json.loads(zone.polygon)}
+        for zone in DeliveryZone.query.filter_by(active=True)
+    ]
+
+# Most vendors a near= product listing filters on, closest first
+NEARBY_VENDOR_LIMIT = 200
+# Refresh intervals are set from the app config in create_app()
+vendor_index = VendorLocationIndex(load_vendor_locations).watch(User)
+delivery_zones = DeliveryZoneIndex(load_delivery_zones).watch(DeliveryZone)
+
+def catalog_response(entry):
+    """Serve a catalog snapshot, answering If-None-Match with 304"""
+    # Weak comparison: the compressed copy carries the ETag as W/"..."
+    if request.if_none_match.contains_weak(entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return add_pagination_headers(response, entry.meta['next_cursor'])
+
+@bp.route('/api/products')
 def get_products():
     try:
-        products = Product.query.all()
-        return jsonify([{
-            "id": p.id,
-            "name": p.name,
-            "description": p.description,
-            "price": p.price
-        } for p in products])
+        params = parse_product_query(request.args)
+    except CatalogQueryError as e:
+        return jsonify({"message": str(e)}), 400
+    try:
+        return catalog_response(catalog_cache.get(params))
     except:
         return jsonify([
             {"id": 1, "name": "Tomato", "description": "Fresh red tomatoes", "price": 3.5},
@@ -72,11 +156,126 @@ def get_products():
             {"id": 5, "name": "Carrot", "description": "Organic carrots", "price": 3.0}
         ])
 
-@app.route('/api/register', methods=['POST'])
+@bp.route('/api/products/search')
+def search_products():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"message": "Search query is required"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({"message": "Invalid limit"}), 400
+    try:
+        search_index.ensure_built()
+        return jsonify(search_index.search(query, limit=limit)), 200
+    except Exception as e:
+        log.exception("Search failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/vendors/nearby')
+def nearby_vendors():
+    try:
+        lat, lon = parse_location(request.args.get('near', ''))
+    except CatalogQueryError as e:
+        return jsonify({"message": str(e)}), 400
+    try:
+        k = min(max(int(request.args.get('limit', 10)), 1), 100)
+    except ValueError:
+        return jsonify({"message": "Invalid limit"}), 400
+    try:
+        vendor_index.ensure_built()
+        return jsonify([
+            {"vendor_id": vendor_id, "distance_km": round(distance, 3)}
+            for vendor_id, distance in vendor_index.nearest(lat, lon, k=k)
+        ]), 200
+    except Exception as e:
+        log.exception("Nearby vendors lookup failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/zones/locate')
+def locate_zone():
+    try:
+        lat, lon = parse_location(request.args.get('at', ''))
+    except CatalogQueryError as e:
+        return jsonify({"message": str(e)}), 400
+    delivery_zones.ensure_built()
+    zone = delivery_zones.locate(lat, lon)
+    return jsonify({"zone": {"id": zone['id'], "name": zone['name']} if zone else None,
+                    "deliverable": zone is not None or not len(delivery_zones)}), 200
+
+@bp.route('/api/me/location', methods=['PUT'])
+@auth.required()
+def update_location():
+    try:
+        user_id = current_user_id()
+        data = request.get_json() or {}
+        try:
+            lat, lon = parse_location(f"{data['latitude']},{data['longitude']}")
+        except (KeyError, CatalogQueryError):
+            return jsonify({"message": "latitude and longitude are required"}), 400
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({"message": "User not found"}), 404
+        # A vendor's move reaches this worker's vendor index on commit
+        user.latitude, user.longitude = lat, lon
+        if user.role == 'vendor':
+            fill_missing_pickups(user.id, lat, lon)
+        db.session.commit()
+        return jsonify({"message": "Location updated"}), 200
+    except Exception as e:
+        log.exception("Update location failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/products/<int:product_id>/stock', methods=['PUT'])
+@auth.roles('vendor', message="Only vendors can manage stock")
+def update_stock(product_id):
+    try:
+        data = request.get_json() or {}
+        if 'add' in data:
+            value, field = data['add'], 'add'
+            valid = isinstance(value, int) and not isinstance(value, bool) and value > 0
+        elif 'stock' in data:
+            value, field = data['stock'], 'stock'
+            valid = value is None or (isinstance(value, int) and not isinstance(value, bool) and value >= 0)
+        else:
+            return jsonify({"message": "stock or add is required"}), 400
+        if not valid:
+            return jsonify({"message": f"{field} must be a non-negative whole number"}), 400
+        stock = set_stock(db.session, product_id, current_user_id(), **{field: value})
+        if stock is False:
+            db.session.rollback()
+            return jsonify({"message": "Product not found"}), 404
+        db.session.commit()
+        return jsonify({"product_id": product_id, "stock": stock}), 200
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Update stock failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/vendor/sales', methods=['GET'])
+@auth.roles('vendor', message="Only vendors can view sales")
+def vendor_sales():
+    try:
+        try:
+            until = date.fromisoformat(request.args['to']) if 'to' in request.args else datetime.utcnow().date()
+            since = date.fromisoformat(request.args['from']) if 'from' in request.args else until - timedelta(days=29)
+            product_id = int(request.args['product_id']) if 'product_id' in request.args else None
+        except ValueError:
+            return jsonify({"message": "from and to must be dates (YYYY-MM-DD) and product_id a number"}), 400
+        if since > until:
+            return jsonify({"message": "from must not be after to"}), 400
+        if (until - since).days >= REPORT_MAX_DAYS:
+            return jsonify({"message": f"At most {REPORT_MAX_DAYS} days at a time"}), 400
+        # Reads the daily rollups only, never the order table
+        return jsonify(sales_report(db.session, current_user_id(), since, until, product_id=product_id)), 200
+    except Exception as e:
+        log.exception("Vendor sales failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/register', methods=['POST'])
 def register():
     try:
         data = request.get_json()
-        print(f"Registration data received: {data}")  # Debug log
         
         if not data:
             return jsonify({"message": "No data provided"}), 400
@@ -101,21 +300,24 @@ def register():
         if len(data['password']) < 6:
             return jsonify({"message": "Password must be at least 6 characters"}), 400
         
-        # Only allow customer role for now
+        # Riders see customers' drop-off points, so they are onboarded with
+        # `flask add-rider` rather than signing themselves up
         if data['role'] not in ['customer', 'vendor']:
             return jsonify({"message": "Invalid role"}), 400
         
-        hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        hashed_password = password_hasher.hash(data['password'])
         new_user = User(email=data['email'], password=hashed_password, role=data['role'])
         db.session.add(new_user)
         db.session.commit()
-        print(f"User created successfully: {data['email']}")  # Debug log
+        log.info("User registered", extra={'user_id': new_user.id, 'role': new_user.role})
         return jsonify({"message": "User created successfully"}), 201
+    except HasherBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503, {'Retry-After': '1'}
     except Exception as e:
-        print(f"Registration error: {str(e)}")  # Debug log
+        log.exception("Registration failed")
         return jsonify({"message": f"Registration failed: {str(e)}"}), 500
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -123,7 +325,14 @@ def login():
             return jsonify({"message": "Missing email or password"}), 400
         
         user = User.query.filter_by(email=data['email']).first()
-        if user and bcrypt.check_password_hash(user.password, data['password']):
+        if user and password_hasher.check(user.password, data['password']):
+            # Upgrade hashes made with an outdated cost while we have the password
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(data['password'])
+                    db.session.commit()
+                except HasherBusy:
+                    pass
             token = create_access_token(
                 identity=str(user.id),
                 additional_claims={'email': user.email, 'role': user.role}
@@ -131,40 +340,55 @@ def login():
             return jsonify({'token': token}), 200
         
         return jsonify({"message": "Invalid credentials"}), 401
+    except HasherBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/logout', methods=['POST'])
+@auth.required()
+def logout():
+    try:
+        auth.revoke_token(db.session, current_claims())
+        db.session.commit()
+        return jsonify({"message": "Logged out"}), 200
     except Exception as e:
+        db.session.rollback()
+        log.exception("Logout failed")
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
-@app.route('/api/cart', methods=['GET'])
-@jwt_required()
+@bp.route('/api/cart', methods=['GET'])
+@auth.required()
 def get_cart():
     try:
-        user_id = get_jwt_identity()
-        cart_items = user_carts.get(user_id, [])
+        user_id = current_user_id()
+        cart_items = cart_store.items(user_id)
         
         # Convert cart items to the format expected by frontend
+        products = Product.query.filter(Product.id.in_(list(cart_items))).all() if cart_items else []
+        products_by_id = {product.id: product for product in products}
         formatted_cart = []
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
+        for product_id, quantity in cart_items.items():
+            product = products_by_id.get(product_id)
             if product:
                 formatted_cart.append({
                     'product_id': product.id,
                     'product_name': product.name,
                     'price': product.price,
-                    'quantity': item['quantity']
+                    'quantity': quantity
                 })
         
         return jsonify(formatted_cart), 200
     except Exception as e:
-        print(f"Cart GET error: {str(e)}")
+        log.exception("Cart fetch failed")
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
-@app.route('/api/cart', methods=['POST'])
-@jwt_required()
+@bp.route('/api/cart', methods=['POST'])
+@auth.required()
 def add_to_cart():
     try:
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
         data = request.get_json()
-        print(f"Add to cart data: {data}")
         
         if not data or 'product_id' not in data:
             return jsonify({"message": "Product ID is required"}), 400
@@ -177,124 +401,577 @@ def add_to_cart():
         if not product:
             return jsonify({"message": "Product not found"}), 404
         
-        # Initialize user cart if it doesn't exist
-        if user_id not in user_carts:
-            user_carts[user_id] = []
-        
-        # Check if product already in cart
-        existing_item = None
-        for item in user_carts[user_id]:
-            if item['product_id'] == product_id:
-                existing_item = item
-                break
-        
-        if existing_item:
-            existing_item['quantity'] += quantity
-        else:
-            user_carts[user_id].append({
-                'product_id': product_id,
-                'quantity': quantity
-            })
-        
-        print(f"Cart updated for user {user_id}: {user_carts[user_id]}")
+        quantity = cart_store.add(user_id, product_id, quantity)
+        log.debug("Cart updated", extra={'user_id': user_id, 'product_id': product_id, 'quantity': quantity})
         return jsonify({"message": "Product added to cart"}), 201
     except Exception as e:
-        print(f"Add to cart error: {str(e)}")
+        log.exception("Add to cart failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/cart/<int:product_id>', methods=['DELETE'])
+@auth.required()
+def remove_from_cart(product_id):
+    try:
+        user_id = current_user_id()
+        if not cart_store.remove(user_id, product_id):
+            return jsonify({"message": "Product not in cart"}), 404
+        return jsonify({"message": "Product removed from cart"}), 200
+    except Exception as e:
+        log.exception("Remove from cart failed")
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
-@app.route('/api/order', methods=['POST'])
-@jwt_required()
+@bp.route('/api/order', methods=['POST'])
+@auth.roles('customer', message="Only customers can place orders")
 def place_order():
     try:
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
         data = request.get_json()
-        print(f"Place order data: {data}")
-        
         if not data or 'cart_items' not in data:
             return jsonify({"message": "Cart items are required"}), 400
-        
-        cart_items = data['cart_items']
-        if not cart_items:
-            return jsonify({"message": "Cart is empty"}), 400
-        
-        # Initialize user orders if not exists
-        if user_id not in user_orders:
-            user_orders[user_id] = []
-        
-        # Create order ID
-        order_id = len(user_orders[user_id]) + 1
-        
-        # Process each cart item
-        order_items = []
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
-            if product:
-                order_items.append({
-                    'id': order_id,
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'quantity': item['quantity'],
-                    'price': product.price,
-                    'status': 'processing',
-                    'delivery_status': 'pending'
-                })
-        
-        # Add to user orders
-        user_orders[user_id].extend(order_items)
-        
-        # Clear user cart after placing order
-        if user_id in user_carts:
-            user_carts[user_id] = []
-        
-        print(f"Order placed for user {user_id}: {len(order_items)} items")
-        return jsonify({"message": "Order placed successfully"}), 201
+
+        # One transaction for the whole basket, with stock reserved and the
+        # response stored under the Idempotency-Key, see orders.py
+        body, status_code = place_cart_order(
+            user_id, data['cart_items'], idempotency_key=request.headers.get('Idempotency-Key'),
+            zones=delivery_zones, reservation_ttl=current_app.config['STOCK_RESERVATION_TTL'],
+        )
+        cart_store.clear(user_id)
+        log.info("Order placed", extra={'user_id': user_id, 'orders': len(body['order_ids'])})
+        return jsonify(body), status_code
+    except OrderError as e:
+        return jsonify({"message": e.message}), e.status_code
     except Exception as e:
-        print(f"Place order error: {str(e)}")
+        db.session.rollback()
+        log.exception("Place order failed")
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
-@app.route('/api/orders', methods=['GET'])
-@jwt_required():
+@bp.route('/api/orders', methods=['GET'])
+@auth.roles('customer', message="Only customers have orders")
+def get_orders():
     try:
-        user_id = get_jwt_identity()
-        orders = user_orders.get(user_id, [])
-        print(f"Fetching orders for user {user_id}: {len(orders)} orders")
-        return jsonify(orders), 200
+        user_id = current_user_id()
+        try:
+            limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), 200)
+            before = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except (ValueError, CatalogQueryError):
+            return jsonify({"message": "Invalid limit or cursor"}), 400
+        # Recent orders come from the order table; older ones only when asked for
+        history = archived_history if request.args.get('archived') in ('1', 'true') else order_history
+        orders, next_id = history(user_id, limit=limit, before=before)
+        log.debug("Orders fetched", extra={'user_id': user_id, 'orders': len(orders)})
+        return add_pagination_headers(jsonify(orders), encode_cursor(next_id) if next_id else None), 200
     except Exception as e:
-        print(f"Get orders error: {str(e)}")
+        log.exception("Get orders failed")
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
-# Initialize database
-try:
-    with app.app_context():
-        db.create_all()
-        
-        if not User.query.filter_by(role='vendor').first():
-            vendor = User(
-                email='vendor@example.com', 
-                password=bcrypt.generate_password_hash('password123').decode('utf-8'), 
-                role='vendor'
-            )
-            db.session.add(vendor)
-            db.session.commit()
-            print("✓ Default vendor created")
-        
-        if Product.query.count() == 0:
-            products = [
-                Product(name="Tomato", description="Fresh red tomatoes", price=3.5, vendor_id=1),
-                Product(name="Cabbage", description="Green cabbage", price=2.0, vendor_id=1),
-                Product(name="Onion", description="White onions", price=1.5, vendor_id=1),
-                Product(name="Potato", description="Fresh potatoes", price=4.0, vendor_id=1),
-                Product(name="Carrot", description="Organic carrots", price=3.0, vendor_id=1),
-            ]
-            for product in products:
-                db.session.add(product)
-            db.session.commit()
-            print(f"✓ Added {len(products)} products")
-        
-        print("✓ Database initialized successfully")
-except Exception as e:
-    print(f"✗ Database error: {e}")
+@bp.route('/api/checkout', methods=['POST'])
+@auth.roles('customer', message="Only customers can check out")
+def checkout():
+    try:
+        queued = checkout_orders(current_user_id())
+        return jsonify({"message": "Checkout accepted. Delivery will start shortly.", "orders": queued}), 202
+    except OrderError as e:
+        return jsonify({"message": e.message}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Checkout failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@bp.route('/api/orders/stream')
+@auth.required(locations=('headers', 'query_string'))
+def order_stream():
+    """Server-sent events for the customer's order and delivery status changes.
+
+    EventSource cannot set headers, so the token may also come as ?jwt=.
+    The generator never touches the database: while idle it only waits on
+    its subscription and sends a comment every ORDER_STREAM_HEARTBEAT
+    seconds to keep proxies from closing the connection. Each stream holds a
+    worker thread, so past ORDER_STREAM_MAX per worker it answers 503.
+    """
+    user_id = current_user_id()
+    heartbeat = current_app.config['ORDER_STREAM_HEARTBEAT']
+    try:
+        subscription = event_bus.subscribe(user_id)
+    except StreamsFull:
+        return jsonify({"message": "Too many open streams, please try again later"}), 503, {'Retry-After': '30'}
+
+    def generate():
+        # Reconnect after 5s; a client that reconnects refetches /orders
+        yield "retry: 5000\n\n"
+        while True:
+            events, overflowed = subscription.wait(heartbeat)
+            if overflowed:
+                yield sse('resync', {})
+            for payload in events:
+                yield sse(payload['type'], {k: v for k, v in payload.items() if k != 'customer_id'})
+            if not events and not overflowed:
+                yield ": keep-alive\n\n"
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Stop nginx-style proxies from buffering the stream
+        'X-Accel-Buffering': 'no',
+    })
+    # Frees the stream's slot even if the client left before the first event
+    response.call_on_close(lambda: event_bus.unsubscribe(subscription))
+    return response
+
+def serialize_route(deliveries):
+    """A rider's stops in route order; unplanned deliveries come last"""
+    unplanned = len(deliveries) * 2
+    stops = {}
+    for d in deliveries:
+        if d.delivery_status == 'assigned' and d.pickup_latitude is not None:
+            index = d.pickup_stop if d.pickup_stop is not None else unplanned
+            stop = stops.setdefault(('pickup', index, d.pickup_latitude, d.pickup_longitude), {
+                'type': 'pickup', 'latitude': d.pickup_latitude, 'longitude': d.pickup_longitude,
+                'delivery_ids': [],
+            })
+            stop['delivery_ids'].append(d.id)
+        index = d.dropoff_stop if d.dropoff_stop is not None else unplanned + 1
+        stops[('dropoff', index, d.id)] = {
+            'type': 'dropoff', 'latitude': d.dropoff_latitude, 'longitude': d.dropoff_longitude,
+            'delivery_ids': [d.id],
+        }
+    return [stops[key] for key in sorted(stops, key=lambda key: (key[1], key[0] == 'dropoff'))]
+
+@bp.route('/api/rider/location', methods=['PUT'])
+@auth.roles('rider', message="Only riders report a location")
+def update_rider_location():
+    try:
+        data = request.get_json() or {}
+        try:
+            lat, lon = parse_location(f"{data['latitude']},{data['longitude']}")
+        except (KeyError, CatalogQueryError):
+            return jsonify({"message": "latitude and longitude are required"}), 400
+        rider_id = db.session.query(Rider.id).filter_by(user_id=current_user_id()).scalar()
+        if rider_id is None:
+            return jsonify({"message": "Rider not found"}), 404
+        # Imported here so web workers load numpy only once a rider reports in
+        from dispatch import record_rider_location
+        record_rider_location(rider_id, lat, lon)
+        return jsonify({"message": "Location updated"}), 200
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Rider location failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/rider/status', methods=['PUT'])
+@auth.roles('rider', message="Only riders set a rider status")
+def update_rider_status():
+    try:
+        data = request.get_json() or {}
+        status = data.get('status')
+        if status not in RIDER_STATUSES:
+            return jsonify({"message": f"status must be one of: {', '.join(RIDER_STATUSES)}"}), 400
+        rider = Rider.query.filter_by(user_id=current_user_id()).first()
+        if not rider:
+            return jsonify({"message": "Rider not found"}), 404
+        if status == 'available' and rider.latitude is None:
+            return jsonify({"message": "Report a location before going available"}), 409
+        rider.status = status
+        db.session.commit()
+        return jsonify({"rider_id": rider.id, "status": rider.status}), 200
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Rider status failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/rider/route', methods=['GET'])
+@auth.roles('rider', message="Only riders have a route")
+def get_rider_route():
+    try:
+        user_id = current_user_id()
+        rider = Rider.query.filter_by(user_id=user_id).first()
+        if not rider:
+            return jsonify({"message": "Rider not found"}), 404
+        deliveries = (
+            Delivery.query
+            .filter(Delivery.rider_id == rider.id, Delivery.delivery_status.in_(ACTIVE_DELIVERY_STATUSES))
+            .order_by(Delivery.id)
+            .all()
+        )
+        return jsonify({'rider_id': rider.id, 'stops': serialize_route(deliveries)}), 200
+    except Exception as e:
+        log.exception("Rider route failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.route('/api/rider/deliveries/<int:delivery_id>/pickup', methods=['POST'])
+@auth.roles('rider', message="Only riders update deliveries")
+def pick_up_delivery(delivery_id):
+    return _advance_delivery(delivery_id, 'in transit')
+
+@bp.route('/api/rider/deliveries/<int:delivery_id>/delivered', methods=['POST'])
+@auth.roles('rider', message="Only riders update deliveries")
+def complete_delivery(delivery_id):
+    return _advance_delivery(delivery_id, 'delivered')
+
+def _advance_delivery(delivery_id, status):
+    try:
+        rider_id = db.session.query(Rider.id).filter_by(user_id=current_user_id()).scalar()
+        if rider_id is None:
+            return jsonify({"message": "Rider not found"}), 404
+        order_id = advance_delivery(rider_id, delivery_id, status)
+        return jsonify({"delivery_id": delivery_id, "order_id": order_id, "delivery_status": status}), 200
+    except OrderError as e:
+        return jsonify({"message": e.message}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Delivery update failed")
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema to the latest migration."""
+    upgrade(directory=MIGRATIONS_DIR)
+    click.echo("✓ Database schema is up to date")
+
+@bp.cli.command('seed')
+def seed_command():
+    """Add the default vendor and sample products to an empty database."""
+    vendor_created, products_added = seed_data.seed(db, User, Product, password_hasher.rounds)
+    if vendor_created:
+        click.echo("✓ Default vendor created")
+    click.echo(f"✓ Added {products_added} products" if products_added else "Products already exist in database")
+
+@bp.cli.command('add-zone')
+@click.argument('name')
+@click.argument('polygon')
+def add_zone_command(name, polygon):
+    """Add or replace a delivery zone; POLYGON is a JSON list of [lat, lon]."""
+    try:
+        vertices = [[float(lat), float(lon)] for lat, lon in json.loads(polygon)]
+    except (ValueError, TypeError):
+        raise click.BadParameter("expected a JSON list of [latitude, longitude] pairs", param_hint='POLYGON')
+    if len(vertices) < 3:
+        raise click.BadParameter("a zone needs at least three vertices", param_hint='POLYGON')
+    zone = DeliveryZone.query.filter_by(name=name).first() or DeliveryZone(name=name)
+    zone.polygon, zone.active = json.dumps(vertices), True
+    db.session.add(zone)
+    db.session.commit()
+    click.echo(f"✓ Delivery zone {name} saved ({len(vertices)} vertices)")
+
+@bp.cli.command('dispatch')
+@click.option('--once', is_flag=True, help='Assign a single batch and exit.')
+def dispatch_command(once):
+    """Assign pending deliveries to riders every DISPATCH_INTERVAL seconds."""
+    # Imported here so web workers never load NumPy
+    from dispatch import Dispatcher
+    from routing import RoutePlanner
+
+    def report(result):
+        click.echo(
+            f"Assigned {result.assigned} of {result.pending} pending deliveries to "
+            f"{result.riders} riders ({result.method}, {result.elapsed_ms:.0f} ms), "
+            f"re-planned {result.routed} routes"
+        )
+
+    planner = RoutePlanner(time_budget_ms=current_app.config['ROUTE_TIME_BUDGET_MS'])
+    dispatcher = Dispatcher.from_config(current_app.config, planner=planner)
+    if once:
+        report(dispatcher.tick())
+    else:
+        dispatcher.run(current_app.config['DISPATCH_INTERVAL'], on_tick=report)
+
+@bp.cli.command('add-rider')
+@click.argument('email')
+@click.option('--capacity', type=int, help='Deliveries the rider can carry at once (default 3).')
+def add_rider_command(email, capacity):
+    """Make the account EMAIL a rider, or change a rider's capacity."""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f"No account with email {email}; they register first")
+    if user.role == 'vendor':
+        raise click.ClickException(f"{email} is a vendor account")
+    rider = Rider.query.filter_by(user_id=user.id).first()
+    if rider is None:
+        # Offline until the rider reports a position and goes available
+        rider = Rider(user=user)
+        db.session.add(rider)
+    if capacity is not None:
+        rider.capacity = capacity
+    user.role = 'rider'
+    db.session.commit()
+    click.echo(f"✓ {email} is a rider (id {rider.id}); they sign in again to get a rider token")
+
+@bp.cli.command('remove-rider')
+@click.argument('email')
+def remove_rider_command(email):
+    """Take the rider role from EMAIL and revoke their tokens."""
+    user = User.query.filter_by(email=email, role='rider').first()
+    if user is None:
+        raise click.ClickException(f"No rider with email {email}")
+    rider = Rider.query.filter_by(user_id=user.id).first()
+    user.role = 'customer'
+    in_transit = 0
+    if rider is not None:
+        rider.status = 'offline'
+        # Deliveries not yet collected go back to dispatch
+        db.session.query(Delivery).filter_by(rider_id=rider.id, delivery_status='assigned').update(
+            {'delivery_status': 'pending', 'rider_id': None, 'assigned_at': None,
+             'pickup_stop': None, 'dropoff_stop': None}, synchronize_session=False)
+        in_transit = Delivery.query.filter_by(rider_id=rider.id, delivery_status='in transit').count()
+    auth.revoke_user(db.session, user.id)
+    db.session.commit()
+    click.echo(f"✓ {email} is no longer a rider" + (
+        f"; {in_transit} deliveries they collected are still in transit" if in_transit else ""))
+
+@bp.cli.command('revoke-tokens')
+@click.option('--token', 'tokens', multiple=True, help='Revoke this token; repeat for several.')
+@click.option('--user', 'user_ids', multiple=True, type=int, help='Revoke every token issued to this user id so far.')
+def revoke_tokens_command(tokens, user_ids):
+    """Revoke leaked tokens or all tokens of compromised accounts."""
+    for token in tokens:
+        auth.revoke_token(db.session, decode_token(token, allow_expired=True))
+    for user_id in user_ids:
+        auth.revoke_user(db.session, user_id)
+    db.session.commit()
+    click.echo(f"✓ Revoked {len(tokens)} tokens and the tokens of {len(user_ids)} users; "
+               f"other workers apply it within AUTH_REVOCATION_REFRESH seconds")
+
+@bp.cli.command('archive-orders')
+@click.option('--days', type=float, help='Archive finished orders older than this (default: ORDER_ARCHIVE_DAYS).')
+@click.option('--batch-size', default=ARCHIVE_BATCH, show_default=True, help='Orders moved per transaction.')
+def archive_orders_command(days, batch_size):
+    """Move finished orders out of the order table into the order archive."""
+    days = current_app.config['ORDER_ARCHIVE_DAYS'] if days is None else days
+    archived = archive_orders(datetime.utcnow() - timedelta(days=days), batch_size=batch_size)
+    click.echo(f"✓ Archived {archived} orders placed more than {days:g} days ago")
+
+@bp.cli.command('rebuild-sales')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to rebuild (default: all).')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Day to stop before (default: none).')
+@click.option('--window', default=REBUILD_WINDOW, show_default=True, help='Order ids aggregated per query.')
+def rebuild_sales_command(since, until, window):
+    """Recompute vendor sales rollups from the order table, e.g. to backfill them."""
+    read, written = rebuild_sales(
+        db.session, since=since.date() if since else None, until=until.date() if until else None, window=window,
+    )
+    db.session.commit()
+    click.echo(f"✓ Rebuilt {written} daily sales rows from {read} orders")
+
+@bp.cli.command('compress-static')
+@click.option('--min-size', default=1024, show_default=True, help='Smallest file worth compressing, in bytes.')
+def compress_static_command(min_size):
+    """Write .gz and .br copies of the React build for static_files to serve."""
+    files, size_in, size_out = compress_tree(current_app.config['STATIC_ROOT'], min_size=min_size)
+    click.echo(f"✓ Compressed {files} files: {size_in:,} → {size_out:,} bytes")
+
+@bp.cli.group('jobs')
+def jobs_group():
+    """Run and inspect background jobs."""
+
+@jobs_group.command('work')
+@click.option('--once', is_flag=True, help='Run a single batch and exit.')
+@click.option('--queue', 'queues', multiple=True, default=('default',), show_default=True,
+              help='Queue to take jobs from; repeat for several.')
+def jobs_work_command(once, queues):
+    """Run queued jobs, polling every JOBS_POLL_INTERVAL seconds."""
+    import orders  # noqa: F401  registers the order tasks
+
+    def report(outcomes):
+        click.echo(f"Ran {len(outcomes)} jobs: " + ', '.join(
+            f"{outcomes.count(status)} {status}" for status in sorted(set(outcomes))
+        ))
+
+    worker = Worker.from_config(current_app.config, queues=queues)
+    if once:
+        report(worker.work())
+    else:
+        worker.run(on_batch=report)
+
+@jobs_group.command('status')
+def jobs_status_command():
+    """Show how many jobs are in each state."""
+    counts = queue_counts()
+    for status in ('queued', 'running', 'done', 'dead'):
+        click.echo(f"{status:<8} {counts.get(status, 0)}")
+
+@jobs_group.command('retry')
+@click.argument('job_ids', nargs=-1, type=int)
+def jobs_retry_command(job_ids):
+    """Requeue dead jobs; all of them unless JOB_IDS are given."""
+    click.echo(f"✓ Requeued {requeue_dead(job_ids)} dead jobs")
+
+def create_app(config=None):
+    """Build the application without touching the database.
+
+    The engine connects, the search index loads and the password hashing pool
+    starts on first use, so importing this module and forking gunicorn workers
+    stays cheap. The schema comes from `flask db upgrade` (or `flask init-db`)
+    and sample data from `flask seed`, both run once per deploy.
+    """
+    # The React build is served by static_files rather than Flask's static
+    # route, which would shadow the client-side routes with 404s
+    app = Flask(__name__, static_folder=None)
+    # jsonify() encodes with orjson when it is installed
+    app.json = FastJSONProvider(app)
+    CORS(app, origins=["*"], supports_credentials=True)
+
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///mama_mboga.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+    app.config['JWT_SECRET_KEY'] = os.environ.get('SECRET_KEY', 'jwt-secret-string')
+    # Seconds a cached catalog snapshot is trusted before re-reading it; bounds how
+    # long other gunicorn workers can serve a catalog changed by this one.
+    app.config['CATALOG_CACHE_TTL'] = float(os.environ.get('CATALOG_CACHE_TTL', 30))
+    # Seconds between background rebuilds of the search index, for the same reason
+    app.config['SEARCH_INDEX_REFRESH'] = float(os.environ.get('SEARCH_INDEX_REFRESH', 300))
+    # Seconds between full rebuilds of the vendor location and delivery zone
+    # indexes, which pick up vendors moved and zones edited through other workers
+    app.config['SPATIAL_INDEX_REFRESH'] = float(os.environ.get('SPATIAL_INDEX_REFRESH', 60))
+    # Password hashing: bcrypt cost, or a target milliseconds per hash to calibrate
+    # the cost against at startup, and the bounds of the hashing process pool
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['BCRYPT_TARGET_MS'] = float(os.environ.get('BCRYPT_TARGET_MS', 0))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    # Cart backend: sql (app database), file (SQLite file shared by the workers on
+    # one host, at CART_STORE_PATH) or memory (per process, development only)
+    app.config['CART_BACKEND'] = os.environ.get('CART_BACKEND', 'sql')
+    app.config['CART_STORE_PATH'] = os.environ.get('CART_STORE_PATH', os.path.join(app.instance_path, 'carts.db'))
+    # Delivery dispatch: seconds between batches, deliveries per batch, furthest
+    # rider-to-pickup distance and assignment method (auto, greedy, hungarian)
+    app.config['DISPATCH_INTERVAL'] = float(os.environ.get('DISPATCH_INTERVAL', 10))
+    app.config['DISPATCH_BATCH_SIZE'] = int(os.environ.get('DISPATCH_BATCH_SIZE', 10000))
+    app.config['DISPATCH_MAX_DISTANCE_KM'] = float(os.environ.get('DISPATCH_MAX_DISTANCE_KM', 15))
+    app.config['DISPATCH_METHOD'] = os.environ.get('DISPATCH_METHOD', 'auto')
+    # Order stream: seconds between keep-alive comments, open streams per worker
+    # (each holds one of its 100 threads; 0: no limit), and how events reach
+    # other workers: postgres (LISTEN/NOTIFY), local (this process only) or auto
+    app.config['ORDER_STREAM_HEARTBEAT'] = float(os.environ.get('ORDER_STREAM_HEARTBEAT', 25))
+    app.config['ORDER_STREAM_MAX'] = int(os.environ.get('ORDER_STREAM_MAX', 20))
+    app.config['ORDER_EVENTS_BACKEND'] = os.environ.get('ORDER_EVENTS_BACKEND', 'auto')
+    # Route planning after each batch: milliseconds one rider's route may take to
+    # solve and milliseconds all re-planning in one tick may take
+    app.config['ROUTE_TIME_BUDGET_MS'] = float(os.environ.get('ROUTE_TIME_BUDGET_MS', 50))
+    app.config['ROUTE_PLANNING_BUDGET_MS'] = float(os.environ.get('ROUTE_PLANNING_BUDGET_MS', 2000))
+    # Seconds an order holds the stock it reserved before it expires unpaid
+    app.config['STOCK_RESERVATION_TTL'] = float(os.environ.get('STOCK_RESERVATION_TTL', 1800))
+    # Days finished orders stay in the order table before archive-orders moves them
+    app.config['ORDER_ARCHIVE_DAYS'] = float(os.environ.get('ORDER_ARCHIVE_DAYS', ARCHIVE_AFTER_DAYS))
+    # Background jobs: seconds an idle worker waits between polls, jobs claimed
+    # at once, seconds before a running job counts as stalled and is retried,
+    # and seconds finished jobs are kept
+    app.config['JOBS_POLL_INTERVAL'] = float(os.environ.get('JOBS_POLL_INTERVAL', 1))
+    app.config['JOBS_BATCH_SIZE'] = int(os.environ.get('JOBS_BATCH_SIZE', 10))
+    app.config['JOBS_TIMEOUT'] = float(os.environ.get('JOBS_TIMEOUT', 300))
+    app.config['JOBS_KEEP_DONE'] = float(os.environ.get('JOBS_KEEP_DONE', 86400))
+    # Metrics: bearer token /metrics requires when set, and the sampling
+    # profiler, off unless PROFILE_SLOW_MS is set, which writes collapsed stacks
+    # of requests slower than that to PROFILE_DIR (default instance/profiles)
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+    app.config['PROFILE_SLOW_MS'] = float(os.environ.get('PROFILE_SLOW_MS', 0))
+    app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', '')
+    # Logging: JSON lines (or text) on stderr and optionally LOG_FILE, the root
+    # level, per-logger levels as "logger=LEVEL,...", and the fraction of
+    # records below INFO kept
+    app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json')
+    app.config['LOG_FILE'] = os.environ.get('LOG_FILE', '')
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['LOG_LEVELS'] = os.environ.get('LOG_LEVELS', '')
+    app.config['LOG_DEBUG_SAMPLE_RATE'] = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0))
+    # Auth: tokens whose decoded claims are cached, revocations the in-memory
+    # filter is sized for, and seconds between reloads of the revocation list,
+    # which bound how long other workers accept a token revoked through this one
+    app.config['AUTH_CLAIMS_CACHE_SIZE'] = int(os.environ.get('AUTH_CLAIMS_CACHE_SIZE', 10000))
+    app.config['AUTH_REVOCATION_CAPACITY'] = int(os.environ.get('AUTH_REVOCATION_CAPACITY', 100000))
+    app.config['AUTH_REVOCATION_REFRESH'] = float(os.environ.get('AUTH_REVOCATION_REFRESH', 30))
+    # Rate limiting: where token buckets live, memory (per process), file (SQLite
+    # file shared by the workers on one host, at RATE_LIMIT_STORE_PATH), sql
+    # (app database, shared by every host) or off; per-endpoint quotas as
+    # "endpoint=requests/seconds,..." over rate_limit.DEFAULT_LIMITS; and
+    # proxies in front of the app, whose X-Forwarded-For gives the client address
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    app.config['RATE_LIMIT_STORE_PATH'] = os.environ.get(
+        'RATE_LIMIT_STORE_PATH', os.path.join(app.instance_path, 'rate_limits.db'))
+    app.config['RATE_LIMITS'] = os.environ.get('RATE_LIMITS', '')
+    app.config['PROXY_HOPS'] = int(os.environ.get('PROXY_HOPS', 0))
+    # Load shedding: concurrent requests per worker before low-priority ones
+    # get 503 (0: no cap; below gunicorn's 100 threads), priorities as
+    # "endpoint=low|normal|critical,...", and, off unless set, a header the
+    # proxy overwrites with its arrival time on every request (never one a
+    # client could send) with the milliseconds of standing queue to shed at
+    app.config['LOAD_SHED_MAX_IN_FLIGHT'] = int(os.environ.get('LOAD_SHED_MAX_IN_FLIGHT', 80))
+    app.config['LOAD_SHED_QUEUE_HEADER'] = os.environ.get('LOAD_SHED_QUEUE_HEADER', '')
+    app.config['LOAD_SHED_QUEUE_MS'] = float(os.environ.get('LOAD_SHED_QUEUE_MS', 500))
+    app.config['LOAD_SHED_PRIORITIES'] = os.environ.get('LOAD_SHED_PRIORITIES', '')
+    # Response compression: smallest body worth compressing, in bytes, and how
+    # many compressed bodies of ETagged responses (the catalog) are kept
+    app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+    app.config['COMPRESS_CACHE_ENTRIES'] = int(os.environ.get('COMPRESS_CACHE_ENTRIES', 256))
+    # React build: directory indexed at startup, the largest file kept in memory
+    # and the memory all kept files may use, in bytes
+    app.config['STATIC_ROOT'] = os.environ.get('STATIC_ROOT', os.path.join(app.root_path, '..', 'client', 'build'))
+    app.config['STATIC_MEMORY_FILE_LIMIT'] = int(os.environ.get('STATIC_MEMORY_FILE_LIMIT', 64 * 1024))
+    app.config['STATIC_MEMORY_BUDGET'] = int(os.environ.get('STATIC_MEMORY_BUDGET', 32 * 1024 * 1024))
+    if config:
+        app.config.update(config)
+
+    # Records are written by a listener thread, never by the request itself
+    logging_config.init_app(app)
+
+    # Pool sizes, timeouts and SQLite pragmas per APP_ENV (development or
+    # production), each overridable with a DB_* variable; see db_engine.py
+    configure_app_engine(app)
+    db.init_app(app)
+    init_engine(app, db)
+    # Schema changes ship as migrations in migrations/versions and are applied at
+    # deploy time with `flask db upgrade`
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR)
+    password_hasher.init_app(app)
+    request_metrics.init_app(app, hasher=password_hasher)
+    # Registered after the metrics hook so it runs first and response sizes
+    # are measured compressed, as sent
+    response_compressor.init_app(app)
+    jwt.init_app(app)
+    auth.init_app(app, db=db, model=RevokedToken)
+    if app.config['PROXY_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'], x_proto=app.config['PROXY_HOPS'])
+    if app.config['RATE_LIMIT_BACKEND'] != 'off':
+        # Before any view runs, so a shed or throttled request costs no queries
+        rate_limiter.init_app(app, create_bucket_store(
+            app.config['RATE_LIMIT_BACKEND'], db=db, model=RateLimitBucket,
+            path=app.config['RATE_LIMIT_STORE_PATH'],
+        ), identify=auth.identify)
+    # The LISTEN connection opens with the first subscriber, not here
+    event_bus.init_app(app, lambda: db.engine)
+
+    catalog_cache.ttl = app.config['CATALOG_CACHE_TTL']
+    search_index.refresh_interval = app.config['SEARCH_INDEX_REFRESH']
+    vendor_index.refresh_interval = app.config['SPATIAL_INDEX_REFRESH']
+    delivery_zones.refresh_interval = app.config['SPATIAL_INDEX_REFRESH']
+    app.extensions['cart_store'] = create_cart_store(
+        app.config['CART_BACKEND'], db=db, model=Cart, path=app.config['CART_STORE_PATH']
+    )
+    # One walk of the build per process; a new build ships with a new deploy
+    app.extensions['static_files'] = StaticFiles(
+        app.config['STATIC_ROOT'],
+        memory_limit=app.config['STATIC_MEMORY_FILE_LIMIT'],
+        memory_budget=app.config['STATIC_MEMORY_BUDGET'],
+    ).load()
+
+    app.register_blueprint(bp)
+    return app
+
+_default_app = None
+
+def __getattr__(name):
+    # `app` is built on first access, so `gunicorn app:app`, `flask --app app`
+    # and `from app import app` keep working alongside create_app()
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    print("Starting Mama Mboga Flask server...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app = create_app()
+    log.info("Starting Mama Mboga Flask server")
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,305 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import (
+    InvalidHeaderError, JWTExtendedException, NoAuthorizationError, RevokedTokenError, WrongTokenError,
+)
+from jwt import PyJWTError
+from sqlalchemy import and_, delete, event, or_, select
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+# False-positive rate the revocation filter is sized for; a false positive
+# costs one indexed lookup, never a wrongly refused token
+REVOCATION_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """A set of strings that answers "maybe present" or "certainly absent".
+
+    `capacity` items fit at about `error_rate` false positives; the bits
+    live in one bytearray and each key sets `hashes` of them, derived from a
+    single BLAKE2b digest by double hashing.
+    """
+
+    def __init__(self, capacity, error_rate=REVOCATION_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """Revoked tokens: a table for the record, a Bloom filter for the hot path.
+
+    A token is revoked by its jti (logout) or, for a compromised account, by
+    user: every token of that user issued up to the revocation. Checking a
+    token asks the in-memory filter first, so the usual answer, not revoked,
+    needs no query; only the rare "maybe" is confirmed against the table.
+    The filter is rebuilt from the table every `refresh_interval` seconds in
+    the background, which is how revocations made by other workers arrive;
+    revocations made by this one apply at once. The table is `model` in
+    `db`, given by init_app(); without one nothing is ever revoked.
+    """
+
+    def __init__(self, capacity=100_000, refresh_interval=None, db=None, model=None):
+        self.capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.db = db
+        self.model = model
+        self._filter = None
+        self._rebuilding = False
+        self.built_at = None
+        self.confirmations = 0
+
+    def rebuild(self):
+        now, model = datetime.utcnow(), self.model
+        rows = self.db.session.execute(
+            select(model.jti, model.user_id)
+            .where(or_(model.expires_at.is_(None), model.expires_at > now))
+        ).all()
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)))
+        for jti, user_id in rows:
+            bloom.add(jti if jti is not None else f'user:{user_id}')
+        self._filter, self.built_at = bloom, time.monotonic()
+
+    def ensure_built(self):
+        if self._filter is None:
+            self.rebuild()
+        elif (self.refresh_interval is not None and not self._rebuilding
+              and time.monotonic() - self.built_at > self.refresh_interval):
+            self._rebuilding = True
+            threading.Thread(
+                target=self._background_rebuild, args=(current_app._get_current_object(),), daemon=True
+            ).start()
+
+    def _background_rebuild(self, app):
+        try:
+            with app.app_context():
+                self.rebuild()
+        except Exception:
+            log.exception("Revocation list refresh failed")
+        finally:
+            self._rebuilding = False
+
+    def is_revoked(self, claims):
+        if self.model is None:
+            return False
+        self.ensure_built()
+        jti, user_key = claims.get('jti'), f"user:{claims.get('sub')}"
+        if jti not in self._filter and user_key not in self._filter:
+            return False
+        self.confirmations += 1
+        model = self.model
+        conditions = [model.jti == jti]
+        if claims.get('iat') is not None and str(claims.get('sub')).isdigit():
+            conditions.append(and_(
+                model.jti.is_(None), model.user_id == int(claims['sub']),
+                model.revoked_at > datetime.utcfromtimestamp(claims['iat']),
+            ))
+        return self.db.session.execute(select(model.id).where(or_(*conditions)).limit(1)).first() is not None
+
+    def revoke(self, session, jti=None, user_id=None, expires_at=None):
+        """Record a revocation in `session` and clear out expired ones; applies here once committed"""
+        now, model = datetime.utcnow(), self.model
+        session.execute(delete(model).where(model.expires_at <= now))
+        if jti is not None and session.execute(select(model.id).where(model.jti == jti)).first():
+            return
+        # iat has whole-second resolution, so keep revoked_at to the second
+        # and treat a token issued in the same second as issued after it
+        revoked_at = now.replace(microsecond=0)
+        session.add(model(jti=jti, user_id=user_id, revoked_at=revoked_at, expires_at=expires_at))
+        session.info.setdefault('revoked_keys', []).append(jti if jti is not None else f'user:{user_id}')
+
+    def apply(self, keys):
+        if self._filter is not None:
+            for key in keys:
+                self._filter.add(key)
+
+
+class ClaimsCache:
+    """Decoded, verified claims by SHA-256 of the token, until the token expires.
+
+    Holds at most `max_entries` tokens, least recently used first out. Keys
+    are digests, so the cache never holds a usable token.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None:
+                self.misses += 1
+                return None
+            if claims.get('exp') is not None and claims['exp'] <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, key, claims):
+        with self._lock:
+            self._entries[key] = claims
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class Auth:
+    """The one place requests are authenticated.
+
+    `@auth.required()` and `@auth.roles('vendor', ...)` replace
+    `@jwt_required()` plus hand-written role checks. A token's signature and
+    expiry are checked once; the decoded claims are then reused from a
+    ClaimsCache, so a repeat request costs one hash and two filter lookups
+    instead of a signature verification and JSON parse. Missing, malformed,
+    expired and revoked tokens raise flask_jwt_extended's exceptions, so the
+    responses are those JWTManager has always given. Views read the caller
+    with current_user_id() and current_claims().
+    """
+
+    def __init__(self):
+        self.claims_cache = ClaimsCache()
+        self.revocations = RevocationList()
+
+    def init_app(self, app, db=None, model=None):
+        self.revocations.db, self.revocations.model = db, model
+        self.claims_cache.max_entries = app.config.get('AUTH_CLAIMS_CACHE_SIZE', 10_000)
+        self.revocations.capacity = app.config.get('AUTH_REVOCATION_CAPACITY', 100_000)
+        self.revocations.refresh_interval = app.config.get('AUTH_REVOCATION_REFRESH', 30.0)
+        app.extensions['auth'] = self
+
+    def watch(self):
+        """Add revocations to the local filter when the session that made them commits"""
+        def after_commit(session):
+            keys = session.info.pop('revoked_keys', None)
+            if keys:
+                self.revocations.apply(keys)
+
+        def after_rollback(session, previous_transaction):
+            session.info.pop('revoked_keys', None)
+
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_soft_rollback', after_rollback)
+        return self
+
+    # Verification
+
+    def _token(self, locations):
+        config = current_app.config
+        if 'headers' in locations:
+            header = request.headers.get(config['JWT_HEADER_NAME'], '')
+            if header:
+                scheme, _, token = header.partition(' ')
+                if scheme != config['JWT_HEADER_TYPE'] or not token:
+                    raise InvalidHeaderError(
+                        f"Bad {config['JWT_HEADER_NAME']} header. Expected value '{config['JWT_HEADER_TYPE']} <JWT>'")
+                return token
+        if 'query_string' in locations:
+            token = request.args.get(config['JWT_QUERY_STRING_NAME'])
+            if token:
+                return token
+        raise NoAuthorizationError(f"Missing {config['JWT_HEADER_NAME']} Header")
+
+    def verify(self, locations=('headers',)):
+        """The verified claims of the request's token, checked at most once per request"""
+        claims = g.get('auth_claims')
+        if claims is not None:
+            return claims
+        token = self._token(locations)
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self.claims_cache.get(key)
+        if claims is None:
+            claims = decode_token(token)
+            if claims.get('type') != 'access':
+                raise WrongTokenError("Only non-refresh tokens are allowed")
+            self.claims_cache.put(key, claims)
+        if self.revocations.is_revoked(claims):
+            raise RevokedTokenError({}, claims)
+        g.auth_claims = claims
+        return claims
+
+    def identify(self, locations=('headers',)):
+        """The user id of the request's token if it is valid, else None; never raises"""
+        try:
+            return int(self.verify(locations)['sub'])
+        except (JWTExtendedException, PyJWTError, KeyError, ValueError):
+            return None
+
+    def required(self, locations=('headers',)):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                self.verify(locations)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def roles(self, *roles, locations=('headers',), message="Unauthorized"):
+        """Allow only tokens whose role claim is one of `roles`; others get 403 `message`"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.verify(locations).get('role') not in roles:
+                    return jsonify({"message": message}), 403
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Revocation
+
+    def revoke_token(self, session, claims):
+        """Revoke the token `claims` came from (logout)"""
+        expires_at = datetime.utcfromtimestamp(claims['exp']) if claims.get('exp') else None
+        self.revocations.revoke(session, jti=claims['jti'], user_id=int(claims['sub']), expires_at=expires_at)
+
+    def revoke_user(self, session, user_id):
+        """Revoke every token issued to `user_id` so far"""
+        lifetime = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+        if isinstance(lifetime, int) and not isinstance(lifetime, bool):
+            lifetime = timedelta(seconds=lifetime)
+        # False means tokens never expire, so neither may the revocation
+        expires_at = datetime.utcnow() + lifetime if isinstance(lifetime, timedelta) else None
+        self.revocations.revoke(session, user_id=user_id, expires_at=expires_at)
+
+
+def current_claims():
+    return g.auth_claims
+
+
+def current_user_id():
+    return int(g.auth_claims['sub'])
+
+
+# One per process; sizes and refresh interval are set from the app config
+auth = Auth().watch()
@@ -0,0 +1,403 @@
+"""Replay customer journeys against the real app and report per-endpoint latency and SQL counts as JSON.
+
+Usage: python server/benchmarks/bench_api_load.py [--concurrency 8] [--duration 30] [--orders 200000] [--output run.json] [--baseline previous.json]
+
+Boots create_app() on a throwaway SQLite database (or an empty one given with
+--database-url, e.g. a local Postgres), builds the schema with the migration
+chain and seeds --customers customers, --vendors vendors with --products
+products between them and --orders orders spread over the last --days days,
+with the sales rollups rebuilt from them. The app is served by a threaded
+WSGI server on a local port and --concurrency virtual users replay journeys
+over keep-alive connections for --duration seconds (or until --journeys):
+  - customer: log in, browse two catalog pages, search, add 1-3 products to
+    the cart, view the cart, place the order, view the orders,
+  - vendor (--vendor-share of journeys): log in, view the 30-day sales
+    report, restock a product.
+Reported per endpoint: requests, non-2xx responses, throughput, p50/p95/p99
+and max latency in milliseconds, and SQL statements and database time per
+request as the app's /metrics counted them. The JSON goes to stdout or
+--output; with --baseline, the relative change of throughput, p95 and SQL
+statements against an earlier run's JSON is printed to stderr, so runs can be
+diffed between commits. Journeys and data are drawn from --seed, so two runs
+of the same commit replay the same requests.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from sqlalchemy import insert
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+PASSWORD = 'load-test-password'
+METRICS_TOKEN = 'load-test'
+WORDS = ('Tomato', 'Cabbage', 'Onion', 'Potato', 'Carrot', 'Kale', 'Spinach', 'Mango', 'Avocado', 'Banana',
+         'Pepper', 'Garlic', 'Ginger', 'Lemon', 'Orange', 'Beans', 'Peas', 'Maize', 'Millet', 'Sukuma')
+SEED_BATCH = 20_000
+
+# Journey steps, by the label they are reported under, and the view that
+# serves them, which is what /metrics labels its series with
+ENDPOINTS = {
+    'POST /api/login': 'main.login',
+    'GET /api/products': 'main.get_products',
+    'GET /api/products/search': 'main.search_products',
+    'POST /api/cart': 'main.add_to_cart',
+    'GET /api/cart': 'main.get_cart',
+    'POST /api/order': 'main.place_order',
+    'GET /api/orders': 'main.get_orders',
+    'GET /api/vendor/sales': 'main.vendor_sales',
+    'PUT /api/products/<id>/stock': 'main.update_stock',
+}
+
+
+class KeepAliveHandler(WSGIRequestHandler):
+    # Browsers and the proxy in front of gunicorn reuse connections; opening
+    # one per request would mostly measure TCP set-up
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def seed(app, args, rng):
+    """Users, products and orders written with bulk inserts.
+
+    Returns the customers' emails, each vendor's email with their product
+    ids, and all product ids.
+    """
+    from app import password_hasher
+    from models import db, User, Product, Order
+    from sales_rollup import rebuild_sales
+
+    with app.app_context():
+        # One hash for everyone: seeding is not what is measured
+        hashed = password_hasher.hash(PASSWORD)
+        vendors = [f'vendor{i}@load.example.com' for i in range(args.vendors)]
+        customers = [f'customer{i}@load.example.com' for i in range(args.customers)]
+        db.session.execute(insert(User), [
+            {'email': email, 'password': hashed, 'role': 'vendor'} for email in vendors
+        ] + [
+            {'email': email, 'password': hashed, 'role': 'customer'} for email in customers
+        ])
+        vendor_emails = dict(db.session.query(User.id, User.email).filter_by(role='vendor').order_by(User.id))
+        vendor_ids = list(vendor_emails)
+        customer_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(role='customer')]
+        for start in range(0, args.products, SEED_BATCH):
+            db.session.execute(insert(Product), [
+                {'name': f'{rng.choice(WORDS)} {rng.choice(WORDS).lower()} {i}',
+                 'description': f'{rng.choice(WORDS)} grown by vendor {i % len(vendor_ids)}',
+                 'price': round(rng.uniform(0.5, 50.0), 2), 'vendor_id': vendor_ids[i % len(vendor_ids)],
+                 'stock': None if i % 3 else 1_000_000}
+                for i in range(start, min(start + SEED_BATCH, args.products))
+            ])
+        db.session.commit()
+        prices = dict(db.session.query(Product.id, Product.price))
+        product_ids = list(prices)
+        catalog = defaultdict(list)
+        for product_id, vendor_id in db.session.query(Product.id, Product.vendor_id):
+            catalog[vendor_emails[vendor_id]].append(product_id)
+
+        now = datetime.utcnow()
+        for start in range(0, args.orders, SEED_BATCH):
+            rows = []
+            for _ in range(min(SEED_BATCH, args.orders - start)):
+                product_id = rng.choice(product_ids)
+                rows.append({
+                    'customer_id': rng.choice(customer_ids), 'product_id': product_id,
+                    'quantity': rng.randint(1, 5), 'unit_price': prices[product_id],
+                    'created_at': now - timedelta(minutes=rng.randrange(args.days * 1440)),
+                    'status': rng.choice(('completed', 'completed', 'completed', 'expired', 'processing')),
+                })
+            db.session.execute(insert(Order), rows)
+            db.session.commit()
+        rebuild_sales(db.session)
+        db.session.commit()
+        return customers, sorted(catalog.items()), product_ids
+
+
+class Client:
+    """One virtual user's keep-alive connection, recording every response under its label"""
+
+    def __init__(self, host, port, record):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.record = record
+        self.token = None
+
+    def call(self, label, method, path, body=None):
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # A dropped connection is an error of this request; reconnect for the next
+            self.connection.close()
+            response, payload, status = None, b'', 0
+        self.record(label, time.perf_counter() - started, status)
+        return status, response, payload
+
+    def close(self):
+        self.connection.close()
+
+
+def customer_journey(client, rng, email, product_ids):
+    status, _, payload = client.call('POST /api/login', 'POST', '/api/login', {'email': email, 'password': PASSWORD})
+    if status != 200:
+        return
+    client.token = json.loads(payload)['token']
+    _, response, _ = client.call('GET /api/products', 'GET', '/api/products?limit=50')
+    cursor = response.getheader('X-Next-Cursor') if response is not None else None
+    if cursor:
+        client.call('GET /api/products', 'GET', f'/api/products?limit=50&cursor={cursor}')
+    client.call('GET /api/products/search', 'GET', f'/api/products/search?q={rng.choice(WORDS)}')
+    basket = rng.sample(product_ids, rng.randint(1, 3))
+    for product_id in basket:
+        client.call('POST /api/cart', 'POST', '/api/cart', {'product_id': product_id, 'quantity': rng.randint(1, 3)})
+    status, _, payload = client.call('GET /api/cart', 'GET', '/api/cart')
+    if status == 200:
+        lines = [{'product_id': line['product_id'], 'quantity': line['quantity']} for line in json.loads(payload)]
+        if lines:
+            client.call('POST /api/order', 'POST', '/api/order', {'cart_items': lines})
+    client.call('GET /api/orders', 'GET', '/api/orders')
+
+
+def vendor_journey(client, rng, email, own_products):
+    status, _, payload = client.call('POST /api/login', 'POST', '/api/login', {'email': email, 'password': PASSWORD})
+    if status != 200:
+        return
+    client.token = json.loads(payload)['token']
+    client.call('GET /api/vendor/sales', 'GET', '/api/vendor/sales')
+    client.call('PUT /api/products/<id>/stock', 'PUT', f'/api/products/{rng.choice(own_products)}/stock', {'add': 5})
+
+
+def scrape_sql(host, port):
+    """{view: (requests, statements, db seconds)} from the app's /metrics"""
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    connection.request('GET', '/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+    text = connection.getresponse().read().decode()
+    connection.close()
+    series = defaultdict(lambda: [0, 0.0, 0.0])
+    pattern = re.compile(r'^(http_request_sql_statements|http_request_db_seconds)_(sum|count)\{endpoint="([^"]*)"\} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match is None:
+            continue
+        name, field, endpoint, value = match.groups()
+        if field == 'count' and name == 'http_request_sql_statements':
+            series[endpoint][0] = int(value)
+        elif field == 'sum':
+            series[endpoint][1 if name == 'http_request_sql_statements' else 2] = float(value)
+    return series
+
+
+def percentile(samples, share):
+    # Nearest rank on sorted samples
+    return samples[min(len(samples) - 1, max(0, int(round(share * len(samples))) - 1))]
+
+
+def summarize(latencies, statuses, elapsed, sql_before, sql_after):
+    endpoints = {}
+    for label, samples in sorted(latencies.items()):
+        samples.sort()
+        view = ENDPOINTS[label]
+        before, after = sql_before.get(view, (0, 0.0, 0.0)), sql_after.get(view, (0, 0.0, 0.0))
+        served = after[0] - before[0]
+        endpoints[label] = {
+            'requests': len(samples),
+            'errors': sum(count for status, count in statuses[label].items() if not 200 <= status < 300),
+            'statuses': {str(status): count for status, count in sorted(statuses[label].items())},
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'latency_ms': {
+                'p50': round(percentile(samples, 0.50) * 1000, 2),
+                'p95': round(percentile(samples, 0.95) * 1000, 2),
+                'p99': round(percentile(samples, 0.99) * 1000, 2),
+                'max': round(samples[-1] * 1000, 2),
+            },
+            'sql_statements_per_request': round((after[1] - before[1]) / served, 2) if served else None,
+            'db_ms_per_request': round((after[2] - before[2]) / served * 1000, 3) if served else None,
+        }
+    return endpoints
+
+
+def compare(run, baseline):
+    """Relative change of each endpoint's throughput, p95 and SQL count against `baseline`, as text"""
+    lines = [f"{'endpoint':<30} {'rps':>9} {'p95':>9} {'sql/req':>9}"]
+
+    def change(new, old):
+        if new is None or old is None:
+            return '-'
+        if not old:
+            return 'from 0' if new else '0%'
+        return f'{(new - old) / old:+.0%}'
+
+    for label, now in run['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(label)
+        if before is None:
+            lines.append(f"{label:<30} {'new':>9} {'new':>9} {'new':>9}")
+            continue
+        lines.append(f"{label:<30} {change(now['throughput_rps'], before['throughput_rps']):>9} "
+                     f"{change(now['latency_ms']['p95'], before['latency_ms']['p95']):>9} "
+                     f"{change(now['sql_statements_per_request'], before['sql_statements_per_request']):>9}")
+    return '\n'.join(lines)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='an empty database; a throwaway SQLite file by default')
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--vendors', type=int, default=50)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=200_000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--journeys', type=int, default=0, help='stop after this many journeys instead')
+    parser.add_argument('--vendor-share', type=float, default=0.1)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help='production uses 12; login then dominates')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--baseline', help='JSON of an earlier run to compare against')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tmp, 'load.db')
+    from flask_migrate import upgrade
+    from app import create_app
+    from models import db
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'CART_STORE_PATH': os.path.join(tmp, 'carts.db'),
+        # Every virtual user comes from 127.0.0.1 and would soon be throttled
+        'RATE_LIMIT_BACKEND': 'off',
+        'BCRYPT_LOG_ROUNDS': args.bcrypt_rounds,
+        'METRICS_TOKEN': METRICS_TOKEN,
+        'JWT_SECRET_KEY': 'load-test-jwt-secret-of-at-least-32-bytes',
+        'LOG_LEVEL': 'WARNING',
+    })
+    rng = random.Random(args.seed)
+    with app.app_context():
+        upgrade()
+        dialect = db.engine.dialect.name
+    started = time.perf_counter()
+    customers, vendors, product_ids = seed(app, args, rng)
+    seed_seconds = time.perf_counter() - started
+    print(f"Seeded {args.customers} customers, {args.vendors} vendors, {args.products} products and "
+          f"{args.orders} orders in {seed_seconds:.1f}s", file=sys.stderr)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    host, port = '127.0.0.1', server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    lock = threading.Lock()
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    journeys_left = [args.journeys or None]
+
+    def record(label, seconds, status):
+        with lock:
+            latencies[label].append(seconds)
+            statuses[label][status] += 1
+
+    def next_journey():
+        with lock:
+            if journeys_left[0] is None:
+                return True
+            if journeys_left[0] <= 0:
+                return False
+            journeys_left[0] -= 1
+            return True
+
+    def virtual_user(index, deadline):
+        # Each user draws from its own stream, so a run is the same whatever the thread timing
+        user_rng = random.Random(args.seed * 1000 + index)
+        while time.perf_counter() < deadline and next_journey():
+            client = Client(host, port, record)
+            try:
+                if user_rng.random() < args.vendor_share:
+                    vendor_journey(client, user_rng, *user_rng.choice(vendors))
+                else:
+                    customer_journey(client, user_rng, user_rng.choice(customers), product_ids)
+            finally:
+                client.close()
+
+    # Warm the catalog cache and search index as a running worker would have
+    warm = Client(host, port, lambda *_: None)
+    warm.call('', 'GET', '/api/products?limit=50')
+    warm.call('', 'GET', f'/api/products/search?q={WORDS[0]}')
+    warm.close()
+
+    sql_before = scrape_sql(host, port)
+    started = time.perf_counter()
+    deadline = started + (args.duration if not args.journeys else float('inf'))
+    users = [threading.Thread(target=virtual_user, args=(i, deadline)) for i in range(args.concurrency)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - started
+    sql_after = scrape_sql(host, port)
+    server.shutdown()
+
+    requests = sum(len(samples) for samples in latencies.values())
+    endpoints = summarize(latencies, statuses, elapsed, sql_before, sql_after)
+    run = {
+        'commit': git_commit(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'database': dialect,
+        'settings': {
+            'customers': args.customers, 'vendors': args.vendors, 'products': args.products, 'orders': args.orders,
+            'days': args.days, 'concurrency': args.concurrency, 'duration': args.duration,
+            'journeys': args.journeys, 'vendor_share': args.vendor_share, 'bcrypt_rounds': args.bcrypt_rounds,
+            'seed': args.seed,
+        },
+        'seed_seconds': round(seed_seconds, 1),
+        'elapsed_seconds': round(elapsed, 2),
+        'totals': {
+            'requests': requests,
+            'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+            'throughput_rps': round(requests / elapsed, 1),
+        },
+        'endpoints': endpoints,
+    }
+
+    text = json.dumps(run, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print(compare(run, json.load(f)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Compare /api/products throughput with and without the catalog cache.
+
+Usage: python server/benchmarks/bench_catalog_cache.py [--products N] [--requests N]
+
+Runs against a throwaway SQLite database so it never touches mama_mboga.db.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+
+def run(client, requests, headers=None):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/api/products', headers=headers or {})
+        assert response.status_code in (200, 304), response.status_code
+    elapsed = time.perf_counter() - start
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    # Every request comes from one address and would soon be throttled
+    os.environ['RATE_LIMIT_BACKEND'] = 'off'
+    from flask_migrate import upgrade
+    from app import app, db, Product, catalog_cache
+
+    with app.app_context():
+        upgrade()
+        db.session.query(Product).delete()
+        db.session.add_all([
+            Product(name=f"Product {i}", description=f"Description for product {i}", price=1.0 + i % 50, vendor_id=1)
+            for i in range(args.products)
+        ])
+        db.session.commit()
+
+    client = app.test_client()
+
+    catalog_cache.enabled = False
+    uncached = run(client, args.requests)
+
+    catalog_cache.enabled = True
+    catalog_cache.invalidate()
+    cached = run(client, args.requests)
+
+    etag = client.get('/api/products').headers['ETag']
+    conditional = run(client, args.requests, headers={'If-None-Match': etag})
+
+    print(f"products={args.products} requests={args.requests}")
+    print(f"uncached:          {uncached:10.1f} req/s")
+    print(f"cached (200):      {cached:10.1f} req/s  ({cached / uncached:.1f}x)")
+    print(f"cached (304):      {conditional:10.1f} req/s  ({conditional / uncached:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
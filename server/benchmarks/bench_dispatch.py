@@ -0,0 +1,122 @@
+"""Dispatch tick time for a synthetic city of pending orders and riders.
+
+Usage: python server/benchmarks/bench_dispatch.py [--orders 10000] [--riders 1000] [--capacity 10]
+
+Scatters vendors' pickups and riders around Nairobi, then times
+  - the in-memory assignment (distance matrix + greedy) on its own,
+  - a full Dispatcher.tick() against a throwaway SQLite database: reading the
+    batch, assigning it and writing every assignment back,
+and compares greedy with optimal (Hungarian) total distance on a smaller
+batch. The tick must finish well inside DISPATCH_INTERVAL (10s by default).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import insert
+
+from models import db, User, Product, Order, Delivery, Rider
+from dispatch import Dispatcher, distance_matrix, assign_greedy, assign_hungarian, linear_sum_assignment
+
+CENTRE = (-1.2864, 36.8172)
+SPREAD_DEGREES = 0.09  # roughly 10 km
+
+
+def scatter(rng, n):
+    return np.column_stack([
+        CENTRE[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES, n),
+        CENTRE[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES, n),
+    ])
+
+
+def total_distance(cost, assignment):
+    rows = np.flatnonzero(assignment >= 0)
+    return float(cost[rows, assignment[rows]].sum()), rows.size
+
+
+def bench_assignment(rng, orders, riders, capacity):
+    pickups, positions = scatter(rng, orders), scatter(rng, riders)
+    slots = np.full(riders, capacity)
+    start = time.perf_counter()
+    cost = distance_matrix(pickups, positions)
+    matrix_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    assignment = assign_greedy(cost, slots)
+    greedy_ms = (time.perf_counter() - start) * 1000
+    distance, assigned = total_distance(cost, assignment)
+    print(f"in memory: {orders} orders x {riders} riders, distance matrix {matrix_ms:.0f} ms, "
+          f"greedy {greedy_ms:.0f} ms, {assigned} assigned, mean pickup {distance / max(assigned, 1):.2f} km")
+
+
+def bench_quality(rng, orders, riders, capacity):
+    if linear_sum_assignment is None:
+        print("quality: scipy not installed, skipping the Hungarian comparison")
+        return
+    pickups, positions = scatter(rng, orders), scatter(rng, riders)
+    cost = distance_matrix(pickups, positions)
+    slots = np.full(riders, capacity)
+    start = time.perf_counter()
+    greedy, _ = total_distance(cost, assign_greedy(cost, slots))
+    greedy_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    optimal, _ = total_distance(cost, assign_hungarian(cost, slots))
+    optimal_ms = (time.perf_counter() - start) * 1000
+    print(f"quality: {orders} orders x {riders} riders, greedy {greedy:.1f} km in {greedy_ms:.0f} ms, "
+          f"hungarian {optimal:.1f} km in {optimal_ms:.0f} ms (greedy +{(greedy / optimal - 1) * 100:.1f}%)")
+
+
+def bench_tick(rng, orders, riders, capacity):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'dispatch.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'email': f'user{i}@example.com', 'password': 'x', 'role': 'rider' if i < riders else 'customer'}
+            for i in range(riders + 1)
+        ])
+        db.session.execute(insert(Product), [{'name': 'Sukuma', 'price': 1.0, 'vendor_id': 1}])
+        positions = scatter(rng, riders)
+        db.session.execute(insert(Rider), [
+            {'user_id': i + 1, 'status': 'available', 'capacity': capacity,
+             'latitude': float(lat), 'longitude': float(lon)}
+            for i, (lat, lon) in enumerate(positions)
+        ])
+        db.session.execute(insert(Order), [
+            {'id': i + 1, 'customer_id': riders + 1, 'product_id': 1, 'status': 'completed'} for i in range(orders)
+        ])
+        db.session.execute(insert(Delivery), [
+            {'order_id': i + 1, 'delivery_status': 'pending',
+             'pickup_latitude': float(lat), 'pickup_longitude': float(lon)}
+            for i, (lat, lon) in enumerate(scatter(rng, orders))
+        ])
+        db.session.commit()
+
+        result = Dispatcher(batch_size=orders).tick()
+        print(f"tick: {result.assigned} of {result.pending} deliveries to {result.riders} riders "
+              f"({result.method}) in {result.elapsed_ms:.0f} ms including reads and writes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--riders', type=int, default=1000)
+    parser.add_argument('--capacity', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    bench_assignment(rng, args.orders, args.riders, args.capacity)
+    bench_quality(rng, 400, 100, 3)
+    bench_tick(rng, args.orders, args.riders, args.capacity)
+
+
+if __name__ == '__main__':
+    main()
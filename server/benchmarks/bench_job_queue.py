@@ -0,0 +1,183 @@
+"""Order request latency with side effects queued, and job worker throughput.
+
+Usage: python server/benchmarks/bench_job_queue.py [--orders 300] [--jobs 2000] [--workers 4]
+
+Reports:
+  - p50/p99 of placing an order and checking out when both only enqueue,
+    against the same requests also running the queued tasks inline,
+  - jobs per second drained by `--workers` worker threads sharing one SQLite
+    file (each with its own connection, as separate processes would),
+    checking every job ran exactly once,
+  - that a task failing transiently is retried with backoff until it
+    succeeds and one that always fails ends up dead after max_attempts.
+Pass --database-url to run against an empty Postgres database instead.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import insert
+
+from db_engine import configure_app_engine, init_engine
+from jobs import Worker, enqueue, queue_counts, task
+from models import db, User, Product, Job
+import orders
+
+runs = Counter()
+runs_lock = threading.Lock()
+
+
+@task('bench.record')
+def record(n):
+    with runs_lock:
+        runs[n] += 1
+
+
+@task('bench.flaky')
+def flaky(n, failures):
+    with runs_lock:
+        runs[('flaky', n)] += 1
+        attempt = runs[('flaky', n)]
+    if attempt <= failures:
+        raise RuntimeError(f"transient failure {attempt}")
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def timed(samples, call):
+    start = time.perf_counter()
+    result = call()
+    samples.append((time.perf_counter() - start) * 1000)
+    return result
+
+
+def bench_requests(app, customers, product_ids, orders_count):
+    queued = {'place': [], 'checkout': []}
+    inline = {'place': [], 'checkout': []}
+    worker = Worker(batch_size=1000)
+    with app.app_context():
+        for i in range(orders_count):
+            inline_run = i % 2 == 1
+            samples = inline if inline_run else queued
+            customer_id = customers[i % len(customers)]
+            items = [{'product_id': product_ids[(i + j) % len(product_ids)], 'quantity': 1} for j in range(3)]
+
+            def place():
+                orders.place_cart_order(customer_id, items)
+                if inline_run:
+                    worker.work()
+
+            def checkout():
+                orders.checkout(customer_id)
+                if inline_run:
+                    worker.work()
+
+            timed(samples['place'], place)
+            timed(samples['checkout'], checkout)
+            if not inline_run:
+                worker.work()
+        print(f"{'request':<10} {'queued p50':>11} {'queued p99':>11} {'inline p50':>11} {'inline p99':>11}")
+        for name in ('place', 'checkout'):
+            print(f"{name:<10} {percentile(queued[name], 0.5):>9.2f}ms {percentile(queued[name], 0.99):>9.2f}ms "
+                  f"{percentile(inline[name], 0.5):>9.2f}ms {percentile(inline[name], 0.99):>9.2f}ms")
+
+
+def bench_workers(app, jobs_count, workers, batch_size):
+    with app.app_context():
+        for n in range(jobs_count):
+            enqueue(db.session, 'bench.record', {'n': n})
+        db.session.commit()
+
+    def drain():
+        with app.app_context():
+            worker = Worker(batch_size=batch_size)
+            while worker.work():
+                pass
+            db.session.remove()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=drain) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    recorded = [runs[n] for n in range(jobs_count)]
+    assert all(count == 1 for count in recorded), \
+        f"{sum(1 for c in recorded if c != 1)} jobs ran other than exactly once"
+    print(f"workers: {workers} drained {jobs_count} jobs in {elapsed:.2f} s "
+          f"({jobs_count / elapsed:,.0f} jobs/s), each run exactly once")
+
+
+def bench_retries(app, max_attempts):
+    with app.app_context():
+        enqueue(db.session, 'bench.flaky', {'n': 0, 'failures': max_attempts - 1}, max_attempts=max_attempts)
+        enqueue(db.session, 'bench.flaky', {'n': 1, 'failures': max_attempts}, max_attempts=max_attempts)
+        db.session.commit()
+        worker = Worker(backoff_base=0.01)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            worker.work()
+            if not Job.query.filter(Job.task == 'bench.flaky', Job.status.in_(('queued', 'running'))).count():
+                break
+            time.sleep(0.01)
+        outcomes = {job.payload: (job.status, job.attempts) for job in Job.query.filter_by(task='bench.flaky')}
+        statuses = sorted(status for status, _ in outcomes.values())
+        assert statuses == ['dead', 'done'], outcomes
+        print(f"retries: transient failure done after {max_attempts} attempts, "
+              f"permanent failure dead after {max_attempts}; queue now {queue_counts()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='empty Postgres database to use instead of SQLite')
+    parser.add_argument('--orders', type=int, default=300)
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'jobs.db')
+    )
+    configure_app_engine(app, 'production')
+    db.init_app(app)
+    init_engine(app, db)
+    Migrate(app, db, directory=os.path.join(SERVER_DIR, 'migrations'))
+    with app.app_context():
+        upgrade()
+        vendor = User(email='vendor@example.com', password='x', role='vendor', latitude=-1.28, longitude=36.82)
+        db.session.add(vendor)
+        db.session.flush()
+        db.session.execute(insert(User), [
+            {'email': f'customer{i}@example.com', 'password': 'x', 'role': 'customer',
+             'latitude': -1.29, 'longitude': 36.81} for i in range(20)
+        ])
+        db.session.execute(insert(Product), [
+            {'name': f'Product {i}', 'price': 1.0 + i, 'vendor_id': vendor.id} for i in range(50)
+        ])
+        db.session.commit()
+        customers = [user_id for (user_id,) in db.session.query(User.id).filter_by(role='customer')]
+        product_ids = [product_id for (product_id,) in db.session.query(Product.id)]
+
+    bench_requests(app, customers, product_ids, args.orders)
+    bench_workers(app, args.jobs, args.workers, args.batch_size)
+    bench_retries(app, args.max_attempts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""JSON encoding and compression of API responses: stdlib against orjson, raw against compressed.
+
+Usage: python server/benchmarks/bench_json_responses.py [--products 500] [--orders 200] [--rounds 200]
+
+Builds payloads shaped like the product list, a customer's order history and
+a cart, and for each reports:
+  - encode: milliseconds per jsonify() with Flask's default provider and
+    with FastJSONProvider (orjson, if installed),
+  - bytes on the wire: identity, gzip and (with brotli installed) br,
+  - respond: milliseconds per full request through a test app, with the
+    ResponseCompressor compressing each time and, for a response with a
+    strong ETag like the catalog's, serving its cached compressed body.
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from utils import FastJSONProvider, ResponseCompressor, brotli, orjson
+
+ACCEPT = 'gzip, deflate, br'
+
+
+def payloads(products, orders, rng):
+    names = ['Tomatoes', 'Sukuma wiki', 'Onions', 'Potatoes', 'Carrots', 'Mangoes', 'Avocados', 'Cabbage']
+    catalog = [
+        {'id': i, 'name': f'{rng.choice(names)} {i}', 'description': 'Fresh from the market this morning',
+         'price': round(rng.uniform(0.5, 20), 2), 'vendor_id': rng.randint(1, 50), 'stock': rng.randint(0, 200)}
+        for i in range(1, products + 1)
+    ]
+    history = [
+        {'order_id': i, 'product_name': rng.choice(names), 'quantity': rng.randint(1, 5),
+         'status': rng.choice(['processing', 'delivered', 'cancelled']),
+         'delivery': {'id': i, 'status': rng.choice(['pending', 'assigned', 'delivered']), 'rider_id': rng.randint(1, 30)}}
+        for i in range(1, orders + 1)
+    ]
+    cart = [
+        {'product_id': p['id'], 'name': p['name'], 'price': p['price'], 'quantity': rng.randint(1, 4)}
+        for p in rng.sample(catalog, min(15, len(catalog)))
+    ]
+    return {'product list': catalog, 'order history': history, 'cart': cart}
+
+
+def per_call_ms(function, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) * 1000 / rounds
+
+
+def test_app(provider_class, payload, etag):
+    app = Flask(__name__)
+    app.json = provider_class(app)
+    ResponseCompressor().init_app(app)
+
+    @app.route('/')
+    def view():
+        response = jsonify(payload)
+        if etag:
+            response.set_etag(etag)
+        return response
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"orjson {'installed' if orjson else 'missing'}, brotli {'installed' if brotli else 'missing'}")
+    print(f"{'payload':<14} {'stdlib ms':>10} {'orjson ms':>10} {'bytes':>8} {'gzip':>7} {'br':>7} "
+          f"{'respond ms':>11} {'cached ms':>10}")
+    for name, payload in payloads(args.products, args.orders, random.Random(args.seed)).items():
+        stdlib_app, fast_app = Flask(__name__), Flask(__name__)
+        stdlib_app.json = DefaultJSONProvider(stdlib_app)
+        fast_app.json = FastJSONProvider(fast_app)
+        with stdlib_app.app_context():
+            stdlib_ms = per_call_ms(lambda: jsonify(payload), args.rounds)
+            body = jsonify(payload).get_data()
+        with fast_app.app_context():
+            fast_ms = per_call_ms(lambda: jsonify(payload), args.rounds)
+        gzipped = len(gzip.compress(body, compresslevel=6))
+        br = len(brotli.compress(body, quality=5)) if brotli else None
+
+        timings = []
+        for etag in (None, 'catalog-v1'):
+            client = test_app(FastJSONProvider, payload, etag).test_client()
+            response = client.get('/', headers={'Accept-Encoding': ACCEPT})
+            assert response.status_code == 200 and isinstance(response.data, bytes)
+            timings.append(per_call_ms(lambda: client.get('/', headers={'Accept-Encoding': ACCEPT}), args.rounds))
+        print(f"{name:<14} {stdlib_ms:>10.3f} {fast_ms:>10.3f} {len(body):>8,} {gzipped:>7,} "
+              f"{br if br is not None else '-':>7} {timings[0]:>11.3f} {timings[1]:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Order history and checkout latency as total order history grows, with and without archiving.
+
+Usage: python server/benchmarks/bench_order_archive.py [--orders 50000,200000,500000] [--customers 2000]
+
+Two SQLite databases receive the same orders: --customers customers order
+--per-day orders a day in total, and the history reaches further back at
+each size in --orders. Everything older than --keep-days is completed and
+delivered. One database is archived with archive_orders() at every size,
+the other never is. Reported per size, as the median over 200 customers:
+  - all orders: the previous /orders query, every order of the customer
+    with product and delivery, on the unarchived table,
+  - page: order_history(), the newest 50, unarchived and archived,
+  - checkout: the processing-order lookup checkout() runs, archived,
+plus the hot table's rows and how long the archive run took. The archived
+columns should stay flat while the history grows.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from sqlalchemy import func, insert, select
+
+from models import db, User, Product, Order, Delivery
+from orders import order_history
+from order_archive import archive_orders
+
+SAMPLE = 200
+
+
+def all_orders(user_id):
+    """The pre-paging history query: every order of the customer, oldest first"""
+    return (
+        db.session.query(Order.id, Order.status, Order.product_id, Product.name, Delivery.delivery_status)
+        .join(Product, Order.product_id == Product.id)
+        .outerjoin(Delivery, Delivery.order_id == Order.id)
+        .filter(Order.customer_id == user_id)
+        .order_by(Order.id)
+        .all()
+    )
+
+
+def processing_ids(user_id):
+    return db.session.query(Order.id).filter_by(customer_id=user_id, status='processing').order_by(Order.id).all()
+
+
+def median_ms(fn, customer_ids):
+    samples = []
+    for customer_id in customer_ids:
+        start = time.perf_counter()
+        fn(customer_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    return app
+
+
+def add_orders(rows):
+    order_ids = db.session.execute(insert(Order).returning(Order.id, sort_by_parameter_order=True), rows).scalars().all()
+    db.session.execute(insert(Delivery), [
+        {'order_id': order_id, 'delivery_status': 'delivered' if row['status'] == 'completed' else 'pending',
+         'created_at': row['created_at']}
+        for order_id, row in zip(order_ids, rows)
+    ])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', default='50000,200000,500000')
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--per-day', type=int, default=1000)
+    parser.add_argument('--keep-days', type=float, default=90)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.orders.split(',')]
+
+    tmp = tempfile.mkdtemp()
+    plain, archived = make_app(os.path.join(tmp, 'plain.db')), make_app(os.path.join(tmp, 'archived.db'))
+    for app in (plain, archived):
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [
+                {'email': f'user{i}@example.com', 'password': 'x', 'role': 'vendor' if i == 0 else 'customer'}
+                for i in range(args.customers + 1)
+            ])
+            db.session.execute(insert(Product), [
+                {'name': f'Product {i}', 'price': 1.0 + i, 'vendor_id': 1} for i in range(200)
+            ])
+            db.session.commit()
+
+    rng = random.Random(3)
+    now = datetime.utcnow()
+    customer_ids = list(range(2, args.customers + 2))
+    sample = rng.sample(customer_ids, min(SAMPLE, len(customer_ids)))
+    print(f"{'orders':>9} {'hot rows':>9} {'archive s':>10} {'all orders ms':>14} "
+          f"{'page ms':>8} {'page archived':>14} {'checkout archived':>18}")
+    placed = 0
+    for size in sizes:
+        # Each step reaches further into the past, so recent volume stays the same
+        while placed < size:
+            batch = min(20_000, size - placed)
+            rows = []
+            for i in range(placed, placed + batch):
+                created_at = now - timedelta(days=i / args.per_day, seconds=rng.randrange(60))
+                recent = now - created_at < timedelta(days=args.keep_days)
+                rows.append({
+                    'customer_id': rng.choice(customer_ids), 'product_id': rng.randrange(1, 201), 'quantity': 1,
+                    'unit_price': 2.0, 'created_at': created_at,
+                    'status': rng.choice(('processing', 'completed', 'completed')) if recent else 'completed',
+                })
+            for app in (plain, archived):
+                with app.app_context():
+                    add_orders(rows)
+            placed += batch
+
+        with plain.app_context():
+            every = median_ms(all_orders, sample)
+            page = median_ms(order_history, sample)
+        with archived.app_context():
+            started = time.perf_counter()
+            archive_orders(now - timedelta(days=args.keep_days))
+            archive_s = time.perf_counter() - started
+            hot = db.session.execute(select(func.count(Order.id))).scalar()
+            page_archived = median_ms(order_history, sample)
+            checkout_archived = median_ms(processing_ids, sample)
+        print(f"{size:>9,} {hot:>9,} {archive_s:>10.1f} {every:>14.2f} "
+              f"{page:>8.2f} {page_archived:>14.2f} {checkout_archived:>18.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Cost of idle order-stream subscribers against clients polling /orders.
+
+Usage: python server/benchmarks/bench_order_events.py [--subscribers 10000] [--waiting 2000] [--poll-interval 5]
+
+Measures, for the in-process event bus:
+  - memory held per idle subscription,
+  - CPU burnt by `--waiting` threads parked on their subscriptions, the way
+    /api/orders/stream holds a connection between heartbeats,
+  - publish-to-receive latency for one customer while `--subscribers` other
+    subscriptions are registered,
+and, for comparison, the database time the same clients spend when each
+re-fetches its order history every `--poll-interval` seconds instead.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from sqlalchemy import insert
+
+from models import db, User, Product, Order, Delivery
+from order_events import OrderEventBus, order_event
+from orders import order_history
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def bench_memory(subscribers):
+    bus = OrderEventBus()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    subscriptions = [bus.subscribe(i) for i in range(subscribers)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"memory: {used / len(subscriptions):.0f} bytes per idle subscription ({subscribers} subscribed)")
+    return bus
+
+
+def bench_idle_cpu(waiting, seconds, heartbeat):
+    bus = OrderEventBus()
+    stop = threading.Event()
+
+    def park(customer_id):
+        subscription = bus.subscribe(customer_id)
+        while not stop.is_set():
+            subscription.wait(heartbeat)
+        bus.unsubscribe(subscription)
+
+    threads = [threading.Thread(target=park, args=(i,), daemon=True) for i in range(waiting)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    cpu = time.process_time()
+    time.sleep(seconds)
+    used = time.process_time() - cpu
+    stop.set()
+    print(f"idle cpu: {waiting} parked subscribers used {used * 1000:.1f} ms of CPU in {seconds:.0f} s "
+          f"({used / seconds * 100:.2f}% of a core)")
+
+
+def bench_latency(bus, rounds):
+    subscription = bus.subscribe(-1)
+    received = []
+
+    def consume():
+        while len(received) < rounds:
+            events, _ = subscription.wait(1.0)
+            now = time.perf_counter()
+            received.extend(now - event['sent'] for event in events)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for i in range(rounds):
+        payload = order_event(-1, i, status='completed')
+        payload['sent'] = time.perf_counter()
+        bus.deliver(payload)
+        time.sleep(0.001)
+    consumer.join()
+    samples = [latency * 1e6 for latency in received]
+    print(f"latency: publish to receive p50 {percentile(samples, 0.5):.0f} us, p99 {percentile(samples, 0.99):.0f} us "
+          f"with {bus.subscriber_count() - 1} other subscribers")
+
+
+def bench_polling(clients, interval, orders_per_customer):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'events.db')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'email': f'user{i}@example.com', 'password': 'x', 'role': 'customer'} for i in range(101)
+        ])
+        db.session.execute(insert(Product), [{'name': f'Product {i}', 'price': 1.0, 'vendor_id': 1} for i in range(20)])
+        db.session.execute(insert(Order), [
+            {'id': c * orders_per_customer + i + 1, 'customer_id': c + 2, 'product_id': i % 20 + 1, 'status': 'completed'}
+            for c in range(100) for i in range(orders_per_customer)
+        ])
+        db.session.execute(insert(Delivery), [
+            {'order_id': o + 1, 'delivery_status': 'pending'} for o in range(100 * orders_per_customer)
+        ])
+        db.session.commit()
+        start = time.perf_counter()
+        for c in range(100):
+            order_history(c + 2)
+        per_call = (time.perf_counter() - start) / 100
+    print(f"polling: /orders history query takes {per_call * 1000:.2f} ms; {clients} clients every {interval:g} s "
+          f"make {clients / interval:.0f} queries/s and {clients / interval * per_call:.2f} s of database time per second")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--waiting', type=int, default=2000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--heartbeat', type=float, default=25)
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--poll-interval', type=float, default=5)
+    parser.add_argument('--orders-per-customer', type=int, default=50)
+    args = parser.parse_args()
+
+    bus = bench_memory(args.subscribers)
+    bench_idle_cpu(args.waiting, args.seconds, args.heartbeat)
+    bench_latency(bus, args.rounds)
+    bench_polling(args.subscribers, args.poll_interval, args.orders_per_customer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Order placement latency against basket size.
+
+Usage: python server/benchmarks/bench_order_placement.py [--rounds N] [--sizes 1,5,10,30,100]
+
+Compares the single-transaction place_cart_order() with the previous
+two-commits-per-line loop on a throwaway SQLite file database.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+
+from models import db, User, Product, Order, Delivery
+from orders import place_cart_order
+
+
+def per_line_commits(user_id, cart_items):
+    """The pre-batching implementation: an Order and a Delivery commit per line"""
+    for item in cart_items:
+        order = Order(customer_id=user_id, product_id=item['product_id'], status='processing')
+        db.session.add(order)
+        db.session.commit()
+        db.session.add(Delivery(order_id=order.id, delivery_status='on the way'))
+        db.session.commit()
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--sizes', default='1,5,10,30,100')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        customer = User(email='customer@example.com', password='x', role='customer')
+        db.session.add(customer)
+        db.session.commit()
+        db.session.add_all([
+            Product(name=f"Product {i}", price=1.0 + i, vendor_id=customer.id) for i in range(max(sizes))
+        ])
+        db.session.commit()
+        product_ids = [product_id for (product_id,) in db.session.query(Product.id)]
+
+        print(f"{'lines':>6} {'per-line commits':>18} {'single transaction':>20} {'speedup':>8}")
+        for size in sizes:
+            cart_items = [{'product_id': product_id, 'quantity': 1} for product_id in product_ids[:size]]
+            before = timed(lambda: per_line_commits(customer.id, cart_items), args.rounds)
+            after = timed(lambda: place_cart_order(customer.id, cart_items), args.rounds)
+            print(f"{size:>6} {before:>15.2f} ms {after:>17.2f} ms {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
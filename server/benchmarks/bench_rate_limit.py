@@ -0,0 +1,119 @@
+"""Token bucket stores under concurrency, and load shedding under overload.
+
+Usage: python server/benchmarks/bench_rate_limit.py [--threads 8] [--takes 2000] [--capacity 500]
+
+Part one: --threads threads take tokens from one shared bucket of
+--capacity tokens that barely refills, through each store (memory, file:
+one SQLite file, sql: the app database through SQLAlchemy). Reported are
+takes per second and how many were allowed; more than the capacity means
+two workers spent the same token. Exits non-zero if any store overspends.
+
+Part two: a simulated overload. Requests arrive at twice the rate a worker
+serves them, so the queue time the proxy stamps keeps growing, with one
+checkout for every nine catalog reads. The LoadShedder decides each
+request; reported are the share of checkouts and catalog reads served
+and the queue time they were served at.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+
+from models import db, RateLimitBucket
+from rate_limit import LoadShedder, create_bucket_store
+
+
+def hammer(app, store, threads, takes, capacity):
+    allowed = [0]
+    lock = threading.Lock()
+    start_line = threading.Barrier(threads)
+
+    def taker():
+        local = 0
+        with app.app_context():
+            start_line.wait()
+            for _ in range(takes // threads):
+                # One token per hour: the bucket is effectively not refilled
+                ok, _ = store.take('bench:user:1', capacity, 1 / 3600.0, time.time())
+                local += ok
+        with lock:
+            allowed[0] += local
+
+    workers = [threading.Thread(target=taker) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return allowed[0], time.perf_counter() - started
+
+
+def simulate_overload(target_ms, requests):
+    app = Flask(__name__)
+    shedder = LoadShedder(target=target_ms / 1000.0, window=0.05, header='X-Request-Start')
+    service_time, arrival_gap = 0.004, 0.002
+    backlog = 0.0
+    outcomes = {'critical': [0, 0, 0.0], 'low': [0, 0, 0.0]}
+    for i in range(requests):
+        priority = 'critical' if i % 10 == 0 else 'low'
+        stamp = time.time() - backlog
+        with app.test_request_context('/', headers={'X-Request-Start': f't={stamp:.6f}'}):
+            admitted = shedder.admit(priority)
+        outcome = outcomes[priority]
+        outcome[0] += 1
+        if admitted:
+            shedder.finish()
+            outcome[1] += 1
+            outcome[2] = max(outcome[2], backlog)
+            # Serving it adds its service time to the wait of everyone behind
+            backlog += service_time - arrival_gap
+        else:
+            # A shed request costs next to nothing, so the queue drains
+            backlog = max(0.0, backlog - arrival_gap)
+        time.sleep(0.0002)
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--takes', type=int, default=2000)
+    parser.add_argument('--capacity', type=int, default=500)
+    parser.add_argument('--target-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'app.db')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+
+    overspent = False
+    print(f"{args.threads} threads, {args.takes} takes from one bucket of {args.capacity}")
+    print(f"{'store':<7} {'takes/s':>9} {'allowed':>8} {'overspent':>10}")
+    for backend in ('memory', 'file', 'sql'):
+        with app.app_context():
+            store = create_bucket_store(backend, db=db, model=RateLimitBucket, path=os.path.join(tmp, f'{backend}.db'))
+        allowed, elapsed = hammer(app, store, args.threads, args.takes, args.capacity)
+        over = max(0, allowed - args.capacity)
+        overspent = overspent or over > 0
+        print(f"{backend:<7} {args.takes / elapsed:>9,.0f} {allowed:>8} {over:>10}")
+
+    print(f"\nOverload at 2x capacity, shedding above {args.target_ms:.0f} ms of standing queue")
+    print(f"{'priority':<9} {'requests':>9} {'served':>8} {'worst queue ms':>15}")
+    for priority, (total, served, worst) in simulate_overload(args.target_ms, 3000).items():
+        print(f"{priority:<9} {total:>9} {served / total:>8.0%} {worst * 1000:>15,.0f}")
+    sys.exit(1 if overspent else 0)
+
+
+if __name__ == '__main__':
+    main()
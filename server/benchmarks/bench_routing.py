@@ -0,0 +1,86 @@
+"""Route length and solve time of multi-stop rider routes against stop count.
+
+Usage: python server/benchmarks/bench_routing.py [--routes 50] [--budget-ms 50]
+
+Each route starts at a market and drops off at customers scattered over an
+estate a few km across. For every stop count it compares the dispatch
+order (deliveries visited as assigned, what riders do today), nearest
+neighbour alone and nearest neighbour plus 2-opt, reporting mean route
+length, improvement over the dispatch order, median and worst solve time,
+and how many solves hit the time budget. Up to 9 stops the exact optimum
+is found by brute force to show how far from optimal the heuristic is.
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+import numpy as np
+
+from dispatch import distance_matrix
+from routing import nearest_neighbour, route_length, solve_route
+
+MARKET = (-1.2833, 36.8219)
+ESTATE_DEGREES = 0.02  # roughly 2 km either side of the market
+BRUTE_FORCE_MAX_STOPS = 9
+
+
+def random_route(rng, stops):
+    customers = np.column_stack([
+        MARKET[0] + rng.uniform(-ESTATE_DEGREES, ESTATE_DEGREES, stops),
+        MARKET[1] + rng.uniform(-ESTATE_DEGREES, ESTATE_DEGREES, stops),
+    ])
+    points = np.vstack([MARKET, customers])
+    return distance_matrix(points, points).astype(np.float64)
+
+
+def optimum(dist):
+    n = dist.shape[0]
+    return min(route_length(dist, (0,) + order) for order in itertools.permutations(range(1, n)))
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) if samples else 0.0
+
+
+def bench(rng, stops, routes, budget_ms):
+    assigned, greedy, improved, exact, times = [], [], [], [], []
+    timeouts = 0
+    for _ in range(routes):
+        dist = random_route(rng, stops)
+        assigned.append(route_length(dist, np.arange(stops + 1)))
+        greedy.append(route_length(dist, nearest_neighbour(dist)))
+        start = time.perf_counter()
+        path, converged = solve_route(dist, budget_ms)
+        times.append((time.perf_counter() - start) * 1000)
+        timeouts += not converged
+        improved.append(route_length(dist, path))
+        if stops <= BRUTE_FORCE_MAX_STOPS:
+            exact.append(optimum(dist))
+    gap = f"{(np.mean(improved) / np.mean(exact) - 1) * 100:>8.1f}%" if exact else f"{'-':>9}"
+    print(f"{stops:>5} {np.mean(assigned):>9.1f} {np.mean(greedy):>9.1f} {np.mean(improved):>9.1f} "
+          f"{(1 - np.mean(improved) / np.mean(assigned)) * 100:>8.1f}% {gap} "
+          f"{percentile(times, 50):>8.2f} {max(times):>8.2f} {timeouts:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', type=int, default=50, help='random routes per stop count')
+    parser.add_argument('--budget-ms', type=float, default=50, help='solver time budget per route')
+    parser.add_argument('--stops', type=int, nargs='+', default=[5, 8, 10, 15, 25, 50, 100, 200])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'stops':>5} {'assigned':>9} {'nearest':>9} {'2-opt':>9} {'saved':>9} {'vs-opt':>9} "
+          f"{'p50 ms':>8} {'max ms':>8} {'timeouts':>8}")
+    for stops in args.stops:
+        bench(rng, stops, args.routes, args.budget_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Vendor sales dashboard: aggregating the order table against reading the daily rollups.
+
+Usage: python server/benchmarks/bench_sales_rollups.py [--orders 20000,100000,400000] [--days 90] [--rounds 10]
+
+Grows an order history of 20 vendors x 25 products, spread over --days
+days, to each size in --orders. At each size it rebuilds the rollups with
+rebuild_sales() (the backfill) and then times one vendor's 30-day report
+two ways:
+  - orders: GROUP BY day and product over the order table joined to
+    product, what the dashboard would cost without rollups,
+  - rollups: sales_report(), an index range scan of the vendor's rollups.
+Both must agree. Also reports the cost record_sales() adds to checking out
+a basket of 10 lines, the incremental upkeep paid on every order.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from sqlalchemy import case, func, insert, select
+
+from models import db, User, Product, Order
+from sales_rollup import record_sales, rebuild_sales, sales_report
+
+VENDORS, PRODUCTS_PER_VENDOR = 20, 25
+
+
+def report_from_orders(vendor_id, since, until):
+    day = func.date(Order.created_at)
+    completed = Order.status == 'completed'
+    rows = db.session.execute(
+        select(day, Order.product_id, func.count(Order.id), func.sum(Order.quantity),
+               func.sum(case((completed, Order.quantity * Order.unit_price), else_=0.0)))
+        .join(Product, Product.id == Order.product_id)
+        .where(Product.vendor_id == vendor_id, Order.created_at >= since,
+               Order.created_at < until + timedelta(days=1))
+        .group_by(day, Order.product_id)
+    ).all()
+    return sum(row[2] for row in rows), round(sum(row[4] for row in rows), 2)
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', default='20000,100000,400000')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.orders.split(',')]
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'sales.db')
+    db.init_app(app)
+    rng = random.Random(7)
+
+    with app.app_context():
+        db.create_all()
+        vendors = [User(email=f'vendor{i}@example.com', password='x', role='vendor') for i in range(VENDORS)]
+        customer = User(email='customer@example.com', password='x', role='customer')
+        db.session.add_all(vendors + [customer])
+        db.session.commit()
+        db.session.execute(insert(Product), [
+            {'name': f"Product {v.id}-{i}", 'price': 1.0 + i, 'vendor_id': v.id}
+            for v in vendors for i in range(PRODUCTS_PER_VENDOR)
+        ])
+        db.session.commit()
+        prices = dict(db.session.query(Product.id, Product.price))
+        product_ids = list(prices)
+        vendor_id, customer_id = vendors[0].id, customer.id
+        end = datetime(2026, 6, 30, 12)
+        until = end.date()
+        since = until - timedelta(days=29)
+
+        print(f"{'orders':>9} {'backfill ms':>12} {'orders/s':>10} {'orders ms':>10} {'rollups ms':>11} {'speedup':>8}")
+        count = 0
+        for size in sizes:
+            while count < size:
+                batch = min(10_000, size - count)
+                db.session.execute(insert(Order), [
+                    {'customer_id': customer_id, 'product_id': product_id, 'quantity': rng.randint(1, 5),
+                     'unit_price': prices[product_id], 'created_at': end - timedelta(minutes=rng.randrange(args.days * 1440)),
+                     'status': rng.choice(('completed', 'completed', 'completed', 'expired', 'processing'))}
+                    for product_id in (rng.choice(product_ids) for _ in range(batch))
+                ])
+                count += batch
+            db.session.commit()
+
+            started = time.perf_counter()
+            read, _ = rebuild_sales(db.session)
+            db.session.commit()
+            backfill_ms = (time.perf_counter() - started) * 1000
+
+            direct_ms, direct = timed(lambda: report_from_orders(vendor_id, since, until), args.rounds)
+            rollup_ms, report = timed(lambda: sales_report(db.session, vendor_id, since, until), args.rounds)
+            assert direct == (report['totals']['orders'], report['totals']['revenue']), (direct, report['totals'])
+            print(f"{size:>9,} {backfill_ms:>12,.0f} {read / backfill_ms * 1000:>10,.0f} "
+                  f"{direct_ms:>10.2f} {rollup_ms:>11.2f} {direct_ms / rollup_ms:>7.0f}x")
+
+        lines = [(rng.choice(product_ids), 2, 3.0, end) for _ in range(10)]
+        upkeep_ms, _ = timed(lambda: record_sales(db.session, 'completed', lines), args.rounds * 10)
+        db.session.rollback()
+        print(f"record_sales() for a 10-line checkout: {upkeep_ms:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Measure product search latency on a synthetic catalog.
+
+Usage: python server/benchmarks/bench_search_index.py [--products N] [--queries N]
+
+Builds the in-process search index over N generated products and reports
+build time plus p50/p95/p99 query latency, including misspelt queries.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from search_index import ProductSearchIndex
+
+PRODUCE = [
+    "tomatoes", "sukuma wiki", "cabbage", "onions", "potatoes", "carrots", "spinach",
+    "kale", "lettuce", "cucumber", "bell pepper", "broccoli", "cauliflower", "managu",
+    "terere", "avocado", "mango", "bananas", "pineapple", "passion fruit", "garlic",
+    "ginger", "coriander", "capsicum", "courgette", "pumpkin", "sweet potatoes",
+    "arrow roots", "green peas", "french beans", "spring onions", "chillies",
+]
+ADJECTIVES = ["fresh", "organic", "local", "ripe", "green", "red", "large", "small", "farm", "hand picked"]
+MARKETS = ["wakulima", "kangemi", "gikomba", "marikiti", "toi", "githurai", "kawangware"]
+QUERIES = [
+    "sukuma", "tomatos", "pepper", "organic kale", "sweet potato", "brocoli",
+    "passion", "wakulima avocado", "chilies", "red onoins", "fresh mango", "courgete",
+]
+
+
+def generate(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        produce = rng.choice(PRODUCE)
+        yield {
+            "id": i,
+            "name": f"{rng.choice(ADJECTIVES).title()} {produce.title()} #{i}",
+            "description": f"{rng.choice(ADJECTIVES)} {produce} from {rng.choice(MARKETS)} market",
+            "price": round(rng.uniform(10, 500), 2),
+        }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    products = list(generate(args.products))
+    index = ProductSearchIndex(lambda: products)
+    start = time.perf_counter()
+    index.rebuild()
+    build = time.perf_counter() - start
+
+    samples = []
+    for i in range(args.queries):
+        query = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        index.search(query)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for product in products[:1000]:
+        index.upsert(dict(product, name=product["name"] + " special"))
+    update = (time.perf_counter() - start) * 1000 / 1000
+
+    print(f"products={args.products} queries={args.queries}")
+    print(f"build:   {build * 1000:8.1f} ms")
+    print(f"update:  {update:8.3f} ms per product")
+    print(f"p50:     {percentile(samples, 50):8.3f} ms")
+    print(f"p95:     {percentile(samples, 95):8.3f} ms")
+    print(f"p99:     {percentile(samples, 99):8.3f} ms")
+    for query in QUERIES[:4]:
+        print(f"  {query!r:>16} -> {[p['name'] for p in index.search(query, limit=3)]}")
+
+
+if __name__ == '__main__':
+    main()
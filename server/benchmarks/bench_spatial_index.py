@@ -0,0 +1,137 @@
+"""Nearest-vendor and delivery-zone lookups with the grid index against linear scans.
+
+Usage: python server/benchmarks/bench_spatial_index.py [--vendors 10000] [--zones 60] [--queries 2000]
+
+Scatters vendors over greater Nairobi with a dense centre, then times per
+query (p50 and p99, microseconds):
+  - k nearest vendors, index against measuring every vendor,
+  - the closest vendors within a radius, the filter behind /api/products?near=,
+  - every vendor within that radius,
+  - which delivery zone contains a point, index against testing every polygon,
+and how many vendor moves per second the index absorbs incrementally.
+Every indexed answer is checked against the great-circle linear scan.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from spatial_index import VendorLocationIndex, DeliveryZoneIndex, haversine_km, point_in_polygon
+
+CENTRE = (-1.2864, 36.8172)
+CITY_DEGREES = 0.25  # roughly 28 km either side
+
+
+def random_point(rng):
+    # Half the vendors crowd the markets near the centre
+    spread = CITY_DEGREES if rng.random() < 0.5 else CITY_DEGREES / 8
+    return CENTRE[0] + rng.uniform(-spread, spread), CENTRE[1] + rng.uniform(-spread, spread)
+
+
+def random_zone(rng, zone_id, vertices):
+    lat, lon = random_point(rng)
+    radius = rng.uniform(0.01, 0.05)
+    polygon = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        r = radius * rng.uniform(0.6, 1.0)
+        polygon.append([lat + r * math.sin(angle), lon + r * math.cos(angle)])
+    return {'id': zone_id, 'name': f'Zone {zone_id}', 'polygon': polygon}
+
+
+def timed(call, queries):
+    samples, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(call(*query))
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)], results
+
+
+def check(name, indexed, linear):
+    """Indexed and great-circle answers must agree to within a few metres"""
+    for got, expected in zip(indexed, linear):
+        # Vendors a few metres from the radius may fall either side of it
+        assert abs(len(got) - len(expected)) <= 2, f"{name} count mismatch"
+        for (_, a), (_, b) in zip(got, expected):
+            assert abs(a - b) < 0.01, f"{name} distance mismatch: {a:.4f} km vs {b:.4f} km"
+
+
+def report(name, indexed, linear):
+    print(f"{name:<22} {indexed[0]:>9.1f} {indexed[1]:>9.1f} {linear[0]:>11.1f} {linear[1]:>11.1f} "
+          f"{linear[0] / indexed[0]:>8.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vendors', type=int, default=10000)
+    parser.add_argument('--zones', type=int, default=60)
+    parser.add_argument('--vertices', type=int, default=32)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--radius-km', type=float, default=3.0)
+    parser.add_argument('--limit', type=int, default=200, help='vendors a near= listing filters on')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    vendors = [(i, *random_point(rng)) for i in range(args.vendors)]
+    index = VendorLocationIndex(lambda: vendors)
+    start = time.perf_counter()
+    index.rebuild()
+    print(f"built vendor index over {len(index)} vendors in {(time.perf_counter() - start) * 1000:.1f} ms")
+    queries = [random_point(rng) for _ in range(args.queries)]
+
+    def linear_nearest(lat, lon):
+        distances = sorted((haversine_km(lat, lon, vlat, vlon), vid) for vid, vlat, vlon in vendors)
+        return [(vid, d) for d, vid in distances[:args.k]]
+
+    def linear_within(lat, lon):
+        found = [(vid, haversine_km(lat, lon, vlat, vlon)) for vid, vlat, vlon in vendors]
+        return sorted(((vid, d) for vid, d in found if d <= args.radius_km), key=lambda pair: (pair[1], pair[0]))
+
+    print(f"{'query':<22} {'p50 us':>9} {'p99 us':>9} {'scan p50 us':>11} {'scan p99 us':>11} {'speedup':>9}")
+    nearest = timed(lambda lat, lon: index.nearest(lat, lon, k=args.k), queries)
+    scan = timed(linear_nearest, queries)
+    check("nearest", nearest[2], scan[2])
+    report(f"nearest k={args.k}", nearest, scan)
+
+    within = timed(lambda lat, lon: index.within(lat, lon, args.radius_km, limit=args.limit), queries)
+    scan = timed(lambda lat, lon: linear_within(lat, lon)[:args.limit], queries)
+    check("within", within[2], scan[2])
+    report(f"{args.limit} within {args.radius_km:g} km", within, scan)
+
+    within = timed(lambda lat, lon: index.within(lat, lon, args.radius_km), queries)
+    scan = timed(linear_within, queries)
+    check("within", within[2], scan[2])
+    report(f"all within {args.radius_km:g} km", within, scan)
+
+    zones = [random_zone(rng, i, args.vertices) for i in range(args.zones)]
+    zone_index = DeliveryZoneIndex(lambda: zones)
+    zone_index.rebuild()
+
+    def linear_locate(lat, lon):
+        return next((z for z in zones if point_in_polygon(lat, lon, z['polygon'])), None)
+
+    located = timed(zone_index.locate, queries)
+    scan = timed(linear_locate, queries)
+    # Zones may overlap; both must agree on whether the point is covered
+    assert [z is None for z in located[2]] == [z is None for z in scan[2]], "zone mismatch"
+    report(f"zone of {args.zones}", located, scan)
+
+    moves = [(rng.randrange(args.vendors), *random_point(rng)) for _ in range(args.queries * 10)]
+    start = time.perf_counter()
+    for vendor_id, lat, lon in moves:
+        index.upsert(vendor_id, lat, lon)
+    elapsed = time.perf_counter() - start
+    print(f"incremental moves: {len(moves) / elapsed:,.0f} per second")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Concurrent SQLite writers with default and tuned engine settings.
+
+Usage: python server/benchmarks/bench_sqlite_writers.py [--workers 4] [--writes 300]
+
+Each worker process stands in for a gunicorn worker and commits small cart
+upserts to one shared SQLite file. The default engine (rollback journal, no
+busy timeout) is compared with the db_engine settings (WAL,
+synchronous=NORMAL, busy timeout); reported are commits per second, "database
+is locked" failures and pool checkout waits.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from models import db, User, Product, Cart
+from cart_store import SqlCartStore
+from db_engine import configure_app_engine, init_engine, pool_metrics
+
+
+def make_app(path, tuned):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    if tuned:
+        configure_app_engine(app, 'production')
+    else:
+        # What SQLAlchemy(app) did before: default pool, sqlite3's own 5s
+        # default timeout switched off so lock contention shows up directly
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 0}}
+    db.init_app(app)
+    if tuned:
+        init_engine(app, db)
+    return app
+
+
+def writer(path, tuned, worker, writes, results):
+    app = make_app(path, tuned)
+    store = SqlCartStore(db, Cart)
+    committed = locked = 0
+    with app.app_context():
+        for i in range(writes):
+            try:
+                store.add(worker + 1, (i % 50) + 1, 1)
+                committed += 1
+            except OperationalError as e:
+                db.session.rollback()
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+        results.put((committed, locked, pool_metrics.snapshot() if tuned else None))
+
+
+def run(workers, writes, tuned):
+    path = os.path.join(tempfile.mkdtemp(), 'writers.db')
+    app = make_app(path, tuned)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(email=f'user{i}@example.com', password='x', role='customer') for i in range(workers)])
+        db.session.commit()
+        db.session.add_all([Product(name=f"Product {i}", price=1.0, vendor_id=1) for i in range(50)])
+        db.session.commit()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=writer, args=(path, tuned, w, writes, results)) for w in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    committed = sum(outcome[0] for outcome in outcomes)
+    locked = sum(outcome[1] for outcome in outcomes)
+    max_wait = max((outcome[2]['wait_ms_max'] for outcome in outcomes if outcome[2]), default=None)
+    return committed / elapsed, locked, max_wait
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"{'engine':<10} {'commits/s':>10} {'locked':>8} {'max pool wait':>14}")
+    for label, tuned in (('default', False), ('tuned', True)):
+        rate, locked, max_wait = run(args.workers, args.writes, tuned)
+        wait = f"{max_wait:.2f} ms" if max_wait is not None else '-'
+        print(f"{label:<10} {rate:>10.0f} {locked:>8} {wait:>14}")
+
+
+if __name__ == '__main__':
+    main()
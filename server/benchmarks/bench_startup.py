@@ -0,0 +1,98 @@
+"""Worker start-up time with lazy create_app() against import-time database setup.
+
+Usage: python server/benchmarks/bench_startup.py [--runs 10] [--products 5000]
+
+Each run starts a fresh interpreter, the way every gunicorn worker boots, and
+times it until the app object is ready. "eager" repeats the work the module
+used to do on import (create_all, vendor lookup, product count, search index
+build) against an already seeded SQLite database; "lazy" is create_app() alone.
+Also checks that the lazy path never opens the database.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY = """
+import time
+start = time.perf_counter()
+from app import create_app
+create_app()
+print((time.perf_counter() - start) * 1000)
+"""
+
+EAGER = """
+import time
+start = time.perf_counter()
+from app import create_app, db, User, Product, password_hasher, search_index
+import seed_data
+app = create_app()
+with app.app_context():
+    db.create_all()
+    seed_data.seed(db, User, Product, password_hasher.rounds)
+    Product.query.count()
+    search_index.rebuild()
+print((time.perf_counter() - start) * 1000)
+"""
+
+SEED = """
+from sqlalchemy import insert
+from app import create_app, db, User, Product
+import seed_data
+app = create_app()
+with app.app_context():
+    db.create_all()
+    seed_data.seed(db, User, Product, 10)
+    db.session.execute(insert(Product), [
+        {'name': f'Product {i}', 'description': 'Bench product', 'price': 1.0 + i % 90, 'vendor_id': 1}
+        for i in range({products})
+    ])
+    db.session.commit()
+"""
+
+
+def run(code, env):
+    out = subprocess.run(
+        [sys.executable, '-c', code], cwd=SERVER_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(out.strip().splitlines()[-1]) if out.strip() else None
+
+
+def median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--products', type=int, default=5000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, CART_STORE_PATH=os.path.join(workdir, 'carts.db'))
+
+    # The lazy path must not create or open the database file
+    untouched = os.path.join(workdir, 'untouched.db')
+    run(LAZY, dict(env, DATABASE_URL='sqlite:///' + untouched))
+    print(f"lazy start-up opened the database: {'yes' if os.path.exists(untouched) else 'no'}")
+
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'startup.db')
+    run(SEED.replace('{products}', str(args.products)), env)
+
+    lazy, eager = [], []
+    for _ in range(args.runs):
+        # Interleaved so both see the same page cache and CPU state
+        lazy.append(run(LAZY, env))
+        eager.append(run(EAGER, env))
+    print(f"{'start-up':<8} {'median':>10} {'max':>10}")
+    print(f"{'eager':<8} {median(eager):>7.1f} ms {max(eager):>7.1f} ms")
+    print(f"{'lazy':<8} {median(lazy):>7.1f} ms {max(lazy):>7.1f} ms")
+    print(f"saved per worker boot: {median(eager) - median(lazy):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Serving the React build: filesystem lookups per request against the startup index.
+
+Usage: python server/benchmarks/bench_static_files.py [--requests 5000] [--build DIR]
+
+Builds a fake CRA build (index.html, hashed JS/CSS chunks, media) unless
+--build points at a real one, precompresses it with compress_tree() and
+replays a browser-like mix of requests: first visits accepting gzip/br,
+revisits with If-None-Match, client-side routes and range requests on media.
+Compared are:
+  - filesystem: os.path.exists + send_from_directory on every request, as
+    the app served the build before,
+  - index: StaticFiles, which negotiates precompressed variants and answers
+    small files from memory.
+Reported per strategy: requests per second, body bytes sent, and how many
+answers were 304s, 206s and compressed.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask, request, send_from_directory
+
+from static_files import StaticFiles, compress_tree
+
+
+def fake_build(root, rng):
+    """A build shaped like react-scripts output, with compressible text"""
+    words = ['order', 'vendor', 'delivery', 'rider', 'cart', 'product', 'price', 'return', 'function', 'const']
+    files = {'index.html': 3_000, 'manifest.json': 500, 'favicon.ico': 4_000}
+    files['static/js/main.3f2a9c1e.js'] = 450_000
+    files['static/css/main.8d1c2b7a.css'] = 40_000
+    for index in range(20):
+        files[f'static/js/{index}.{rng.getrandbits(32):08x}.chunk.js'] = rng.randint(2_000, 60_000)
+    for index in range(5):
+        files[f'static/media/photo{index}.{rng.getrandbits(32):08x}.jpg'] = rng.randint(50_000, 300_000)
+    for name, size in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            if name.endswith(('.jpg', '.ico')):
+                f.write(rng.randbytes(size))
+            else:
+                f.write(' '.join(rng.choice(words) for _ in range(size // 6)).encode()[:size])
+    return root
+
+
+def filesystem_app(root):
+    app = Flask(__name__, static_folder=None)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        if path != "" and os.path.exists(os.path.join(root, path)):
+            return send_from_directory(root, path)
+        return send_from_directory(root, 'index.html')
+
+    return app
+
+
+def index_app(root):
+    app = Flask(__name__, static_folder=None)
+    static_files = StaticFiles(root).load()
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        return static_files.serve(request, path or 'index.html')
+
+    return app
+
+
+def workload(root, count, rng):
+    """(path, headers, revisit) tuples; revisits send the ETag seen before"""
+    assets = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if not name.endswith(('.gz', '.br')):
+                assets.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/'))
+    media = [path for path in assets if path.endswith('.jpg')]
+    routes = ['orders', 'orders/12', 'vendor/products', 'cart', 'checkout']
+    accept = {'Accept-Encoding': 'gzip, deflate, br'}
+    requests = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.45:
+            requests.append((rng.choice(assets), dict(accept), True))
+        elif roll < 0.80:
+            requests.append((rng.choice(assets), dict(accept), False))
+        elif roll < 0.95:
+            requests.append((rng.choice(routes), dict(accept), False))
+        else:
+            start = rng.randint(0, 40_000)
+            requests.append((rng.choice(media), {'Range': f'bytes={start}-{start + 16_383}'}, False))
+    return requests
+
+
+def replay(app, requests):
+    client = app.test_client()
+    etags = {}
+    counts = Counter()
+    sent = 0
+    started = time.perf_counter()
+    for path, headers, revisit in requests:
+        key = (path, headers.get('Accept-Encoding'))
+        if revisit and key in etags:
+            headers = dict(headers, **{'If-None-Match': etags[key]})
+        response = client.get('/' + path, headers=headers)
+        body = response.get_data()
+        sent += len(body)
+        counts[response.status_code] += 1
+        if response.headers.get('Content-Encoding'):
+            counts['compressed'] += 1
+        if response.status_code == 200 and response.headers.get('ETag'):
+            etags[key] = response.headers['ETag']
+    return time.perf_counter() - started, sent, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--build', help='existing React build directory to serve instead of a fake one')
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    root = args.build or fake_build(tempfile.mkdtemp(), rng)
+    files, size_in, size_out = compress_tree(root)
+    print(f"Build at {root}: precompressed {files} files, {size_in:,} → {size_out:,} bytes")
+    requests = workload(root, args.requests, rng)
+
+    print(f"{'strategy':<11} {'req/s':>8} {'MB sent':>8} {'200':>6} {'304':>6} {'206':>6} {'compressed':>11}")
+    for name, build_app in (('filesystem', filesystem_app), ('index', index_app)):
+        elapsed, sent, counts = replay(build_app(root), requests)
+        print(f"{name:<11} {len(requests) / elapsed:>8,.0f} {sent / 1e6:>8.2f} {counts[200]:>6} "
+              f"{counts[304]:>6} {counts[206]:>6} {counts['compressed']:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Threads racing to order one hot product: overselling and throughput.
+
+Usage: python server/benchmarks/bench_stock_contention.py [--threads 16] [--stock 500] [--database-url URL]
+
+Every thread places orders for the same product, one to three units at a
+time, until the product sells out. Compared are:
+  - reserve: place_cart_order, whose conditional
+    UPDATE ... SET stock = stock - :q WHERE stock >= :q decides each sale,
+  - naive: read the stock, check it in Python and write back the
+    difference, the read-modify-write a stock column invites.
+Reported per strategy: units sold against the stock there was, final stock,
+orders per second and how many attempts were rejected or retried on lock
+errors. Exits non-zero if the reserving path ever oversells. Runs on a
+throwaway SQLite file, or on an empty Postgres database with --database-url.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import delete, func, insert
+from sqlalchemy.exc import OperationalError
+
+from db_engine import configure_app_engine, init_engine
+from models import db, User, Product, Order, Job
+from orders import OrderError, place_cart_order
+
+
+def naive_order(customer_id, product_id, quantity):
+    """Check-then-write stock handling: two buyers can both see the last units"""
+    product = db.session.get(Product, product_id)
+    if product.stock < quantity:
+        db.session.rollback()
+        raise OrderError("Insufficient stock", 409)
+    product.stock = product.stock - quantity
+    db.session.add(Order(customer_id=customer_id, product_id=product_id, quantity=quantity, status='processing'))
+    db.session.commit()
+
+
+def reserving_order(customer_id, product_id, quantity):
+    place_cart_order(customer_id, [{'product_id': product_id, 'quantity': quantity}])
+
+
+def race(app, strategy, threads, customers, product_id, stock, seed):
+    with app.app_context():
+        db.session.execute(delete(Job))
+        db.session.execute(delete(Order))
+        product = db.session.get(Product, product_id)
+        product.stock = stock
+        db.session.commit()
+
+    counts = {'orders': 0, 'rejected': 0, 'locked': 0}
+    lock = threading.Lock()
+    start_line = threading.Barrier(threads)
+
+    def buyer(index):
+        rng = random.Random(seed + index)
+        local = {'orders': 0, 'rejected': 0, 'locked': 0}
+        with app.app_context():
+            start_line.wait()
+            sold_out_seen = 0
+            while sold_out_seen < 3:
+                try:
+                    strategy(customers[index % len(customers)], product_id, rng.randint(1, 3))
+                    local['orders'] += 1
+                except OrderError:
+                    db.session.rollback()
+                    local['rejected'] += 1
+                    # Keep trying smaller baskets until even one unit is refused
+                    sold_out_seen += 1
+                except OperationalError:
+                    db.session.rollback()
+                    local['locked'] += 1
+            db.session.remove()
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=buyer, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        sold = db.session.query(func.coalesce(func.sum(Order.quantity), 0)).scalar()
+        remaining = db.session.get(Product, product_id).stock
+    return sold, remaining, elapsed, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='empty Postgres database to use instead of SQLite')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stock.db')
+    )
+    configure_app_engine(app, 'production')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] = args.threads
+    db.init_app(app)
+    init_engine(app, db)
+    Migrate(app, db, directory=os.path.join(SERVER_DIR, 'migrations'))
+    with app.app_context():
+        upgrade()
+        vendor = User(email='vendor@example.com', password='x', role='vendor')
+        db.session.add(vendor)
+        db.session.flush()
+        db.session.execute(insert(User), [
+            {'email': f'customer{i}@example.com', 'password': 'x', 'role': 'customer'} for i in range(args.threads)
+        ])
+        product = Product(name='Tomatoes', price=10.0, vendor_id=vendor.id, stock=args.stock)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+        customers = [user_id for (user_id,) in db.session.query(User.id).filter_by(role='customer')]
+
+    oversold = False
+    print(f"{args.threads} threads, {args.stock} units of one product on {app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+    print(f"{'strategy':<9} {'sold':>6} {'left':>6} {'oversold':>9} {'orders/s':>9} {'rejected':>9} {'lock retries':>13}")
+    for name, strategy in (('reserve', reserving_order), ('naive', naive_order)):
+        sold, remaining, elapsed, counts = race(app, strategy, args.threads, customers, product_id, args.stock, args.seed)
+        over = sold - args.stock
+        print(f"{name:<9} {sold:>6} {remaining:>6} {max(over, 0):>9} {counts['orders'] / elapsed:>9,.0f} "
+              f"{counts['rejected']:>9} {counts['locked']:>13}")
+        if name == 'reserve' and (over > 0 or remaining != args.stock - sold):
+            oversold = True
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == '__main__':
+    main()
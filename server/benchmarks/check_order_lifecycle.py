@@ -0,0 +1,120 @@
+"""Check that orders which ran the whole delivery path through the API get archived.
+
+Usage: python server/benchmarks/check_order_lifecycle.py
+
+Runs the real path against a throwaway SQLite file: `flask seed` adds the
+default vendor and products, a rider is onboarded with `flask add-rider`, and
+a customer orders two products over HTTP and checks out. The job worker
+completes the orders and creates their deliveries, the dispatcher assigns
+both to the rider, and the rider picks both up and delivers one. A second
+customer's order is never paid and expires. archive_orders() must then move
+the delivered and the expired order, and only those, so that
+GET /api/orders?archived=1 lists them and the undelivered one stays in
+GET /api/orders, and the rider must have the delivered order's capacity
+back. Exits non-zero if any step fails, so it can run as a CI gate.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from app import create_app
+from models import db, Product, Order, Delivery, Rider, OrderArchive
+from orders import expire_reservations
+from order_archive import archive_orders
+from dispatch import Dispatcher
+from jobs import Worker
+
+PASSWORD = 'password123'
+
+
+def sign_up(client, cli, email, role='customer', location=(-1.2921, 36.8219)):
+    """Register `email`, onboard it as a rider if asked, sign in and set its location; returns auth headers"""
+    client.post('/api/register', json={'email': email, 'password': PASSWORD, 'role': role if role != 'rider' else 'customer'})
+    if role == 'rider':
+        cli.invoke(args=['add-rider', email])
+    token = client.post('/api/login', json={'email': email, 'password': PASSWORD}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    path = '/api/rider/location' if role == 'rider' else '/api/me/location'
+    client.put(path, json={'latitude': location[0], 'longitude': location[1]}, headers=headers)
+    return headers
+
+
+def run_jobs(app):
+    with app.app_context():
+        while Worker.from_config(app.config).work():
+            pass
+
+
+def main():
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'lifecycle.db'),
+        'BCRYPT_LOG_ROUNDS': 4,
+        'RATE_LIMIT_BACKEND': 'off',
+    })
+    client, cli = app.test_client(), app.test_cli_runner()
+    with app.app_context():
+        db.create_all()
+    cli.invoke(args=['seed'])
+    with app.app_context():
+        product_ids = [product_id for (product_id,) in db.session.query(Product.id).order_by(Product.id).limit(3)]
+
+    rider = sign_up(client, cli, 'rider@example.com', role='rider', location=(-1.2840, 36.8280))
+    client.put('/api/rider/status', json={'status': 'available'}, headers=rider)
+    customer = sign_up(client, cli, 'customer@example.com')
+    unpaid = sign_up(client, cli, 'unpaid@example.com')
+
+    kept = client.post('/api/order', json={'cart_items': [
+        {'product_id': product_ids[0], 'quantity': 1}, {'product_id': product_ids[1], 'quantity': 2},
+    ]}, headers=customer).get_json()['order_ids']
+    expired = client.post('/api/order', json={'cart_items': [{'product_id': product_ids[2], 'quantity': 1}]},
+                          headers=unpaid).get_json()['order_ids']
+    client.post('/api/checkout', headers=customer)
+    run_jobs(app)
+    with app.app_context():
+        dispatched = Dispatcher.from_config(app.config).tick()
+        # The job the unpaid order queued, run early rather than waiting out its TTL
+        expire_reservations(expired)
+        db.session.commit()
+        delivery_ids = dict(db.session.query(Delivery.order_id, Delivery.id).filter(Delivery.order_id.in_(kept)))
+    delivered, in_transit = kept
+    for order_id in kept:
+        client.post(f'/api/rider/deliveries/{delivery_ids[order_id]}/pickup', headers=rider)
+    client.post(f'/api/rider/deliveries/{delivery_ids[delivered]}/delivered', headers=rider)
+
+    with app.app_context():
+        statuses = dict(db.session.query(Order.id, Order.status))
+        delivery_statuses = dict(db.session.query(Delivery.order_id, Delivery.delivery_status))
+        capacity = db.session.query(Rider.capacity).scalar()
+        free = [slots for *_, slots in Dispatcher.from_config(app.config)._free_riders()]
+        archived = archive_orders(datetime.utcnow() + timedelta(days=1))
+        archived_ids = sorted(order_id for (order_id,) in db.session.query(OrderArchive.id))
+    recent = [order['id'] for order in client.get('/api/orders', headers=customer).get_json()]
+    older = [order['id'] for order in client.get('/api/orders?archived=1', headers=customer).get_json()]
+
+    checks = [
+        ('checkout completed', all(statuses[order_id] == 'completed' for order_id in kept)),
+        ('dispatch assigned', dispatched.assigned == len(kept)),
+        ('delivered', delivery_statuses.get(delivered) == 'delivered'),
+        ('in transit', delivery_statuses.get(in_transit) == 'in transit'),
+        ('expired', statuses.get(expired[0]) == 'expired' and delivery_statuses.get(expired[0]) == 'cancelled'),
+        ('capacity freed', free == [capacity - 1]),
+        ('archived', archived == 2 and archived_ids == sorted([delivered, expired[0]])),
+        ('history', recent == [in_transit] and older == [delivered]),
+    ]
+    failed = False
+    for name, ok in checks:
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAIL':<5} {name}")
+    if failed:
+        print(f"      orders={statuses} deliveries={delivery_statuses} free={free} "
+              f"archived={archived_ids} recent={recent} older={older}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
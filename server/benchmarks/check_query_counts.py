@@ -0,0 +1,93 @@
+"""Check that order, cart, checkout, sales and job paths issue a fixed number of SQL statements.
+
+Usage: python server/benchmarks/check_query_counts.py [--sizes 1,20,200]
+
+Each path runs against customers with increasing numbers of rows and must stay
+within its statement budget at every size. Exits non-zero on the first path
+that exceeds its budget, so it can run as a CI gate.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from datetime import date
+
+from flask import Flask
+
+from models import db, User, Product, Order, Cart
+from orders import place_cart_order, order_history, cart_lines, checkout, complete_checkout
+from sales_rollup import sales_report
+from order_archive import archived_history
+from query_counter import assert_max_queries, QueryBudgetExceeded
+
+# Statement budgets per call, independent of row counts
+BUDGETS = {
+    'order_history': 1,      # one projected join
+    'archived_history': 1,   # one projected join on the archive
+    'cart_lines': 1,         # one joined select
+    'checkout': 2,           # processing order ids, job insert
+    'complete_checkout': 4,  # conditional update, sales rollup upsert, orders without delivery, delivery insert
+    'sales_report': 1,       # one range scan of the vendor's rollups
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,20,200')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'queries.db')
+    db.init_app(app)
+
+    failed = False
+    with app.app_context():
+        db.create_all()
+        vendor = User(email='vendor@example.com', password='x', role='vendor')
+        db.session.add(vendor)
+        db.session.commit()
+        vendor_id = vendor.id
+        db.session.add_all([Product(name=f"Product {i}", price=1.0 + i, vendor_id=vendor_id) for i in range(max(sizes))])
+        db.session.commit()
+        product_ids = [product_id for (product_id,) in db.session.query(Product.id)]
+
+        for size in sizes:
+            customer = User(email=f'customer{size}@example.com', password='x', role='customer')
+            db.session.add(customer)
+            db.session.commit()
+            customer_id = customer.id
+            db.session.add_all([Cart(user_id=customer_id, product_id=pid, quantity=1) for pid in product_ids[:size]])
+            db.session.commit()
+            place_cart_order(customer_id, [{'product_id': pid, 'quantity': 1} for pid in product_ids[:size]])
+            order_ids = [order_id for (order_id,) in db.session.query(Order.id).filter_by(customer_id=customer_id)]
+
+            calls = [
+                ('order_history', lambda: order_history(customer_id)),
+                ('archived_history', lambda: archived_history(customer_id)),
+                ('cart_lines', lambda: cart_lines(customer_id)),
+                ('checkout', lambda: checkout(customer_id)),
+                # The job checkout queues, without the worker's commit
+                ('complete_checkout', lambda: complete_checkout(customer_id, order_ids)),
+                ('sales_report', lambda: sales_report(db.session, vendor_id, date(2000, 1, 1), date(2100, 1, 1))),
+            ]
+            for name, call in calls:
+                # Start each call with an empty identity map, like a fresh request
+                db.session.expire_all()
+                try:
+                    with assert_max_queries(db.engine, BUDGETS[name], label=f'{name} with {size} rows') as counter:
+                        call()
+                    print(f"ok    {name:<18} rows={size:<5} statements={counter.count} budget={BUDGETS[name]}")
+                except QueryBudgetExceeded as e:
+                    failed = True
+                    print(f"FAIL  {e}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Check that every hot query is answered from an index, not a table scan.
+
+Usage: python server/benchmarks/check_query_plans.py [--database-url URL]
+
+Builds the schema with the migration chain (flask db upgrade) on a throwaway
+SQLite file, or on an empty Postgres database passed with --database-url,
+seeds it and runs the real order, cart and catalog code paths. Every SELECT,
+INSERT, UPDATE and DELETE they issue is then EXPLAINed with its original
+parameters and must not scan a whole table; a path that issues no statements
+at all fails too, since it checked nothing. Exits non-zero if any fails, so it
+can run as a CI gate after schema changes.
+
+The verdict must not depend on the fixture size: on a small table a scan is
+the cheapest plan even where an index would serve. Postgres is asked with
+enable_seqscan off; SQLite's statistics are scaled up to production-sized
+tables with the seeded rows per key.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import event, insert
+
+from models import db, User, Product, Order, Delivery, Cart, Rider, Job
+from orders import (
+    place_cart_order, order_history, cart_lines, checkout, create_deliveries, complete_checkout, expire_reservations,
+    advance_delivery, DELIVERY_STEPS,
+)
+from catalog_query import parse_product_query, product_page
+from cart_store import SqlCartStore
+from sales_rollup import sales_report
+from order_archive import archive_orders, archived_history
+from dispatch import Dispatcher
+from routing import RoutePlanner
+from jobs import Worker
+
+# SQLite reports seeks as SEARCH; SCAN walks a whole table or index
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)')
+# Rows the planner is told every table holds
+PLANNED_TABLE_ROWS = 1_000_000
+
+
+class StatementLog:
+    """Collects (statement, parameters) pairs issued while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.entries = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+            # A batched INSERT ... VALUES (...), (...) arrives flagged as
+            # executemany with one flat parameter row
+            if executemany and isinstance(parameters[0], (tuple, list, dict)):
+                parameters = parameters[0]
+            self.entries.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+def sqlite_scans(conn, statement, parameters):
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    plan = [row[-1] for row in rows]
+    return [detail for detail in plan if SQLITE_FULL_SCAN.match(detail)], plan
+
+
+def scale_sqlite_stats(conn, rows):
+    """Rewrite ANALYZE's sqlite_stat1 so each table looks `rows` long.
+
+    Only the row counts change; the average rows per index key stay as
+    seeded, so the planner sees a large table with the same selectivity
+    rather than one small enough to read whole.
+    """
+    for tbl, idx, stat in conn.exec_driver_sql('SELECT tbl, idx, stat FROM sqlite_stat1').fetchall():
+        fields = stat.split()
+        fields[0] = str(max(int(fields[0]), rows))
+        conn.exec_driver_sql(
+            'UPDATE sqlite_stat1 SET stat = ? WHERE tbl = ? AND idx IS ?', (' '.join(fields), tbl, idx))
+
+
+def postgres_scans(conn, statement, parameters):
+    raw = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    plan = json.loads(raw) if isinstance(raw, str) else raw
+    scans, lines, stack = [], [], [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        line = f"{node['Node Type']} {node.get('Relation Name', '')}".strip()
+        lines.append(line)
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(line)
+        stack.extend(node.get('Plans', []))
+    return scans, lines
+
+
+def seed(customers, products_per_vendor, orders_per_customer):
+    vendors = [User(email=f'vendor{i}@example.com', password='x', role='vendor') for i in range(10)]
+    shoppers = [User(email=f'customer{i}@example.com', password='x', role='customer') for i in range(customers)]
+    db.session.add_all(vendors + shoppers)
+    db.session.commit()
+    db.session.execute(insert(Product), [
+        {'name': f"Product {v.id}-{i}", 'price': 1.0 + i % 500, 'vendor_id': v.id,
+         'stock': None if i % 4 == 0 else 1000}
+        for v in vendors for i in range(products_per_vendor)
+    ])
+    product_ids = [product_id for (product_id,) in db.session.query(Product.id)]
+    order_ids = db.session.execute(
+        insert(Order).returning(Order.id),
+        [
+            {'customer_id': c.id, 'product_id': product_ids[(c.id * 7 + i) % len(product_ids)],
+             'status': 'completed' if i % 3 else 'processing'}
+            for c in shoppers for i in range(orders_per_customer)
+        ],
+    ).scalars().all()
+    riders = [User(email=f'rider{i}@example.com', password='x', role='rider') for i in range(40)]
+    db.session.add_all(riders)
+    db.session.flush()
+    # Most registered riders are off shift at any moment
+    db.session.execute(insert(Rider), [
+        {'user_id': r.id, 'status': 'available' if i % 4 == 0 else 'offline', 'capacity': 3,
+         'latitude': -1.28, 'longitude': 36.82}
+        for i, r in enumerate(riders)
+    ])
+    rider_ids = [rider_id for (rider_id,) in db.session.query(Rider.id)]
+    # Mostly delivered history, as in production, with a few live deliveries
+    statuses = ('pending', 'assigned', 'in transit') + ('delivered',) * 9
+    db.session.execute(insert(Delivery), [
+        {'order_id': order_id, 'delivery_status': statuses[order_id % len(statuses)],
+         'rider_id': None if order_id % len(statuses) == 0 else rider_ids[order_id % len(rider_ids)],
+         'pickup_latitude': -1.28, 'pickup_longitude': 36.82,
+         'dropoff_stop': None if order_id % 7 == 0 else order_id % 3}
+        for order_id in order_ids
+    ])
+    db.session.execute(insert(Cart), [
+        {'user_id': c.id, 'product_id': product_ids[(c.id + i) % len(product_ids)], 'quantity': 1}
+        for c in shoppers for i in range(5)
+    ])
+    # A long tail of finished jobs with a few queued, running and dead
+    states = ('queued', 'running', 'dead') + ('done',) * 47
+    db.session.execute(insert(Job), [
+        {'task': 'orders.create_deliveries', 'payload': json.dumps({'order_ids': [order_id]}),
+         'status': states[i % len(states)], 'attempts': 1, 'max_attempts': 5,
+         'run_at': datetime(2026, 1, 1), 'created_at': datetime(2026, 1, 1),
+         'locked_at': datetime(2026, 1, 1) if states[i % len(states)] == 'running' else None,
+         'finished_at': datetime(2026, 1, 1) if states[i % len(states)] in ('done', 'dead') else None}
+        for i, order_id in enumerate(order_ids)
+    ])
+    db.session.commit()
+    return shoppers[0].id, vendors[0].id, product_ids
+
+
+def advance_first(status):
+    """Have its rider move the first delivery that can go to `status`"""
+    delivery_id, rider_id = (
+        db.session.query(Delivery.id, Delivery.rider_id)
+        .filter(Delivery.delivery_status == DELIVERY_STEPS[status], Delivery.rider_id.isnot(None))
+        .order_by(Delivery.id)
+        .first()
+    )
+    advance_delivery(rider_id, delivery_id, status)
+
+
+def hot_paths(customer_id, vendor_id, product_ids):
+    cart_store = SqlCartStore(db, Cart)
+    listing = lambda **args: product_page(Product, parse_product_query(args))
+    return [
+        ('login lookup', lambda: User.query.filter_by(email='customer1@example.com').first()),
+        ('products by vendor', lambda: listing(vendor_id=str(vendor_id))),
+        ('products by price', lambda: listing(min_price='480', max_price='490')),
+        ('products by prefix', lambda: listing(q='product 3-1')),
+        ('products nearby', lambda: product_page(
+            Product, parse_product_query({}), vendor_ids=[vendor_id, vendor_id + 1, vendor_id + 2])),
+        ('cart items', lambda: cart_store.items(customer_id)),
+        ('cart lines', lambda: cart_lines(customer_id)),
+        ('cart add', lambda: cart_store.add(customer_id, product_ids[0], 1)),
+        ('cart remove', lambda: cart_store.remove(customer_id, product_ids[0])),
+        ('order history', lambda: order_history(customer_id)),
+        ('order history page 2', lambda: order_history(customer_id, before=10**9)),
+        ('archived history', lambda: archived_history(customer_id, before=10**9)),
+        ('place order', lambda: place_cart_order(
+            customer_id, [{'product_id': product_ids[1], 'quantity': 1}, {'product_id': product_ids[2], 'quantity': 2}],
+            idempotency_key='plan-check')),
+        ('checkout', lambda: checkout(customer_id)),
+        ('vendor sales', lambda: sales_report(db.session, vendor_id, date(2026, 1, 1), date(2026, 12, 31))),
+        ('dispatch batch', lambda: Dispatcher()._pending_deliveries()),
+        ('dispatch riders', lambda: Dispatcher()._free_riders()),
+        ('route riders', lambda: RoutePlanner()._unplanned_riders(1000)),
+        ('route batches', lambda: RoutePlanner()._batches([1, 2, 3])),
+        ('rider pickup', lambda: advance_first('in transit')),
+        ('rider delivered', lambda: advance_first('delivered')),
+        ('cart clear', lambda: cart_store.clear(customer_id)),
+        ('job claim', lambda: Worker().claim()),
+        ('job maintenance', lambda: Worker().maintain()),
+        # The seed's first orders, as the queued order jobs would carry them
+        ('create deliveries', lambda: create_deliveries(list(range(1, 21)))),
+        ('complete checkout', lambda: complete_checkout(customer_id, list(range(1, 21)))),
+        ('expire reservations', lambda: expire_reservations(list(range(21, 41)))),
+        # Last: it moves the finished orders the paths above read
+        ('archive orders', lambda: archive_orders(datetime.utcnow() + timedelta(days=1), batch_size=500)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='empty Postgres database to check instead of SQLite')
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--products-per-vendor', type=int, default=500)
+    parser.add_argument('--orders-per-customer', type=int, default=20)
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans.db')
+    )
+    db.init_app(app)
+    Migrate(app, db, directory=os.path.join(SERVER_DIR, 'migrations'))
+
+    failed = False
+    with app.app_context():
+        upgrade()
+        customer_id, vendor_id, product_ids = seed(args.customers, args.products_per_vendor, args.orders_per_customer)
+        dialect = db.engine.dialect.name
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+            if dialect == 'sqlite':
+                scale_sqlite_stats(conn, PLANNED_TABLE_ROWS)
+        # Statistics are read when a connection loads the schema
+        db.session.remove()
+        db.engine.dispose()
+
+        for name, call in hot_paths(customer_id, vendor_id, product_ids):
+            db.session.expire_all()
+            with StatementLog(db.engine) as log:
+                call()
+            scanned, plans = [], []
+            with db.engine.connect() as conn:
+                if dialect == 'postgresql':
+                    # Small tables make a sequential scan look cheapest; ask
+                    # whether an index could serve the query at all
+                    conn.exec_driver_sql('SET enable_seqscan = off')
+                explain = postgres_scans if dialect == 'postgresql' else sqlite_scans
+                for statement, parameters in log.entries:
+                    scans, plan = explain(conn, statement, parameters)
+                    sql = ' '.join(statement.split())
+                    if scans:
+                        scanned.append(f"      {'; '.join(scans)}: {sql}")
+                    plans.append(f"      {sql}\n        " + '\n        '.join(plan))
+            ok = log.entries and not scanned
+            failed = failed or not ok
+            print(f"{'ok' if ok else 'FAIL':<5} {name:<22} statements={len(log.entries)}")
+            for line in scanned or (plans if args.verbose else []):
+                print(line)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+
+from sqlalchemy import select
+
+
+class MemoryCartStore:
+    """Carts held in this process only, keyed by user then product.
+
+    Fast and dependency free, but each gunicorn worker has its own copy and
+    everything is lost on restart; use it for development and tests.
+    """
+
+    def __init__(self):
+        self._carts = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def items(self, user_id):
+        """Return {product_id: quantity} for the user's cart"""
+        with self._lock:
+            return dict(self._carts.get(user_id, {}))
+
+    def add(self, user_id, product_id, quantity):
+        """Add `quantity` of a product and return the new line quantity"""
+        with self._lock:
+            cart = self._carts[user_id]
+            cart[product_id] = cart.get(product_id, 0) + quantity
+            return cart[product_id]
+
+    def set(self, user_id, product_id, quantity):
+        if quantity <= 0:
+            return self.remove(user_id, product_id)
+        with self._lock:
+            self._carts[user_id][product_id] = quantity
+        return True
+
+    def remove(self, user_id, product_id):
+        """Drop a product from the cart; False if it was not there"""
+        with self._lock:
+            return self._carts.get(user_id, {}).pop(product_id, None) is not None
+
+    def clear(self, user_id):
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+
+class SqlCartStore:
+    """Carts stored in the application database through the Cart model.
+
+    Every line is one (user_id, product_id) row, so adds are a single
+    INSERT ... ON CONFLICT DO UPDATE against the unique index on those
+    columns and removes are a keyed DELETE. Works on SQLite and Postgres.
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    def _insert(self):
+        dialect = self.db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise NotImplementedError(f"Cart upserts are not supported on {dialect}")
+        return insert(self.model.__table__)
+
+    def items(self, user_id):
+        table = self.model.__table__
+        rows = self.db.session.execute(
+            select(table.c.product_id, table.c.quantity)
+            .where(table.c.user_id == int(user_id))
+            .order_by(table.c.id)
+        )
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def add(self, user_id, product_id, quantity):
+        table = self.model.__table__
+        stmt = self._insert().values(user_id=int(user_id), product_id=product_id, quantity=quantity)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.product_id],
+            set_={'quantity': table.c.quantity + stmt.excluded.quantity},
+        ).returning(table.c.quantity)
+        new_quantity = self.db.session.execute(stmt).scalar_one()
+        self.db.session.commit()
+        return new_quantity
+
+    def set(self, user_id, product_id, quantity):
+        if quantity <= 0:
+            return self.remove(user_id, product_id)
+        table = self.model.__table__
+        stmt = self._insert().values(user_id=int(user_id), product_id=product_id, quantity=quantity)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.product_id],
+            set_={'quantity': stmt.excluded.quantity},
+        )
+        self.db.session.execute(stmt)
+        self.db.session.commit()
+        return True
+
+    def remove(self, user_id, product_id):
+        table = self.model.__table__
+        result = self.db.session.execute(
+            table.delete().where(table.c.user_id == int(user_id), table.c.product_id == product_id)
+        )
+        self.db.session.commit()
+        return result.rowcount > 0
+
+    def clear(self, user_id):
+        table = self.model.__table__
+        self.db.session.execute(table.delete().where(table.c.user_id == int(user_id)))
+        self.db.session.commit()
+
+
+class FileCartStore:
+    """Carts in a local SQLite file shared by all workers on one host.
+
+    For single-host multi-worker deployments that should not put cart churn on
+    the main database. The file runs in WAL mode so readers never block the
+    writer, and (user_id, product_id) is the primary key of a WITHOUT ROWID
+    table, so every operation is a single keyed lookup.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cart ('
+            ' user_id TEXT NOT NULL,'
+            ' product_id INTEGER NOT NULL,'
+            ' quantity INTEGER NOT NULL,'
+            ' PRIMARY KEY (user_id, product_id)'
+            ') WITHOUT ROWID'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def items(self, user_id):
+        rows = self._connection().execute(
+            'SELECT product_id, quantity FROM cart WHERE user_id = ?', (str(user_id),)
+        )
+        return dict(rows.fetchall())
+
+    def add(self, user_id, product_id, quantity):
+        row = self._connection().execute(
+            'INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?) '
+            'ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity '
+            'RETURNING quantity',
+            (str(user_id), product_id, quantity),
+        ).fetchone()
+        return row[0]
+
+    def set(self, user_id, product_id, quantity):
+        if quantity <= 0:
+            return self.remove(user_id, product_id)
+        self._connection().execute(
+            'INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?) '
+            'ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = excluded.quantity',
+            (str(user_id), product_id, quantity),
+        )
+        return True
+
+    def remove(self, user_id, product_id):
+        cursor = self._connection().execute(
+            'DELETE FROM cart WHERE user_id = ? AND product_id = ?', (str(user_id), product_id)
+        )
+        return cursor.rowcount > 0
+
+    def clear(self, user_id):
+        self._connection().execute('DELETE FROM cart WHERE user_id = ?', (str(user_id),))
+
+
+def create_cart_store(backend, db=None, model=None, path=None):
+    """Build the cart store named by `backend`: memory, sql or file"""
+    if backend == 'memory':
+        return MemoryCartStore()
+    if backend == 'sql':
+        if db is None or model is None:
+            raise ValueError("The sql cart backend needs a database and a Cart model")
+        return SqlCartStore(db, model)
+    if backend == 'file':
+        return FileCartStore(path or 'carts.db')
+    raise ValueError(f"Unknown cart backend: {backend}")
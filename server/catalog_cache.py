@@ -0,0 +1,115 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class CatalogEntry:
+    """Serialized catalog snapshot for one catalog version"""
+
+    __slots__ = ('version', 'body', 'etag', 'meta', 'built_at')
+
+    def __init__(self, version, body, etag, meta, built_at):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.meta = meta
+        self.built_at = built_at
+
+
+class CatalogCache:
+    """In-process cache of the product catalog as ready-to-send JSON bytes.
+
+    `loader(key)` returns a `(payload, meta)` pair for one catalog view, e.g.
+    one page of a filtered listing; `payload` is serialized and `meta` is kept
+    alongside it. The cache tracks a catalog version that is bumped after every
+    commit that inserted, updated or deleted a watched model, so readers only
+    rebuild when the catalog really changed. `ttl` (seconds) bounds how long a
+    snapshot is trusted, which covers changes committed by other worker
+    processes. At most `max_entries` views are kept, least recently used first
+    out.
+    """
+
+    def __init__(self, loader, ttl=None, enabled=True, max_entries=256):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._models = ()
+        self.version = 0
+        self.ttl = ttl
+        self.enabled = enabled
+        self.max_entries = max_entries
+
+    def watch(self, *models):
+        """Invalidate the cache whenever rows of `models` change"""
+        if not self._models:
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'do_orm_execute', self._do_orm_execute)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_soft_rollback', self._after_rollback)
+        self._models = self._models + tuple(models)
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def current(self, key=None):
+        """Return the cached entry for `key` if it is still valid, without loading"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != self.version:
+                return None
+            if self.ttl is not None and time.monotonic() - entry.built_at > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key=None):
+        """Return the current entry for `key`, rebuilding it from the loader if stale"""
+        entry = self.current(key)
+        if entry is not None:
+            return entry
+        # Capture the version before loading so a commit that lands while we
+        # query leaves this snapshot marked stale instead of masking the change.
+        version = self.version
+        payload, meta = self._loader(key)
+        body = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        entry = CatalogEntry(version, body, hashlib.sha256(body).hexdigest()[:32], meta, time.monotonic())
+        if self.enabled:
+            with self._lock:
+                if version == self.version:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return entry
+
+    def _touches_catalog(self, objects):
+        return any(isinstance(obj, self._models) for obj in objects)
+
+    def _after_flush(self, session, flush_context):
+        if (self._touches_catalog(session.new) or self._touches_catalog(session.dirty)
+                or self._touches_catalog(session.deleted)):
+            session.info['catalog_changed'] = True
+
+    def _do_orm_execute(self, orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and issubclass(mapper.class_, self._models):
+            orm_execute_state.session.info['catalog_changed'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('catalog_changed', False):
+            self.invalidate()
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('catalog_changed', None)
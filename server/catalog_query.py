@@ -0,0 +1,128 @@
+import base64
+import binascii
+
+from sqlalchemy import func
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 50.0
+
+
+class CatalogQueryError(ValueError):
+    """Raised when product listing parameters cannot be parsed"""
+
+
+def encode_cursor(last_id):
+    """Opaque cursor pointing just past the product with id `last_id`"""
+    return base64.urlsafe_b64encode(str(last_id).encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise CatalogQueryError("Invalid cursor")
+
+
+def _number(args, name, cast):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise CatalogQueryError(f"Invalid {name}")
+
+
+def parse_location(value):
+    """Parse a "latitude,longitude" pair"""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except ValueError:
+        raise CatalogQueryError("Invalid location, expected latitude,longitude")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise CatalogQueryError("Location out of range")
+    return lat, lon
+
+
+def _near(args):
+    near = args.get('near')
+    if not near:
+        return None
+    lat, lon = parse_location(near)
+    radius = _number(args, 'radius_km', float)
+    if radius is None:
+        radius = DEFAULT_RADIUS_KM
+    if radius <= 0:
+        raise CatalogQueryError("radius_km must be positive")
+    # Rounded to about 100 m so nearby shoppers share cache entries
+    return round(lat, 3), round(lon, 3), min(radius, MAX_RADIUS_KM)
+
+
+def parse_product_query(args):
+    """Normalize listing parameters from a request's query string.
+
+    Returns a hashable tuple (after_id, limit, vendor_id, min_price, max_price,
+    prefix, near) that doubles as the catalog cache key; `near` is None or a
+    (latitude, longitude, radius_km) triple.
+    """
+    cursor = args.get('cursor')
+    after_id = decode_cursor(cursor) if cursor else 0
+
+    limit = _number(args, 'limit', int)
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise CatalogQueryError("limit must be positive")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    vendor_id = _number(args, 'vendor_id', int)
+    min_price = _number(args, 'min_price', float)
+    max_price = _number(args, 'max_price', float)
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise CatalogQueryError("min_price cannot be greater than max_price")
+
+    prefix = (args.get('q') or '').strip().lower() or None
+    return (after_id, limit, vendor_id, min_price, max_price, prefix, _near(args))
+
+
+def product_page(model, params, vendor_ids=None):
+    """Fetch one keyset page of `model` rows for parsed `params`.
+
+    Filters are pushed into SQL and the page is read as `id > after_id ORDER BY
+    id LIMIT n`, so any page costs the same as the first one. `vendor_ids`,
+    when given, limits the page to those vendors; callers resolve `near` to
+    vendor ids with the spatial index. Returns the rows and the cursor for
+    the next page, or None on the last page.
+    """
+    after_id, limit, vendor_id, min_price, max_price, prefix, _ = params
+    if vendor_ids is not None and not vendor_ids:
+        return [], None
+    query = model.query.filter(model.id > after_id)
+    if vendor_id is not None:
+        query = query.filter(model.vendor_id == vendor_id)
+    if vendor_ids is not None:
+        query = query.filter(model.vendor_id.in_(vendor_ids))
+    if min_price is not None:
+        query = query.filter(model.price >= min_price)
+    if max_price is not None:
+        query = query.filter(model.price <= max_price)
+    if prefix:
+        # Range scan on lower(name) so the expression index can serve it,
+        # unlike ILIKE which forces a full scan.
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        name_key = func.lower(model.name)
+        query = query.filter(name_key >= prefix, name_key < upper)
+
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def add_pagination_headers(response, next_cursor):
+    """Expose the next cursor without changing the JSON array body"""
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# Per-environment engine settings, selected by APP_ENV and overridable one by
+# one through DB_* environment variables. Production keeps few connections
+# per worker (Render Postgres allows ~100 across all workers), recycles them
+# before the server-side idle timeout and bounds every statement.
+ENGINE_PROFILES = {
+    'development': {
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_timeout': 10.0,
+        'pool_recycle': 1800,
+        'pool_pre_ping': False,
+        'statement_timeout_ms': 0,
+        'sqlite_busy_timeout_ms': 5000,
+    },
+    'production': {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 5.0,
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+        'statement_timeout_ms': 15000,
+        'sqlite_busy_timeout_ms': 5000,
+    },
+}
+
+# Upper bounds in milliseconds of the checkout-wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def normalize_database_url(url):
+    """Render and Heroku hand out postgres:// URLs, which SQLAlchemy rejects"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _setting(settings, environ, name, cast):
+    value = environ.get('DB_' + name.upper())
+    if value is None or value == '':
+        return settings[name]
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+
+def engine_settings(environment=None, environ=os.environ):
+    """The profile for `environment` (default APP_ENV) with DB_* overrides applied"""
+    environment = environment or environ.get('APP_ENV', 'development')
+    if environment not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown APP_ENV {environment!r}, expected one of {', '.join(ENGINE_PROFILES)}")
+    profile = ENGINE_PROFILES[environment]
+    return {name: _setting(profile, environ, name, type(default)) for name, default in profile.items()}
+
+
+def engine_options(database_url, settings):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url` under `settings`"""
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite':
+        if not url.database or url.database == ':memory:':
+            # In-memory databases live in their single connection
+            return {}
+        return {
+            'poolclass': TimedQueuePool,
+            'pool_size': settings['pool_size'],
+            'max_overflow': settings['max_overflow'],
+            'pool_timeout': settings['pool_timeout'],
+            # sqlite3 waits this long on a locked database before raising
+            'connect_args': {'timeout': settings['sqlite_busy_timeout_ms'] / 1000.0},
+        }
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': settings['pool_size'],
+        'max_overflow': settings['max_overflow'],
+        'pool_timeout': settings['pool_timeout'],
+        'pool_recycle': settings['pool_recycle'],
+        'pool_pre_ping': settings['pool_pre_ping'],
+    }
+    if url.get_backend_name() == 'postgresql' and settings['statement_timeout_ms']:
+        options['connect_args'] = {'options': f"-c statement_timeout={settings['statement_timeout_ms']}"}
+    return options
+
+
+def _sqlite_pragmas(busy_timeout_ms):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers carry on while one worker writes; NORMAL only
+        # syncs at checkpoints, which is still safe against corruption in WAL
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+    return on_connect
+
+
+class PoolMetrics:
+    """Connection pool checkout waits, for sizing pools and workers.
+
+    Waits are the time a request spent getting a connection from the pool,
+    including opening a new one; a growing tail means the pool is too small
+    for the worker's concurrency. Counts are per process.
+    """
+
+    def __init__(self, buckets=WAIT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._pools = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.bucket_counts = [0] * (len(self.buckets) + 1)
+
+    def track(self, pool):
+        with self._lock:
+            self._pools.append(pool)
+
+    def untrack(self, pool):
+        with self._lock:
+            if pool in self._pools:
+                self._pools.remove(pool)
+
+    def record(self, wait_ms, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.bucket_counts[bisect_left(self.buckets, wait_ms)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            pools = [
+                {
+                    'size': pool.size(),
+                    'checked_out': pool.checkedout(),
+                    'idle': pool.checkedin(),
+                    'overflow': max(0, pool.overflow()),
+                }
+                for pool in self._pools
+            ]
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            cumulative, running = {}, 0
+            for bound, count in zip(bounds, self.bucket_counts):
+                running += count
+                cumulative[bound] = running
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_total_ms, 3),
+                'wait_ms_max': round(self.wait_max_ms, 3),
+                'wait_ms_avg': round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_ms_buckets': cumulative,
+                'pools': pools,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited to pool_metrics"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_metrics.track(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        pool_metrics.record((time.perf_counter() - start) * 1000)
+        return connection
+
+    def dispose(self):
+        super().dispose()
+        pool_metrics.untrack(self)
+
+
+def configure_app_engine(app, environment=None):
+    """Set the database URL and engine options on `app` before SQLAlchemy(app).
+
+    The resolved settings are kept in DB_ENGINE_SETTINGS for init_engine().
+    """
+    settings = engine_settings(environment)
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], settings)
+    app.config['DB_ENGINE_SETTINGS'] = settings
+    return settings
+
+
+def init_engine(app, db):
+    """Install per-connection setup on the engine `db` built for `app`"""
+    settings = app.config['DB_ENGINE_SETTINGS']
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_pragmas(settings['sqlite_busy_timeout_ms']))
+    app.extensions['pool_metrics'] = pool_metrics
+    return engine
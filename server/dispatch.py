@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import bindparam, func, update
+
+from models import db, Order, Delivery, Rider, RiderLocation, ACTIVE_DELIVERY_STATUSES
+from order_events import event_bus, order_event
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional; without it every batch is assigned greedily
+    linear_sum_assignment = None
+
+log = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+# Largest orders x rider-slots matrix solved optimally; the Hungarian method
+# is cubic, so bigger batches use the greedy assignment
+HUNGARIAN_MAX_CELLS = 250_000
+# Nearest riders considered per order in each greedy round
+GREEDY_CANDIDATES = 8
+
+
+def _unit_vectors(points):
+    points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    cos_lat = np.cos(points[:, 0])
+    return np.column_stack([cos_lat * np.cos(points[:, 1]), cos_lat * np.sin(points[:, 1]), np.sin(points[:, 0])])
+
+
+def distance_matrix(origins, destinations):
+    """Great-circle distances in km between every origin and destination.
+
+    Both arguments are (n, 2) arrays of (latitude, longitude) in degrees; the
+    result is an (n_origins, n_destinations) float32 matrix. Points become
+    unit vectors so all pairwise work is one matrix product, and the
+    haversine term follows from it as sin^2(d/2) = (1 - cos d) / 2.
+    """
+    dot = _unit_vectors(origins) @ _unit_vectors(destinations).T
+    half_chord = np.sqrt(np.clip((1.0 - dot) * 0.5, 0.0, 1.0))
+    return (2 * EARTH_RADIUS_KM * np.arcsin(half_chord)).astype(np.float32)
+
+
+def assign_greedy(cost, slots, candidates=GREEDY_CANDIDATES):
+    """Assign rows (orders) to columns (riders) cheapest pair first.
+
+    `slots[j]` is how many rows column j may still take; infinite costs are
+    never assigned. Each round only ranks every open row's `candidates`
+    nearest open columns, so a 10k x 1k matrix sorts 80k pairs rather than
+    10M. Returns an array with the column of each row, or -1.
+    """
+    n_rows, _ = cost.shape
+    remaining = np.asarray(slots, dtype=np.int64).copy()
+    assignment = np.full(n_rows, -1, dtype=np.int64)
+    open_rows = np.arange(n_rows)
+    while open_rows.size:
+        open_cols = np.flatnonzero(remaining > 0)
+        if not open_cols.size:
+            break
+        sub = cost[np.ix_(open_rows, open_cols)]
+        k = min(candidates, open_cols.size)
+        if k < open_cols.size:
+            nearest = np.argpartition(sub, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(k), sub.shape)
+        near_cost = np.take_along_axis(sub, nearest, axis=1).ravel()
+        ranked = np.argsort(near_cost, kind='stable')
+        ranked = ranked[np.isfinite(near_cost[ranked])]
+        rows = open_rows[ranked // k].tolist()
+        cols = open_cols[nearest.ravel()[ranked]].tolist()
+
+        progress = False
+        for row, col in zip(rows, cols):
+            if assignment[row] == -1 and remaining[col] > 0:
+                assignment[row] = col
+                remaining[col] -= 1
+                progress = True
+        if not progress:
+            # Every remaining row is out of reach of every open column
+            break
+        open_rows = open_rows[assignment[open_rows] == -1]
+    return assignment
+
+
+def assign_hungarian(cost, slots):
+    """Minimum total distance assignment, one column per free rider slot"""
+    slot_cols = np.repeat(np.arange(cost.shape[1]), np.asarray(slots, dtype=np.int64))
+    if not slot_cols.size or not cost.shape[0]:
+        return np.full(cost.shape[0], -1, dtype=np.int64)
+    expanded = cost[:, slot_cols]
+    finite = np.isfinite(expanded)
+    # Unreachable pairs get a cost no real assignment can beat, then are dropped
+    penalty = (float(expanded[finite].max()) + 1.0) * max(expanded.shape) if finite.any() else 1.0
+    rows, cols = linear_sum_assignment(np.where(finite, expanded, penalty))
+    assignment = np.full(cost.shape[0], -1, dtype=np.int64)
+    reachable = finite[rows, cols]
+    assignment[rows[reachable]] = slot_cols[cols[reachable]]
+    return assignment
+
+
+def resolve_method(cost, slots, method='auto'):
+    """The concrete method `auto` stands for on this batch"""
+    if method != 'auto':
+        return method
+    small = cost.shape[0] * int(np.sum(slots)) <= HUNGARIAN_MAX_CELLS
+    return 'hungarian' if small and linear_sum_assignment is not None else 'greedy'
+
+
+def assign(cost, slots, method='auto'):
+    """Assign orders to riders with `method`: auto, greedy or hungarian"""
+    method = resolve_method(cost, slots, method)
+    if method == 'hungarian':
+        if linear_sum_assignment is None:
+            raise RuntimeError("Hungarian assignment needs scipy")
+        return assign_hungarian(cost, slots)
+    if method == 'greedy':
+        return assign_greedy(cost, slots)
+    raise ValueError(f"Unknown assignment method: {method}")
+
+
+@dataclass
+class DispatchResult:
+    pending: int
+    riders: int
+    assigned: int
+    method: str
+    elapsed_ms: float
+    # Riders whose route was re-planned after this batch
+    routed: int = 0
+
+
+class Dispatcher:
+    """Assigns ready deliveries to available riders in periodic batches.
+
+    Each tick reads every checked-out order still waiting for a rider and
+    every available rider with free capacity, builds one rider-to-pickup
+    distance matrix and assigns the whole batch at once; nothing is assigned
+    order by order. Orders no rider can reach within `max_distance_km` wait
+    for a later tick. With a `planner` (see routing.RoutePlanner) each tick
+    then re-plans the routes of riders who gained deliveries, spending at
+    most `planning_budget_ms` so routing never delays the next batch. Run
+    one dispatcher per database, e.g. `flask dispatch`.
+    """
+
+    def __init__(self, batch_size=10000, max_distance_km=15.0, method='auto', planner=None,
+                 planning_budget_ms=2000):
+        self.batch_size = batch_size
+        self.max_distance_km = max_distance_km
+        self.method = method
+        self.planner = planner
+        self.planning_budget_ms = planning_budget_ms
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config, planner=None):
+        return cls(
+            batch_size=config.get('DISPATCH_BATCH_SIZE', 10000),
+            max_distance_km=config.get('DISPATCH_MAX_DISTANCE_KM', 15.0),
+            method=config.get('DISPATCH_METHOD', 'auto'),
+            planner=planner,
+            planning_budget_ms=config.get('ROUTE_PLANNING_BUDGET_MS', 2000),
+        )
+
+    def _pending_deliveries(self):
+        return (
+            db.session.query(
+                Delivery.id, Delivery.pickup_latitude, Delivery.pickup_longitude, Order.id, Order.customer_id
+            )
+            .join(Order, Order.id == Delivery.order_id)
+            .filter(
+                Delivery.delivery_status == 'pending',
+                Order.status == 'completed',
+                Delivery.pickup_latitude.isnot(None),
+                Delivery.pickup_longitude.isnot(None),
+            )
+            .order_by(Delivery.id)
+            .limit(self.batch_size)
+            .all()
+        )
+
+    def _free_riders(self):
+        active = (
+            db.session.query(Delivery.rider_id, func.count(Delivery.id).label('active'))
+            .filter(Delivery.rider_id.isnot(None), Delivery.delivery_status.in_(ACTIVE_DELIVERY_STATUSES))
+            .group_by(Delivery.rider_id)
+            .subquery()
+        )
+        free = Rider.capacity - func.coalesce(active.c.active, 0)
+        return (
+            db.session.query(Rider.id, Rider.latitude, Rider.longitude, free)
+            .outerjoin(active, active.c.rider_id == Rider.id)
+            .filter(Rider.status == 'available', Rider.latitude.isnot(None), Rider.longitude.isnot(None), free > 0)
+            .all()
+        )
+
+    def tick(self):
+        """Assign one batch and commit it; returns a DispatchResult"""
+        start = time.perf_counter()
+        deliveries = self._pending_deliveries()
+        riders = self._free_riders()
+        if not deliveries or not riders:
+            db.session.rollback()
+            routed = self._plan_routes()
+            return DispatchResult(
+                len(deliveries), len(riders), 0, 'none', (time.perf_counter() - start) * 1000, routed
+            )
+
+        pickups = np.array([(lat, lon) for _, lat, lon, *_ in deliveries], dtype=np.float64)
+        positions = np.array([(lat, lon) for _, lat, lon, _ in riders], dtype=np.float64)
+        slots = np.array([free for *_, free in riders], dtype=np.int64)
+        cost = distance_matrix(pickups, positions)
+        if self.max_distance_km:
+            cost[cost > self.max_distance_km] = np.inf
+        method = resolve_method(cost, slots, self.method)
+        assignment = assign(cost, slots, method)
+
+        now = datetime.utcnow()
+        params = []
+        for i, j in enumerate(assignment.tolist()):
+            if j >= 0:
+                delivery_id, _, _, order_id, customer_id = deliveries[i]
+                params.append({'delivery_id': delivery_id, 'assigned_rider': riders[j][0]})
+                event_bus.publish(db.session, order_event(
+                    customer_id, order_id, delivery_status='assigned', rider_id=riders[j][0]
+                ))
+        if params:
+            # Conditional on the row still being pending, so a delivery that
+            # changed since it was read is skipped rather than reassigned. Only
+            # the dispatcher moves deliveries out of pending, so in practice
+            # every row matches and every published event holds.
+            table = Delivery.__table__
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('delivery_id'), table.c.delivery_status == 'pending')
+                .values(rider_id=bindparam('assigned_rider'), delivery_status='assigned', assigned_at=now),
+                params,
+            )
+        db.session.commit()
+        routed = self._plan_routes()
+        return DispatchResult(
+            len(deliveries), len(riders), len(params), method, (time.perf_counter() - start) * 1000, routed
+        )
+
+    def _plan_routes(self):
+        if self.planner is None:
+            return 0
+        return self.planner.plan_pending(self.planning_budget_ms)
+
+    def run(self, interval, on_tick=None):
+        """Tick every `interval` seconds until stop() is called"""
+        self._stop.clear()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                result = self.tick()
+                if on_tick:
+                    on_tick(result)
+            except Exception:
+                # A failed tick leaves its batch pending for the next one
+                db.session.rollback()
+                log.exception("Dispatch tick failed")
+            finally:
+                db.session.remove()
+            self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    def stop(self):
+        self._stop.set()
+
+
+def record_rider_location(rider_id, latitude, longitude):
+    """Store a rider's position report and make it their current location"""
+    now = datetime.utcnow()
+    db.session.add(RiderLocation(rider_id=rider_id, latitude=latitude, longitude=longitude, recorded_at=now))
+    db.session.execute(
+        update(Rider).where(Rider.id == rider_id)
+        .values(latitude=latitude, longitude=longitude, location_updated_at=now)
+    )
+    db.session.commit()
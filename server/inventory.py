@@ -0,0 +1,86 @@
+from collections import Counter
+
+from sqlalchemy import case, update
+
+from models import Product
+
+# Stock moves go through the product table rather than the Product entity:
+# nothing the catalog cache or search index holds depends on stock, and ORM
+# bulk updates of Product would invalidate both on every order.
+products = Product.__table__
+
+
+class InsufficientStock(Exception):
+    """Raised when products cannot cover the quantities asked for"""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Insufficient stock for products: {', '.join(map(str, product_ids))}")
+        self.product_ids = product_ids
+
+
+def totals(lines):
+    """Sum (product_id, quantity) pairs into {product_id: quantity}"""
+    counter = Counter()
+    for product_id, quantity in lines:
+        counter[product_id] += quantity
+    return dict(counter)
+
+
+def _per_product(quantities):
+    return case(quantities, value=products.c.id)
+
+
+def reserve(session, quantities):
+    """Take {product_id: quantity} out of stock in one conditional UPDATE.
+
+    Each row is decremented only while its stock covers the quantity, so
+    concurrent reservations can never take stock below zero: the database
+    re-checks the condition against the latest committed stock under the
+    row lock. Only pass products whose stock is tracked. Raises
+    InsufficientStock naming the products that fell short; the rows that
+    were decremented are left for the caller to roll back with its
+    transaction.
+    """
+    if not quantities:
+        return
+    amount = _per_product(quantities)
+    reserved = session.execute(
+        update(products)
+        .where(products.c.id.in_(list(quantities)), products.c.stock >= amount)
+        .values(stock=products.c.stock - amount)
+        .returning(products.c.id)
+    ).scalars().all()
+    short = set(quantities) - set(reserved)
+    if short:
+        raise InsufficientStock(sorted(short, key=str))
+
+
+def release(session, quantities):
+    """Put {product_id: quantity} back into stock in one UPDATE"""
+    if not quantities:
+        return
+    amount = _per_product(quantities)
+    session.execute(
+        update(products)
+        .where(products.c.id.in_(list(quantities)), products.c.stock.isnot(None))
+        .values(stock=products.c.stock + amount)
+    )
+
+
+def set_stock(session, product_id, vendor_id, stock=None, add=None):
+    """Set a vendor's product stock, or add to it atomically.
+
+    `stock` replaces the level (None stops tracking it); `add` adjusts the
+    current level in place, so a restock never overwrites reservations made
+    meanwhile. Returns the new level, or False when the vendor has no such
+    product.
+    """
+    statement = update(products).where(products.c.id == product_id, products.c.vendor_id == vendor_id)
+    if add is not None:
+        statement = statement.values(stock=case(
+            (products.c.stock.is_(None), add), else_=products.c.stock + add,
+        ))
+    else:
+        statement = statement.values(stock=stock)
+    row = session.execute(statement.returning(products.c.stock)).first()
+    return False if row is None else row.stock
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, select, update
+
+from models import db, Job
+
+# Seconds before a failed job's first retry; doubles with each attempt
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+# Characters of a failure kept in last_error
+MAX_ERROR_LENGTH = 2000
+# Seconds between reclaiming stalled jobs and pruning finished ones
+MAINTENANCE_INTERVAL = 60.0
+
+log = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(name):
+    """Register the decorated function as the task `name`.
+
+    A task is called with its job's payload as keyword arguments. It makes its
+    changes in db.session and does not commit: the worker commits them
+    together with marking the job done, so a job's effects land exactly when
+    it completes. A job may still run more than once (a worker can die after
+    the task's side effects outside the database), so tasks are idempotent.
+    """
+    def register(function):
+        _tasks[name] = function
+        return function
+    return register
+
+
+def enqueue(session, name, payload=None, delay=0, max_attempts=5, queue='default'):
+    """Add a job to `session`'s transaction; workers see it once that commits"""
+    if name not in _tasks:
+        raise LookupError(f"Unknown task {name}")
+    job = Job(
+        queue=queue, task=name, payload=json.dumps(payload or {}), status='queued', attempts=0,
+        max_attempts=max_attempts, run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    session.add(job)
+    return job
+
+
+def backoff(attempts, base=BACKOFF_BASE, limit=BACKOFF_MAX):
+    """Seconds to wait before retrying a job that has failed `attempts` times.
+
+    Exponential with jitter, so jobs that failed together on a shared outage
+    do not all come back at the same moment.
+    """
+    return min(limit, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+def queue_counts():
+    """Number of jobs per status"""
+    return dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+
+
+def requeue_dead(job_ids=None):
+    """Give dead jobs (all, or those in `job_ids`) a fresh set of attempts; returns how many"""
+    statement = update(Job).where(Job.status == 'dead')
+    if job_ids:
+        statement = statement.where(Job.id.in_(job_ids))
+    result = db.session.execute(
+        statement.values(status='queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class Worker:
+    """Claims due jobs from the job table and runs their tasks.
+
+    Claiming is one UPDATE ... RETURNING whose candidate rows come from
+    SELECT ... FOR UPDATE SKIP LOCKED, so on Postgres any number of workers
+    poll the same table without blocking on or double-claiming each other's
+    rows. SQLite ignores the locking clause but serialises writers, so the
+    same statement is just as safe there. A failed job goes back to the
+    queue after backoff() and is marked dead after its max_attempts; a job
+    whose worker vanished is reclaimed once it has run for `timeout` seconds.
+    """
+
+    def __init__(self, queues=('default',), batch_size=10, poll_interval=1.0, timeout=300.0,
+                 keep_done=86400.0, backoff_base=BACKOFF_BASE):
+        self.queues = tuple(queues)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.keep_done = keep_done
+        self.backoff_base = backoff_base
+        self.name = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self._stop = threading.Event()
+        self._maintained = 0.0
+
+    @classmethod
+    def from_config(cls, config, queues=('default',)):
+        return cls(
+            queues=queues,
+            batch_size=config.get('JOBS_BATCH_SIZE', 10),
+            poll_interval=config.get('JOBS_POLL_INTERVAL', 1.0),
+            timeout=config.get('JOBS_TIMEOUT', 300.0),
+            keep_done=config.get('JOBS_KEEP_DONE', 86400.0),
+        )
+
+    def claim(self):
+        """Mark up to batch_size due jobs as running by this worker and return them"""
+        now = datetime.utcnow()
+        candidates = (
+            select(Job.id)
+            .where(Job.status == 'queued', Job.queue.in_(self.queues), Job.run_at <= now)
+            .order_by(Job.run_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        jobs = db.session.execute(
+            update(Job)
+            .where(Job.id.in_(candidates), Job.status == 'queued')
+            .values(status='running', attempts=Job.attempts + 1, locked_at=now, locked_by=self.name)
+            .returning(Job.id, Job.task, Job.payload, Job.attempts, Job.max_attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return sorted(jobs, key=lambda job: job.id)
+
+    def execute(self, job):
+        """Run one claimed job and record the outcome; returns its new status"""
+        try:
+            function = _tasks.get(job.task)
+            if function is None:
+                raise LookupError(f"Unknown task {job.task}")
+            function(**json.loads(job.payload))
+            if self._finish(job, status='done', finished_at=datetime.utcnow(), last_error=None):
+                db.session.commit()
+                return 'done'
+            # Reclaimed after timing out and owned by another worker now
+            db.session.rollback()
+            return 'lost'
+        except Exception as e:
+            db.session.rollback()
+            error = f"{type(e).__name__}: {str(e)}"[:MAX_ERROR_LENGTH]
+            if job.attempts >= job.max_attempts:
+                values = {'status': 'dead', 'finished_at': datetime.utcnow(), 'last_error': error}
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=backoff(job.attempts, self.backoff_base))
+                values = {'status': 'queued', 'run_at': retry_at, 'last_error': error,
+                          'locked_at': None, 'locked_by': None}
+            self._finish(job, **values)
+            db.session.commit()
+            log.log(
+                logging.ERROR if values['status'] == 'dead' else logging.WARNING,
+                "Job failed", exc_info=True,
+                extra={'job_id': job.id, 'task': job.task, 'attempt': job.attempts, 'job_status': values['status']},
+            )
+            return values['status']
+
+    def _finish(self, job, **values):
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == 'running', Job.locked_by == self.name)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def maintain(self):
+        """Requeue jobs stalled past the timeout and delete old finished ones"""
+        now = datetime.utcnow()
+        db.session.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.locked_at < now - timedelta(seconds=self.timeout))
+            .values(
+                status=case((Job.attempts >= Job.max_attempts, 'dead'), else_='queued'),
+                locked_at=None, locked_by=None, last_error='Timed out',
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if self.keep_done:
+            db.session.execute(
+                delete(Job)
+                .where(Job.status == 'done', Job.finished_at < now - timedelta(seconds=self.keep_done))
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+
+    def work(self):
+        """Claim and run one batch; returns the status each job ended in"""
+        if time.monotonic() - self._maintained >= MAINTENANCE_INTERVAL:
+            self.maintain()
+            self._maintained = time.monotonic()
+        return [self.execute(job) for job in self.claim()]
+
+    def run(self, on_batch=None):
+        """Work until stop() is called, sleeping poll_interval whenever the queue is empty"""
+        self._stop.clear()
+        while not self._stop.is_set():
+            outcomes = []
+            try:
+                outcomes = self.work()
+                if outcomes and on_batch:
+                    on_batch(outcomes)
+            except Exception:
+                # Claimed jobs that never finished are reclaimed after the timeout
+                db.session.rollback()
+                log.exception("Job worker error")
+            finally:
+                db.session.remove()
+            if len(outcomes) < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
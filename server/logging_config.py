@@ -1,21 +1,203 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
-
-def setup_logging():
-    """Configure logging for the application"""
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(f'logs/app_{datetime.now().strftime("%Y%m%d")}.log'),
-            logging.StreamHandler()
-        ]
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from flask import g, request
+
+# The id of the request being served in this thread or greenlet
+request_id_var = ContextVar('request_id', default=None)
+# Incoming X-Request-ID values are reused only if they look like ids
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+access_log = logging.getLogger('access')
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and extras"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request's id, on the thread that logs them"""
+
+    def filter(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a `rate` fraction of records below INFO, so debug logging stays affordable.
+
+    Kept records carry `sample_rate`, so counts can be scaled back up.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.INFO or self.rate >= 1.0:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread with the message already rendered.
+
+    Arguments and tracebacks are turned into text here, on the logging
+    thread, so the listener never touches objects the request still owns;
+    the structured extras are left on the record for the JSON formatter.
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+def parse_levels(spec):
+    """Parse "sqlalchemy.engine=INFO,jobs=DEBUG" into {logger: level}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level='INFO', levels=None, sample_rate=1.0, fmt='json', path=None, stream=None):
+    """Route all logging through a queue to a listener thread that writes it.
+
+    Request threads only put records on an in-memory queue; formatting as
+    JSON (or plain text with fmt='text') and writing to `stream` (stderr by
+    default) and `path` happen on the listener's thread. `levels` maps
+    logger names to their own levels; records below INFO are sampled at
+    `sample_rate`. Calling it again replaces the previous configuration.
+    """
+    global _listener, _queue_handler
+    _stop_listener()
+
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handlers.append(logging.FileHandler(path))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _queue_handler = _QueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(RequestIdFilter())
+    _queue_handler.addFilter(SamplingFilter(sample_rate))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level.upper())
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+def _restart_in_child():
+    # A forked worker inherits the queue but not the listener thread
+    global _listener
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+atexit.register(_stop_listener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def init_app(app):
+    """Configure logging from LOG_* settings and tag each request with an id.
+
+    The id comes from a well-formed X-Request-ID header or is generated,
+    is added to every record logged while the request runs and is echoed
+    in the response's X-Request-ID header. One access line is logged per
+    request on the `access` logger.
+    """
+    setup_logging(
+        level=app.config.get('LOG_LEVEL', 'INFO'),
+        levels=parse_levels(app.config.get('LOG_LEVELS')),
+        sample_rate=app.config.get('LOG_DEBUG_SAMPLE_RATE', 1.0),
+        fmt=app.config.get('LOG_FORMAT', 'json'),
+        path=app.config.get('LOG_FILE') or None,
     )
-    
-    return logging.getLogger(__name__)
\ No newline at end of file
+
+    def assign_request_id():
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        g.request_id_token = request_id_var.set(request_id)
+        g.request_started = time.perf_counter()
+
+    def log_request(response):
+        request_id = request_id_var.get()
+        if request_id is not None:
+            response.headers['X-Request-ID'] = request_id
+            access_log.info('request', extra={
+                'method': request.method, 'path': request.path, 'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+            })
+        return response
+
+    def clear_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            request_id_var.reset(token)
+
+    app.before_request(assign_request_id)
+    app.after_request(log_request)
+    app.teardown_request(clear_request_id)
@@ -0,0 +1,80 @@
+"""initial schema
+
+Revision ID: 3b1f0c6d2a10
+Revises: 
+Create Date: 2026-10-18 09:12:04.118233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c6d2a10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created by db.create_all() before migrations existed already
+    # have these tables; only create what is missing so they can be upgraded
+    # in place instead of stamped by hand.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'user' not in existing:
+        op.create_table('user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password', sa.String(length=200), nullable=False),
+            sa.Column('role', sa.String(length=50), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+    if 'product' not in existing:
+        op.create_table('product',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('description', sa.String(length=200), nullable=True),
+            sa.Column('price', sa.Float(), nullable=False),
+            sa.Column('vendor_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['vendor_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'order' not in existing:
+        op.create_table('order',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('customer_id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=50), nullable=False),
+            sa.ForeignKeyConstraint(['customer_id'], ['user.id'], ),
+            sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'delivery' not in existing:
+        op.create_table('delivery',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('order_id', sa.Integer(), nullable=False),
+            sa.Column('delivery_status', sa.String(length=50), nullable=False),
+            sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('order_id')
+        )
+    if 'cart' not in existing:
+        op.create_table('cart',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('cart')
+    op.drop_table('delivery')
+    op.drop_table('order')
+    op.drop_table('product')
+    op.drop_table('user')
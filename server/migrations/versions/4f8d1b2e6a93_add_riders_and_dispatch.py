@@ -0,0 +1,70 @@
+"""add riders and dispatch columns
+
+Revision ID: 4f8d1b2e6a93
+Revises: c52e9f1a7d48
+Create Date: 2026-10-18 11:02:16.840113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8d1b2e6a93'
+down_revision = 'c52e9f1a7d48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rider',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('capacity', sa.Integer(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('location_updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id')
+    )
+    op.create_index('ix_rider_status', 'rider', ['status'], unique=False)
+    op.create_table('rider_location',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rider_id', sa.Integer(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['rider_id'], ['rider.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_rider_location_rider_id_recorded_at', 'rider_location', ['rider_id', 'recorded_at'], unique=False)
+
+    # Batch mode so SQLite, which cannot add a foreign key in place, rebuilds
+    # the table; Postgres gets plain ALTER TABLE statements
+    with op.batch_alter_table('delivery', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('rider_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('assigned_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('pickup_latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('pickup_longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('dropoff_latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('dropoff_longitude', sa.Float(), nullable=True))
+        batch_op.create_foreign_key('fk_delivery_rider_id_rider', 'rider', ['rider_id'], ['id'])
+        batch_op.create_index('ix_delivery_status_rider_id', ['delivery_status', 'rider_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('delivery', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_index('ix_delivery_status_rider_id')
+        batch_op.drop_constraint('fk_delivery_rider_id_rider', type_='foreignkey')
+        batch_op.drop_column('dropoff_longitude')
+        batch_op.drop_column('dropoff_latitude')
+        batch_op.drop_column('pickup_longitude')
+        batch_op.drop_column('pickup_latitude')
+        batch_op.drop_column('assigned_at')
+        batch_op.drop_column('rider_id')
+    op.drop_index('ix_rider_location_rider_id_recorded_at', table_name='rider_location')
+    op.drop_table('rider_location')
+    op.drop_index('ix_rider_status', table_name='rider')
+    op.drop_table('rider')
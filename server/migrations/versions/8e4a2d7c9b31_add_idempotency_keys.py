@@ -0,0 +1,37 @@
+"""add idempotency keys
+
+Revision ID: 8e4a2d7c9b31
+Revises: 3b1f0c6d2a10
+Create Date: 2026-10-18 09:14:37.502981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4a2d7c9b31'
+down_revision = '3b1f0c6d2a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'idempotency_key' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('idempotency_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=False),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key')
+    )
+
+
+def downgrade():
+    op.drop_table('idempotency_key')
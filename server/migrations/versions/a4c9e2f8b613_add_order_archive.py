@@ -0,0 +1,57 @@
+"""add delivery timestamps, order archive and history indexes
+
+Revision ID: a4c9e2f8b613
+Revises: d1b5f7a3c962
+Create Date: 2026-10-19 00:04:37.920183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c9e2f8b613'
+down_revision = 'd1b5f7a3c962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('delivery', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        # Without AUTOINCREMENT SQLite reuses the highest ids once those rows
+        # are deleted, which archiving does; Postgres sequences never reuse
+        with op.batch_alter_table('order', recreate='always', table_kwargs={'sqlite_autoincrement': True},
+                                  reflect_kwargs={'resolve_fks': False}):
+            pass
+    op.create_index('ix_order_customer_id_id', 'order', ['customer_id', 'id'], unique=False)
+    op.create_index('ix_order_created_at', 'order', ['created_at'], unique=False)
+    op.create_table('order_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('unit_price', sa.Float(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('delivery_status', sa.String(length=50), nullable=True),
+        sa.Column('rider_id', sa.Integer(), nullable=True),
+        sa.Column('delivery_created_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_archive_customer_id_id', 'order_archive', ['customer_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_order_archive_customer_id_id', table_name='order_archive')
+    op.drop_table('order_archive')
+    op.drop_index('ix_order_created_at', table_name='order')
+    op.drop_index('ix_order_customer_id_id', table_name='order')
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('order', recreate='always', table_kwargs={'sqlite_autoincrement': False},
+                                  reflect_kwargs={'resolve_fks': False}):
+            pass
+    with op.batch_alter_table('delivery', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_column('created_at')
@@ -0,0 +1,37 @@
+"""add user locations and delivery zones
+
+Revision ID: a9e5b7d3c184
+Revises: d7a3c6e1f052
+Create Date: 2026-10-18 16:05:12.518934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e5b7d3c184'
+down_revision = 'd7a3c6e1f052'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_table('delivery_zone',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('polygon', sa.Text(), nullable=False),
+        sa.Column('active', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('delivery_zone')
+    with op.batch_alter_table('user', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
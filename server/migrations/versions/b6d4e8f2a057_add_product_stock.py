@@ -0,0 +1,32 @@
+"""add product stock and order quantity
+
+Revision ID: b6d4e8f2a057
+Revises: e2c8f4a6b915
+Create Date: 2026-10-18 18:20:44.671209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d4e8f2a057'
+down_revision = 'e2c8f4a6b915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing products stay untracked (NULL stock) and existing orders were
+    # for one unit each
+    with op.batch_alter_table('product', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('stock', sa.Integer(), nullable=True))
+    with op.batch_alter_table('order', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('quantity', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('order', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_column('quantity')
+    with op.batch_alter_table('product', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_column('stock')
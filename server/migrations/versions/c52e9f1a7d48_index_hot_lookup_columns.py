@@ -0,0 +1,70 @@
+"""index hot lookup columns
+
+Revision ID: c52e9f1a7d48
+Revises: 8e4a2d7c9b31
+Create Date: 2026-10-18 09:21:50.377410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e9f1a7d48'
+down_revision = '8e4a2d7c9b31'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, unique), each matching a filter the routes run per request
+INDEXES = [
+    # Order history and checkout: WHERE customer_id = ? [AND status = ?]
+    ('ix_order_customer_id_status', 'order', ['customer_id', 'status'], False),
+    # Dispatch picks deliveries by status
+    ('ix_delivery_delivery_status', 'delivery', ['delivery_status'], False),
+    # Cart reads by user_id, upserts conflict on (user_id, product_id)
+    ('uq_cart_user_product', 'cart', ['user_id', 'product_id'], True),
+    # Keyset product listing: each filter followed by id
+    ('ix_product_vendor_id_id', 'product', ['vendor_id', 'id'], False),
+    ('ix_product_price_id', 'product', ['price', 'id'], False),
+    # Case-insensitive name prefix filter
+    ('ix_product_name_lower', 'product', [sa.text('lower(name)')], False),
+]
+
+
+def _unique_constraints(table):
+    inspector = sa.inspect(op.get_bind())
+    return {constraint['name'] for constraint in inspector.get_unique_constraints(table)}
+
+
+def _merge_duplicate_cart_lines():
+    # Carts written before the unique index can hold several rows for one
+    # product; fold them into the oldest row so the index can be built.
+    op.execute(
+        'UPDATE cart SET quantity = ('
+        ' SELECT SUM(dup.quantity) FROM cart AS dup'
+        ' WHERE dup.user_id = cart.user_id AND dup.product_id = cart.product_id'
+        ') WHERE id IN ('
+        ' SELECT MIN(id) FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1'
+        ')'
+    )
+    op.execute(
+        'DELETE FROM cart WHERE id NOT IN ('
+        ' SELECT keep.id FROM (SELECT MIN(id) AS id FROM cart GROUP BY user_id, product_id) AS keep'
+        ')'
+    )
+
+
+def upgrade():
+    _merge_duplicate_cart_lines()
+    # Tables created by db.create_all() after the models declared these
+    # indexes already have some of them, and databases from before the cart
+    # index was a unique index have it as a named unique constraint
+    for name, table, columns, unique in INDEXES:
+        if unique and name in _unique_constraints(table):
+            continue
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
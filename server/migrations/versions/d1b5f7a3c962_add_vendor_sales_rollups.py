@@ -0,0 +1,44 @@
+"""add order timestamps and prices, and vendor sales rollups
+
+Revision ID: d1b5f7a3c962
+Revises: c8e2a4f6b731
+Create Date: 2026-10-18 23:12:08.318554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1b5f7a3c962'
+down_revision = 'c8e2a4f6b731'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # When and at what price existing orders were placed is not known; they
+    # stay NULL and out of the rollups
+    with op.batch_alter_table('order', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('unit_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+    op.create_table('vendor_sales_daily',
+        sa.Column('vendor_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('completed_orders', sa.Integer(), nullable=False),
+        sa.Column('completed_units', sa.Integer(), nullable=False),
+        sa.Column('expired_orders', sa.Integer(), nullable=False),
+        sa.Column('expired_units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('vendor_id', 'day', 'product_id')
+    )
+
+
+def downgrade():
+    op.drop_table('vendor_sales_daily')
+    with op.batch_alter_table('order', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('unit_price')
@@ -0,0 +1,28 @@
+"""add delivery route stops
+
+Revision ID: d7a3c6e1f052
+Revises: 4f8d1b2e6a93
+Create Date: 2026-10-18 14:21:47.305218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3c6e1f052'
+down_revision = '4f8d1b2e6a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('delivery', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.add_column(sa.Column('pickup_stop', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('dropoff_stop', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('delivery', reflect_kwargs={'resolve_fks': False}) as batch_op:
+        batch_op.drop_column('dropoff_stop')
+        batch_op.drop_column('pickup_stop')
@@ -0,0 +1,36 @@
+"""add revoked tokens
+
+Revision ID: f3a7c1d9e264
+Revises: b6d4e8f2a057
+Create Date: 2026-10-18 21:06:14.582310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7c1d9e264'
+down_revision = 'b6d4e8f2a057'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_token',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sa.String(length=64), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('jti')
+    )
+    op.create_index('ix_revoked_token_user_id', 'revoked_token', ['user_id'], unique=False)
+    op.create_index('ix_revoked_token_expires_at', 'revoked_token', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_revoked_token_expires_at', table_name='revoked_token')
+    op.drop_index('ix_revoked_token_user_id', table_name='revoked_token')
+    op.drop_table('revoked_token')
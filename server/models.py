@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
@@ -10,6 +12,9 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(50), nullable=False)
+    # Where a vendor sells from or a customer takes deliveries
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
 
     # Relationships
     orders = db.relationship("Order", back_populates="customer", lazy=True)
@@ -28,6 +33,15 @@ class Product(db.Model):
     description = db.Column(db.String(200), nullable=True)
     price = db.Column(db.Float, nullable=False)
     vendor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Units left to sell, reserved as orders are placed; None when the vendor
+    # does not track stock for the product
+    stock = db.Column(db.Integer, nullable=True)
+
+    # Keyset listing indexes: each filter is followed by id so a page is an index range scan
+    __table_args__ = (
+        db.Index('ix_product_vendor_id_id', 'vendor_id', 'id'),
+        db.Index('ix_product_price_id', 'price', 'id'),
+    )
 
     # Relationships
     vendor = db.relationship("User", back_populates="products")
@@ -38,13 +52,34 @@ class Product(db.Model):
         return f'<Product {self.name}>'
 
 
+# Serves case-insensitive name prefix filters on the product listing
+db.Index('ix_product_name_lower', db.func.lower(Product.name))
+
+
 class Order(db.Model):
     __tablename__ = "order"
 
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # processing until checked out (completed), or expired when its stock
+    # reservation ran out first
     status = db.Column(db.String(50), nullable=False, default='processing')
+    # The product's price when ordered, so revenue does not follow later price
+    # changes; NULL (and no created_at) for orders placed before they were kept
+    unit_price = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+
+    # Checkout filters on customer_id and status, order history pages by
+    # customer_id and id, archiving selects by age. AUTOINCREMENT stops
+    # SQLite from handing out the ids of archived orders again.
+    __table_args__ = (
+        db.Index('ix_order_customer_id_status', 'customer_id', 'status'),
+        db.Index('ix_order_customer_id_id', 'customer_id', 'id'),
+        db.Index('ix_order_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
 
     # Relationships
     customer = db.relationship("User", back_populates="orders")
@@ -55,20 +90,137 @@ class Order(db.Model):
         return f'<Order {self.id} - {self.status}>'
 
 
+class VendorSalesDaily(db.Model):
+    __tablename__ = "vendor_sales_daily"
+
+    # One row per vendor, product and day the orders were placed (UTC), kept
+    # up to date by the order paths, see sales_rollup.py. The key leads with
+    # vendor_id and day so a vendor's date range is one index range scan.
+    vendor_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    # Order lines and units placed that day, and what became of them
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    completed_orders = db.Column(db.Integer, nullable=False, default=0)
+    completed_units = db.Column(db.Integer, nullable=False, default=0)
+    expired_orders = db.Column(db.Integer, nullable=False, default=0)
+    expired_units = db.Column(db.Integer, nullable=False, default=0)
+    # Units completed times the price they were ordered at
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<VendorSalesDaily {self.vendor_id} {self.day} - Product {self.product_id}>'
+
+
+class OrderArchive(db.Model):
+    __tablename__ = "order_archive"
+
+    # Finished orders moved out of the order table once older than the
+    # archive cutoff, see order_archive.py, keeping their original ids and
+    # the outcome of their delivery. No foreign keys: nothing points here and
+    # the hot tables never wait on it.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float, nullable=True)
+    status = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=True)
+    delivery_status = db.Column(db.String(50), nullable=True)
+    rider_id = db.Column(db.Integer, nullable=True)
+    delivery_created_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_order_archive_customer_id_id', 'customer_id', 'id'),)
+
+    def __repr__(self):
+        return f'<OrderArchive {self.id} - {self.status}>'
+
+
+# Deliveries a rider has been given and not yet handed over
+ACTIVE_DELIVERY_STATUSES = ('assigned', 'in transit')
+
+
 class Delivery(db.Model):
     __tablename__ = "delivery"
 
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, unique=True)
     delivery_status = db.Column(db.String(50), nullable=False, default='pending')
+    rider_id = db.Column(db.Integer, db.ForeignKey('rider.id'), nullable=True)
+    assigned_at = db.Column(db.DateTime, nullable=True)
+    # Where the rider collects the order (the vendor) and drops it off (the
+    # customer), copied when the order is placed
+    pickup_latitude = db.Column(db.Float, nullable=True)
+    pickup_longitude = db.Column(db.Float, nullable=True)
+    dropoff_latitude = db.Column(db.Float, nullable=True)
+    dropoff_longitude = db.Column(db.Float, nullable=True)
+    # Position of the pickup and the dropoff in the rider's route; the pickup
+    # is None once collected, the dropoff None until the route is planned
+    pickup_stop = db.Column(db.Integer, nullable=True)
+    dropoff_stop = db.Column(db.Integer, nullable=True)
+    # NULL for deliveries created before it was kept
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+
+    # Dispatch collects by status and counts active deliveries per rider
+    # from the (delivery_status, rider_id) index alone
+    __table_args__ = (
+        db.Index('ix_delivery_delivery_status', 'delivery_status'),
+        db.Index('ix_delivery_status_rider_id', 'delivery_status', 'rider_id'),
+    )
 
     # Relationships
     order = db.relationship("Order", back_populates="delivery")
+    rider = db.relationship("Rider", back_populates="deliveries")
 
     def __repr__(self):
         return f'<Delivery {self.id} - {self.delivery_status}>'
 
 
+class Rider(db.Model):
+    __tablename__ = "rider"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    # available riders are dispatched to, offline ones are not
+    status = db.Column(db.String(20), nullable=False, default='offline')
+    # Deliveries the rider can carry at once
+    capacity = db.Column(db.Integer, nullable=False, default=3)
+    # Last reported position, kept here so dispatch reads one row per rider
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    location_updated_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_rider_status', 'status'),)
+
+    # Relationships
+    user = db.relationship("User")
+    deliveries = db.relationship("Delivery", back_populates="rider", lazy=True)
+    locations = db.relationship("RiderLocation", back_populates="rider", lazy=True)
+
+    def __repr__(self):
+        return f'<Rider {self.id} - {self.status}>'
+
+
+class RiderLocation(db.Model):
+    __tablename__ = "rider_location"
+
+    id = db.Column(db.Integer, primary_key=True)
+    rider_id = db.Column(db.Integer, db.ForeignKey('rider.id'), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_rider_location_rider_id_recorded_at', 'rider_id', 'recorded_at'),)
+
+    # Relationships
+    rider = db.relationship("Rider", back_populates="locations")
+
+    def __repr__(self):
+        return f'<RiderLocation {self.rider_id} ({self.latitude}, {self.longitude})>'
+
+
 class Cart(db.Model):
     __tablename__ = "cart"
 
@@ -77,9 +229,110 @@ class Cart(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
 
+    # One row per cart line, so adding to the cart is a single upsert; the
+    # user_id prefix also serves cart reads. A unique index rather than a
+    # constraint so migrations can add it to an existing SQLite table.
+    __table_args__ = (db.Index('uq_cart_user_product', 'user_id', 'product_id', unique=True),)
+
     # Relationships
     user = db.relationship("User", back_populates="cart_items")
     product = db.relationship("Product", back_populates="cart_items")
 
     def __repr__(self):
         return f'<Cart {self.user_id} - Product {self.product_id} - Quantity {self.quantity}>'
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_key"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # A retried request with the same key finds the stored response instead of re-running
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id} - {self.key}>'
+
+
+class DeliveryZone(db.Model):
+    __tablename__ = "delivery_zone"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    # JSON list of [latitude, longitude] vertices
+    polygon = db.Column(db.Text, nullable=False)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+
+    def __repr__(self):
+        return f'<DeliveryZone {self.name}>'
+
+
+class Job(db.Model):
+    __tablename__ = "job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    queue = db.Column(db.String(50), nullable=False, default='default')
+    task = db.Column(db.String(100), nullable=False)
+    # JSON object of the task's keyword arguments
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # queued until a worker claims it, running while it executes, then done,
+    # or dead once it has failed max_attempts times
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers claim the oldest due queued jobs; reclaiming stalled jobs and
+    # pruning finished ones also filter on status first
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.task} - {self.status}>'
+
+
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_token"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Either one token, by its jti, or every token of user_id issued before
+    # revoked_at (a compromised account); kept to whole seconds like iat
+    jti = db.Column(db.String(64), nullable=True, unique=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # When the last token it covers expires and the row can go; NULL if
+    # tokens never expire
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_revoked_token_user_id', 'user_id'),
+                      db.Index('ix_revoked_token_expires_at', 'expires_at'))
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti or f"user {self.user_id}"}>'
+
+
+class RateLimitBucket(db.Model):
+    __tablename__ = "rate_limit_bucket"
+
+    # "<endpoint rule>:user:<id>" or "<endpoint rule>:ip:<address>"
+    key = db.Column(db.String(200), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    # Seconds since the epoch, so the refill is plain arithmetic in SQL
+    updated_at = db.Column(db.Float, nullable=False)
+    # Whether the last request took a token, returned by the same upsert
+    allowed = db.Column(db.Boolean, nullable=False, default=True)
+
+    __table_args__ = (db.Index('ix_rate_limit_bucket_updated_at', 'updated_at'),)
+
+    def __repr__(self):
+        return f'<RateLimitBucket {self.key}: {self.tokens:.1f}>'
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, or_, select
+
+from models import db, Product, Order, Delivery, OrderArchive
+from orders import HISTORY_PAGE_SIZE
+
+# Days a finished order stays in the order table
+ARCHIVE_AFTER_DAYS = 90
+# Orders moved per transaction, so an archive run never holds the order
+# table's write lock for long
+ARCHIVE_BATCH = 1000
+
+# Orders that can no longer change
+FINISHED_ORDER_STATUSES = ('completed', 'expired')
+# Deliveries that can no longer change: handed over by the rider, or
+# cancelled with their expired order. Any other keeps its order hot.
+FINISHED_DELIVERY_STATUSES = ('delivered', 'cancelled')
+
+
+def archive_orders(before, batch_size=ARCHIVE_BATCH):
+    """Move finished orders placed before `before` into the order archive.
+
+    An order qualifies once it is completed or expired and its delivery, if
+    any, is delivered or cancelled. Orders without created_at
+    predate timestamps and count as old. Each batch copies the orders and
+    their deliveries' outcome into order_archive, deletes both from the hot
+    tables and commits, walking order ids upward so no row is read twice;
+    the last old order's id, found on the created_at index, bounds the walk.
+    Sales rollups are untouched: they already count these orders. Returns
+    the number of orders archived.
+    """
+    old = or_(Order.created_at < before, Order.created_at.is_(None))
+    last_id = db.session.execute(select(func.max(Order.id)).where(old)).scalar()
+    archived, after = 0, 0
+    while last_id is not None:
+        rows = db.session.execute(
+            select(Order.id, Order.customer_id, Order.product_id, Order.quantity, Order.unit_price, Order.status,
+                   Order.created_at, Delivery.id.label('delivery_id'), Delivery.delivery_status, Delivery.rider_id,
+                   Delivery.created_at.label('delivery_created_at'))
+            .outerjoin(Delivery, Delivery.order_id == Order.id)
+            .where(Order.id > after, Order.id <= last_id, old, Order.status.in_(FINISHED_ORDER_STATUSES),
+                   or_(Delivery.id.is_(None), Delivery.delivery_status.in_(FINISHED_DELIVERY_STATUSES)))
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        now = datetime.utcnow()
+        db.session.execute(insert(OrderArchive), [
+            {'id': row.id, 'customer_id': row.customer_id, 'product_id': row.product_id, 'quantity': row.quantity,
+             'unit_price': row.unit_price, 'status': row.status, 'created_at': row.created_at,
+             'delivery_status': row.delivery_status, 'rider_id': row.rider_id,
+             'delivery_created_at': row.delivery_created_at, 'archived_at': now}
+            for row in rows
+        ])
+        delivery_ids = [row.delivery_id for row in rows if row.delivery_id is not None]
+        if delivery_ids:
+            db.session.execute(
+                delete(Delivery).where(Delivery.id.in_(delivery_ids)).execution_options(synchronize_session=False)
+            )
+        db.session.execute(
+            delete(Order).where(Order.id.in_([row.id for row in rows])).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        archived += len(rows)
+        after = rows[-1].id
+    return archived
+
+
+def archived_history(user_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """A page of a customer's archived orders, newest first, shaped like orders.order_history().
+
+    Read only when the customer asks for older orders; one query walking
+    the archive's (customer_id, id) index. Returns the orders and the id to
+    pass as `before` for the next page, or None on the last.
+    """
+    query = (
+        db.session.query(OrderArchive.id, OrderArchive.status, OrderArchive.product_id, Product.name,
+                         OrderArchive.delivery_status)
+        .outerjoin(Product, Product.id == OrderArchive.product_id)
+        .filter(OrderArchive.customer_id == user_id)
+    )
+    if before is not None:
+        query = query.filter(OrderArchive.id < before)
+    rows = query.order_by(OrderArchive.id.desc()).limit(limit + 1).all()
+    orders = [
+        {
+            "id": order_id,
+            "status": status,
+            "product_id": product_id,
+            "product_name": product_name,
+            "delivery_status": delivery_status or 'N/A'
+        }
+        for order_id, status, product_id, product_name, delivery_status in rows[:limit]
+    ]
+    return orders, rows[limit - 1].id if len(rows) > limit else None
@@ -0,0 +1,218 @@
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+# Postgres channel carrying events between workers
+CHANNEL = 'order_events'
+# Events a subscriber may fall behind by before it is told to resync
+MAX_PENDING = 100
+NOTIFY_ALL = text(
+    "SELECT pg_notify(:channel, events.payload) "
+    "FROM json_array_elements_text(CAST(:payloads AS json)) AS events(payload)"
+)
+
+
+def order_event(customer_id, order_id, status=None, delivery_status=None, rider_id=None):
+    """Build the event for a status change of one order or its delivery"""
+    payload = {'customer_id': customer_id, 'order_id': order_id, 'at': datetime.utcnow().isoformat() + 'Z'}
+    if status is not None:
+        payload['type'], payload['status'] = 'order', status
+    else:
+        payload['type'], payload['delivery_status'] = 'delivery', delivery_status
+        if rider_id is not None:
+            payload['rider_id'] = rider_id
+    return payload
+
+
+class StreamsFull(Exception):
+    """Raised when this process already holds its most open subscriptions"""
+
+
+class Subscription:
+    """One listener's queue of events; idle it is a deque and an Event"""
+
+    __slots__ = ('customer_id', '_events', '_ready', 'overflowed')
+
+    def __init__(self, customer_id):
+        self.customer_id = customer_id
+        self._events = deque()
+        self._ready = threading.Event()
+        self.overflowed = False
+
+    def push(self, payload):
+        if len(self._events) >= MAX_PENDING:
+            # A stalled client resyncs from /orders rather than growing without bound
+            self.overflowed = True
+        else:
+            self._events.append(payload)
+        self._ready.set()
+
+    def wait(self, timeout):
+        """Events queued since the last call, waiting up to `timeout` seconds.
+
+        Returns (events, overflowed); both empty/False on timeout.
+        """
+        if not self._ready.wait(timeout):
+            return [], False
+        self._ready.clear()
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+
+class OrderEventBus:
+    """Fans order and delivery status changes out to subscribed customers.
+
+    Writers call publish() inside their transaction; events leave only when
+    it commits and are dropped on rollback. With the `local` backend they go
+    straight to this process's subscribers. With `postgres` they are sent
+    with pg_notify() inside the transaction, and one LISTEN connection per
+    process, opened with the first subscriber, hands them to local
+    subscribers, so every worker sees every event. Subscribers are indexed
+    by customer, so a publish touches only that customer's listeners and an
+    idle subscriber costs nothing until its heartbeat. Each open stream ties
+    up a web thread, so past `max_subscribers` (0: no limit) subscribe()
+    raises StreamsFull.
+    """
+
+    def __init__(self, backend='local', max_subscribers=0):
+        self.backend = backend
+        self.max_subscribers = max_subscribers
+        self._count = 0
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._engine = None
+        self._listener = None
+        self._watching = False
+
+    def init_app(self, app, engine_factory):
+        """Pick the backend from ORDER_EVENTS_BACKEND; `engine_factory()` returns the engine to LISTEN on"""
+        backend = app.config.get('ORDER_EVENTS_BACKEND', 'auto')
+        if backend == 'auto':
+            url = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+            backend = 'postgres' if url.startswith('postgresql') else 'local'
+        self.backend = backend
+        self.max_subscribers = app.config.get('ORDER_STREAM_MAX', self.max_subscribers)
+        self._engine = engine_factory
+
+    # Publishing
+
+    def publish(self, session, payload):
+        """Queue `payload` to go out when `session` commits"""
+        session.info.setdefault('order_events', []).append(payload)
+
+    def deliver(self, payload):
+        """Hand `payload` to this process's subscribers for its customer"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(payload['customer_id'], ()))
+        for subscription in subscribers:
+            subscription.push(payload)
+
+    def watch(self):
+        if self._watching:
+            return self
+        self._watching = True
+
+        def before_commit(session):
+            if self.backend != 'postgres':
+                return
+            pending = session.info.get('order_events')
+            if pending:
+                # Inside the transaction, so Postgres only delivers them if it
+                # commits; one round trip however many events the batch made
+                session.execute(NOTIFY_ALL, {
+                    'channel': CHANNEL, 'payloads': json.dumps([json.dumps(payload) for payload in pending]),
+                })
+
+        def after_commit(session):
+            pending = session.info.pop('order_events', None)
+            if pending and self.backend != 'postgres':
+                for payload in pending:
+                    self.deliver(payload)
+
+        def after_rollback(session, previous_transaction):
+            session.info.pop('order_events', None)
+
+        event.listen(Session, 'before_commit', before_commit)
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_soft_rollback', after_rollback)
+        return self
+
+    # Subscribing
+
+    def subscribe(self, customer_id):
+        subscription = Subscription(customer_id)
+        with self._lock:
+            if self.max_subscribers and self._count >= self.max_subscribers:
+                raise StreamsFull("Too many open order streams")
+            self._subscribers[customer_id].add(subscription)
+            self._count += 1
+        if self.backend == 'postgres':
+            self._ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.customer_id)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.customer_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+    # Postgres LISTEN
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, args=(self._engine(),), daemon=True)
+                self._listener.start()
+
+    def _listen(self, engine):
+        delay = 1.0
+        while True:
+            raw = None
+            try:
+                connection = engine.raw_connection()
+                # Ours for good: keep it out of the pool and out of transactions
+                connection.detach()
+                raw = connection.driver_connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                delay = 1.0
+                while True:
+                    if select.select([raw], [], [], 60) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self.deliver(json.loads(raw.notifies.pop(0).payload))
+            except Exception:
+                # Events sent while reconnecting are missed; clients resync on reconnect
+                log.warning("Order event listener error, reconnecting", exc_info=True)
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+
+# Shared by the web workers' stream endpoint and every writer in the process
+event_bus = OrderEventBus().watch()
@@ -0,0 +1,372 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from inventory import InsufficientStock, reserve, release, totals
+from jobs import enqueue, task
+from models import db, User, Product, Order, Delivery, Cart, IdempotencyKey
+from order_events import event_bus, order_event
+from sales_rollup import record_sales
+
+log = logging.getLogger(__name__)
+
+# Seconds an unpaid order holds its stock before it expires
+RESERVATION_TTL = 1800
+# Orders per page of order history
+HISTORY_PAGE_SIZE = 50
+# The status a delivery must be in for its rider to move it to each next one
+DELIVERY_STEPS = {'in transit': 'assigned', 'delivered': 'in transit'}
+
+
+class OrderError(Exception):
+    """Raised when an order request is rejected; carries the HTTP status"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _validate_items(cart_items):
+    if not isinstance(cart_items, list) or not cart_items:
+        raise OrderError("Cart items are required")
+    for item in cart_items:
+        if not isinstance(item, dict) or 'product_id' not in item or 'quantity' not in item:
+            raise OrderError("Product ID and quantity are required")
+        quantity = item['quantity']
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            raise OrderError("Quantity must be a positive whole number")
+
+
+def _request_hash(cart_items):
+    return hashlib.sha256(json.dumps(cart_items, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _stored_response(user_id, key, request_hash):
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if record is None:
+        return None
+    if record.request_hash != request_hash:
+        raise OrderError("Idempotency key was already used for a different order", 422)
+    return json.loads(record.response), record.status_code
+
+
+def _delivery_location(user_id, zones):
+    """The customer's drop-off point, checked against `zones` when given"""
+    customer = db.session.query(User.latitude, User.longitude).filter(User.id == user_id).first()
+    location = (customer.latitude, customer.longitude) if customer and customer.latitude is not None else None
+    if zones is not None:
+        zones.ensure_built()
+        if len(zones):
+            if location is None:
+                raise OrderError("Set a delivery location before ordering", 422)
+            if zones.locate(*location) is None:
+                raise OrderError("Delivery location is outside our delivery zones", 422)
+    return location
+
+
+def place_cart_order(user_id, cart_items, idempotency_key=None, zones=None, reservation_ttl=RESERVATION_TTL):
+    """Create an Order per cart line in one transaction.
+
+    All referenced products are checked with a single IN query, the Order
+    rows are bulk-inserted and the whole basket commits once, so a failure
+    leaves nothing behind. Lines for products with tracked stock reserve it
+    with one conditional UPDATE for the whole basket; a shortfall rejects
+    the order with 409, and orders not checked out within `reservation_ttl`
+    seconds expire and return their stock. Their deliveries are created by
+    the orders.create_deliveries job enqueued in the same transaction. When
+    `idempotency_key` is given, the response is stored alongside the orders
+    and a retry with the same key returns it instead of ordering again. With
+    a spatial_index.DeliveryZoneIndex as `zones`, customers outside every
+    zone are turned away once any zone exists. The lines are added to the
+    vendors' daily sales rollups in the same transaction. Returns a
+    (body, status_code) pair.
+    """
+    _validate_items(cart_items)
+    request_hash = _request_hash(cart_items)
+    if idempotency_key is not None:
+        if not idempotency_key or len(idempotency_key) > 64:
+            raise OrderError("Idempotency key must be 1-64 characters")
+        stored = _stored_response(user_id, idempotency_key, request_hash)
+        if stored is not None:
+            return stored
+
+    _delivery_location(user_id, zones)
+    wanted = totals((item['product_id'], item['quantity']) for item in cart_items)
+    rows = db.session.query(Product.id, Product.stock, Product.price).filter(Product.id.in_(wanted)).all()
+    stock = {row.id: row.stock for row in rows}
+    prices = {row.id: row.price for row in rows}
+    missing = sorted(wanted.keys() - stock.keys(), key=str)
+    if missing:
+        raise OrderError(f"Products not found: {', '.join(map(str, missing))}", 404)
+    tracked = {product_id: quantity for product_id, quantity in wanted.items() if stock[product_id] is not None}
+    # Turn away baskets that cannot fit before taking any row locks
+    short = sorted((product_id for product_id, quantity in tracked.items() if stock[product_id] < quantity), key=str)
+    if short:
+        raise OrderError(str(InsufficientStock(short)), 409)
+
+    try:
+        reserve(db.session, tracked)
+        placed_at = datetime.utcnow()
+        # Batched into multi-row INSERT ... RETURNING where the dialect can keep
+        # the returned ids in parameter order (Postgres); SQLite gets one
+        # statement per line, still inside the single transaction.
+        order_ids = db.session.execute(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True),
+            [{'customer_id': user_id, 'product_id': item['product_id'], 'quantity': item['quantity'],
+              'status': 'processing', 'unit_price': prices[item['product_id']], 'created_at': placed_at}
+             for item in cart_items],
+        ).scalars().all()
+        record_sales(db.session, 'placed', [
+            (item['product_id'], item['quantity'], prices[item['product_id']], placed_at) for item in cart_items
+        ])
+        enqueue(db.session, 'orders.create_deliveries', {'order_ids': order_ids})
+        reserving = [order_id for order_id, item in zip(order_ids, cart_items) if item['product_id'] in tracked]
+        if reserving:
+            enqueue(db.session, 'orders.expire_reservations', {'order_ids': reserving}, delay=reservation_ttl)
+        body = {"message": "Order placed successfully", "order_ids": order_ids}
+        if idempotency_key is not None:
+            db.session.add(IdempotencyKey(
+                user_id=user_id,
+                key=idempotency_key,
+                request_hash=request_hash,
+                status_code=201,
+                response=json.dumps(body),
+            ))
+        db.session.commit()
+    except InsufficientStock as e:
+        # Sold out between the check and the reservation
+        db.session.rollback()
+        raise OrderError(str(e), 409)
+    except IntegrityError:
+        db.session.rollback()
+        # A concurrent retry with the same key committed first
+        stored = _stored_response(user_id, idempotency_key, request_hash) if idempotency_key else None
+        if stored is None:
+            raise
+        return stored
+    return body, 201
+
+
+def _create_missing_deliveries(order_ids):
+    """Insert a pending Delivery for each of `order_ids` that has none.
+
+    Pickup is the vendor's location and dropoff the customer's, read in the
+    same query that finds the orders still without a delivery, so running it
+    twice for the same orders inserts nothing the second time. Dispatch
+    skips deliveries whose vendor has no location yet, so those are logged
+    until fill_missing_pickups() gives them one.
+    """
+    if not order_ids:
+        return 0
+    vendor, customer = aliased(User), aliased(User)
+    rows = (
+        db.session.query(Order.id, Order.customer_id, vendor.latitude, vendor.longitude,
+                         customer.latitude, customer.longitude)
+        .join(Product, Product.id == Order.product_id)
+        .join(vendor, vendor.id == Product.vendor_id)
+        .join(customer, customer.id == Order.customer_id)
+        .outerjoin(Delivery, Delivery.order_id == Order.id)
+        .filter(Order.id.in_(order_ids), Delivery.id.is_(None))
+        .order_by(Order.id)
+        .all()
+    )
+    if not rows:
+        return 0
+    db.session.execute(insert(Delivery), [
+        {'order_id': order_id, 'delivery_status': 'pending',
+         'pickup_latitude': pickup_lat, 'pickup_longitude': pickup_lon,
+         'dropoff_latitude': dropoff_lat, 'dropoff_longitude': dropoff_lon}
+        for order_id, _, pickup_lat, pickup_lon, dropoff_lat, dropoff_lon in rows
+    ])
+    for order_id, customer_id, *_ in rows:
+        event_bus.publish(db.session, order_event(customer_id, order_id, delivery_status='pending'))
+    no_pickup = [order_id for order_id, _, pickup_lat, pickup_lon, *_ in rows if pickup_lat is None or pickup_lon is None]
+    if no_pickup:
+        log.warning("Deliveries wait for a vendor location before dispatch", extra={'order_ids': no_pickup})
+    return len(rows)
+
+
+def fill_missing_pickups(vendor_id, latitude, longitude):
+    """Give the vendor's pending deliveries without a pickup point its location.
+
+    Runs in the caller's transaction when a vendor sets a location, so
+    orders placed before it become dispatchable. Returns the number filled.
+    """
+    vendor_orders = select(Order.id).join(Product, Product.id == Order.product_id).where(Product.vendor_id == vendor_id)
+    return db.session.execute(
+        update(Delivery)
+        .where(Delivery.delivery_status == 'pending', Delivery.pickup_latitude.is_(None),
+               Delivery.order_id.in_(vendor_orders))
+        .values(pickup_latitude=latitude, pickup_longitude=longitude)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+@task('orders.create_deliveries')
+def create_deliveries(order_ids):
+    """Give newly placed orders their pending deliveries, ready for dispatch"""
+    _create_missing_deliveries(order_ids)
+
+
+def order_history(user_id, limit=HISTORY_PAGE_SIZE, before=None):
+    """A page of a customer's orders, newest first, with product name and delivery status.
+
+    One projected query joining product and delivery that walks the
+    (customer_id, id) index down from `before`, an order id, so a page costs
+    the same however long the customer's history. Orders moved to the
+    archive are paged by order_archive.archived_history(). Returns the
+    orders and the id to pass as `before` for the next page, or None on the
+    last.
+    """
+    query = (
+        db.session.query(Order.id, Order.status, Order.product_id, Product.name, Delivery.delivery_status)
+        .join(Product, Order.product_id == Product.id)
+        .outerjoin(Delivery, Delivery.order_id == Order.id)
+        .filter(Order.customer_id == user_id)
+    )
+    if before is not None:
+        query = query.filter(Order.id < before)
+    rows = query.order_by(Order.id.desc()).limit(limit + 1).all()
+    orders = [
+        {
+            "id": order_id,
+            "status": status,
+            "product_id": product_id,
+            "product_name": product_name,
+            "delivery_status": delivery_status or 'N/A'
+        }
+        for order_id, status, product_id, product_name, delivery_status in rows[:limit]
+    ]
+    return orders, rows[limit - 1].id if len(rows) > limit else None
+
+
+def cart_lines(user_id):
+    """The user's cart lines with product details, in one joined query"""
+    rows = (
+        db.session.query(Product.id, Product.name, Product.price, Cart.quantity)
+        .join(Cart, Cart.product_id == Product.id)
+        .filter(Cart.user_id == user_id)
+        .order_by(Cart.id)
+    )
+    return [
+        {'product_id': product_id, 'product_name': name, 'price': price, 'quantity': quantity}
+        for product_id, name, price, quantity in rows
+    ]
+
+
+def checkout(user_id):
+    """Queue the customer's processing orders for checkout.
+
+    Only their ids are read here; the orders.complete_checkout job completes
+    them and hands them to dispatch, and each status change reaches the
+    customer's order stream as the job commits. Returns the number of orders
+    queued.
+    """
+    order_ids = [
+        order_id for (order_id,) in
+        db.session.query(Order.id).filter_by(customer_id=user_id, status='processing').order_by(Order.id)
+    ]
+    if not order_ids:
+        raise OrderError("No orders to checkout")
+    enqueue(db.session, 'orders.complete_checkout', {'customer_id': user_id, 'order_ids': order_ids})
+    db.session.commit()
+    return len(order_ids)
+
+
+@task('orders.complete_checkout')
+def complete_checkout(customer_id, order_ids):
+    """Complete the orders still processing and create any missing deliveries.
+
+    Orders completed by an earlier run or a duplicate checkout are skipped by
+    the conditional update, so a retried job changes nothing twice. Their
+    deliveries stay pending until the dispatcher assigns a rider, and their
+    sales count toward the day each order was placed.
+    """
+    completed = db.session.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.customer_id == customer_id, Order.status == 'processing')
+        .values(status='completed')
+        .returning(Order.id, Order.product_id, Order.quantity, Order.unit_price, Order.created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not completed:
+        return
+    record_sales(db.session, 'completed', [
+        (row.product_id, row.quantity, row.unit_price, row.created_at) for row in completed
+    ])
+    for order_id in sorted(row.id for row in completed):
+        event_bus.publish(db.session, order_event(customer_id, order_id, status='completed'))
+    _create_missing_deliveries([row.id for row in completed])
+
+
+def advance_delivery(rider_id, delivery_id, status):
+    """Move one of the rider's deliveries a step on: picked up, then delivered.
+
+    Only the rider it is assigned to may move it, and only from the status
+    before `status` in DELIVERY_STEPS; the update is conditional on both, so
+    a repeated or racing request is refused rather than announced twice. A
+    delivered order no longer counts against the rider's capacity and can
+    be archived. Returns the order id.
+    """
+    row = (
+        db.session.query(Delivery.order_id, Order.customer_id)
+        .join(Order, Order.id == Delivery.order_id)
+        .filter(Delivery.id == delivery_id, Delivery.rider_id == rider_id)
+        .first()
+    )
+    if row is None:
+        raise OrderError("Delivery not found", 404)
+    values = {'delivery_status': status}
+    if status == 'in transit':
+        # Collected, so the pickup leaves the rider's route
+        values['pickup_stop'] = None
+    moved = db.session.execute(
+        update(Delivery)
+        .where(Delivery.id == delivery_id, Delivery.rider_id == rider_id,
+               Delivery.delivery_status == DELIVERY_STEPS[status])
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not moved:
+        db.session.rollback()
+        raise OrderError(f"Delivery is not {DELIVERY_STEPS[status]}", 409)
+    event_bus.publish(db.session, order_event(row.customer_id, row.order_id, delivery_status=status, rider_id=rider_id))
+    db.session.commit()
+    return row.order_id
+
+
+@task('orders.expire_reservations')
+def expire_reservations(order_ids):
+    """Expire the orders among `order_ids` still unpaid and put their stock back.
+
+    Orders checked out meanwhile no longer match the conditional update, so
+    the job is a no-op for them. Deliveries waiting on expired orders are
+    cancelled, and the orders count as expired in the sales rollups.
+    """
+    expired = db.session.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.status == 'processing')
+        .values(status='expired')
+        .returning(Order.id, Order.customer_id, Order.product_id, Order.quantity, Order.unit_price, Order.created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not expired:
+        return
+    release(db.session, totals((row.product_id, row.quantity) for row in expired))
+    record_sales(db.session, 'expired', [
+        (row.product_id, row.quantity, row.unit_price, row.created_at) for row in expired
+    ])
+    db.session.execute(
+        update(Delivery)
+        .where(Delivery.order_id.in_([row.id for row in expired]), Delivery.delivery_status == 'pending')
+        .values(delivery_status='cancelled')
+        .execution_options(synchronize_session=False)
+    )
+    for row in sorted(expired, key=lambda row: row.id):
+        event_bus.publish(db.session, order_event(row.customer_id, row.id, status='expired'))
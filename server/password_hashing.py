@@ -0,0 +1,146 @@
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+# bcrypt only looks at the first 72 bytes; older bcrypt releases truncated
+# silently, so existing hashes were made from the truncated password.
+MAX_PASSWORD_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def hash_password(password, rounds):
+    """Hash `password` with bcrypt at cost `rounds` in the calling process"""
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(pw_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), pw_hash.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+def hash_rounds(pw_hash):
+    """Cost factor stored in a `$2b$12$...` hash, or None if unparseable"""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def calibrate_rounds(target_seconds, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS):
+    """Highest bcrypt cost whose hash time stays within `target_seconds`.
+
+    Each extra round doubles the work, so one timed hash at `min_rounds` is
+    enough to extrapolate.
+    """
+    start = time.perf_counter()
+    hash_password('calibration', min_rounds)
+    elapsed = time.perf_counter() - start
+    rounds = min_rounds + int(math.floor(math.log2(target_seconds / elapsed))) if elapsed < target_seconds else min_rounds
+    return max(min_rounds, min(max_rounds, rounds))
+
+
+def _pool_context():
+    """Start hashing processes from a clean fork server.
+
+    Forking a threaded request worker is unsafe, and spawn would re-run the
+    app module (and its startup work) in every child. The fork server only
+    preloads this module.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool queue is full or a hash timed out"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool instead of the request worker.
+
+    At most `max_pending` hashes may be queued or running at once; further
+    requests fail fast with HasherBusy so callers can answer 503 rather than
+    pile up behind a login storm. The pool is created on first use so it is
+    owned by the gunicorn worker, not the arbiter it was forked from.
+    """
+
+    def __init__(self, rounds=12, max_workers=2, max_pending=16, timeout=10.0):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Called with the seconds each hash or check took, queueing included
+        self.on_timing = None
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.rounds)
+        target_ms = app.config.get('BCRYPT_TARGET_MS')
+        if target_ms:
+            self.rounds = calibrate_rounds(target_ms / 1000.0)
+        self.max_workers = app.config.get('PASSWORD_HASH_WORKERS', self.max_workers)
+        self._slots = threading.BoundedSemaphore(app.config.get('PASSWORD_HASH_MAX_PENDING', 16))
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        app.extensions['password_hasher'] = self
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context())
+        return self._pool
+
+    def _run(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusy("Password hashing queue is full")
+        start = time.perf_counter()
+        try:
+            try:
+                future = self._executor().submit(fn, *args)
+            except BaseException:
+                slots.release()
+                raise
+            # The slot is held until the pool is done with the job, not until
+            # we stop waiting for it: a hash that timed out is still running
+            future.add_done_callback(lambda _: slots.release())
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise HasherBusy("Password hashing timed out")
+        finally:
+            if self.on_timing is not None:
+                self.on_timing(time.perf_counter() - start)
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        return self._run(check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Whether `pw_hash` is cheaper than the current cost; hashes are only
+        ever upgraded, since workers calibrating to slightly different costs
+        would otherwise re-hash each other's work back and forth"""
+        return hash_rounds(pw_hash) < self.rounds
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block issues more SQL statements than allowed"""
+
+
+class QueryCounter:
+    """Records every SQL statement an engine executes while active.
+
+    Use as a context manager around the code under test:
+
+        with QueryCounter(db.engine) as counter:
+            client.get('/orders')
+        assert counter.count <= 2
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+@contextmanager
+def assert_max_queries(engine, limit, label=''):
+    """Fail with QueryBudgetExceeded if the block runs more than `limit` statements.
+
+    Budgets are fixed numbers, so a read path that grows one query per row
+    (an N+1) fails as soon as it is given enough rows.
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(f'  {i + 1}. {statement}' for i, statement in enumerate(counter.statements))
+        raise QueryBudgetExceeded(
+            f"{label or 'block'} issued {counter.count} SQL statements, budget is {limit}:\n{listing}"
+        )
@@ -0,0 +1,383 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, jsonify, request
+from sqlalchemy import case, delete, func
+
+log = logging.getLogger(__name__)
+
+# Requests per period for each endpoint, by Flask endpoint name with or
+# without its blueprint; endpoints not listed share the `default` bucket and
+# None exempts an endpoint. RATE_LIMITS overrides entries.
+DEFAULT_LIMITS = {
+    'default': (300, 60),
+    'login': (10, 60),
+    'register': (20, 3600),
+    'view_orders': (60, 60),
+    'get_orders': (60, 60),
+    'serve_react_app': None,
+    'serve_static_files': None,
+    'prometheus_metrics': None,
+}
+# Under overload low-priority endpoints are shed first and critical ones
+# never; everything else is normal. LOAD_SHED_PRIORITIES overrides entries.
+DEFAULT_PRIORITIES = {
+    'checkout': 'critical',
+    'place_order': 'critical',
+    'login': 'critical',
+    'update_stock': 'critical',
+    'pick_up_delivery': 'critical',
+    'complete_delivery': 'critical',
+    'get_products': 'low',
+    'search_products': 'low',
+    'nearby_vendors': 'low',
+    'view_orders': 'low',
+    'get_orders': 'low',
+    'get_rider_route': 'low',
+    'vendor_sales': 'low',
+}
+# Seconds between deletions of buckets idle long enough to be full again
+PRUNE_INTERVAL = 600.0
+
+
+def parse_limits(spec):
+    """Parse "login=10/60,register=none" into {endpoint: (requests, seconds) or None}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, value = item.partition('=')
+        value = value.strip().lower()
+        if value in ('none', 'off', '0'):
+            limits[name.strip()] = None
+        else:
+            requests, _, seconds = value.partition('/')
+            limits[name.strip()] = (int(requests), float(seconds or 1))
+    return limits
+
+
+def parse_priorities(spec):
+    """Parse "get_products=low,checkout=critical" into {endpoint: priority}"""
+    priorities = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, priority = item.partition('=')
+        priorities[name.strip()] = priority.strip().lower()
+    return priorities
+
+
+class MemoryBucketStore:
+    """Token buckets in this process only.
+
+    Each gunicorn worker enforces its own quota, so the effective limit is
+    the quota times the number of workers; fine for development and single
+    worker deployments.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        """Spend one token from `key`'s bucket; returns (allowed, tokens left)"""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, max(updated_at, now))
+            if len(self._buckets) > self.max_keys:
+                self._buckets.pop(next(iter(self._buckets)))
+            return allowed, tokens
+
+    def prune(self, before):
+        with self._lock:
+            for key in [key for key, (_, updated_at) in self._buckets.items() if updated_at < before]:
+                del self._buckets[key]
+
+
+class FileBucketStore:
+    """Token buckets in a local SQLite file shared by all workers on one host.
+
+    Taking a token is one INSERT ... ON CONFLICT DO UPDATE ... RETURNING,
+    which refills the bucket for the time since its last use and spends a
+    token only if one is there; SQLite runs it atomically, so concurrent
+    workers never both spend the last token.
+    """
+
+    _TAKE = (
+        'INSERT INTO bucket (key, tokens, updated_at, allowed) VALUES (:key, :capacity - 1, :now, 1) '
+        'ON CONFLICT (key) DO UPDATE SET '
+        ' allowed = min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= 1,'
+        ' tokens = min(:capacity, tokens + max(0, :now - updated_at) * :rate)'
+        '  - (min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= 1),'
+        ' updated_at = max(updated_at, :now) '
+        'RETURNING allowed, tokens'
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS bucket ('
+            ' key TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' allowed INTEGER NOT NULL'
+            ') WITHOUT ROWID'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, now):
+        allowed, tokens = self._connection().execute(
+            self._TAKE, {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}
+        ).fetchone()
+        return bool(allowed), tokens
+
+    def prune(self, before):
+        self._connection().execute('DELETE FROM bucket WHERE updated_at < ?', (before,))
+
+
+class SqlBucketStore:
+    """Token buckets in the application database, shared by every worker and host.
+
+    The same single-statement upsert as FileBucketStore, through the
+    RateLimitBucket model, on SQLite or Postgres. It runs on its own short
+    transaction, never the request's session, so a rejected request leaves
+    nothing behind and an allowed one has already committed its token.
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+
+    def take(self, key, capacity, rate, now):
+        table = self.model.__table__
+        dialect = self.db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            least, greatest = func.least, func.greatest
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            least, greatest = func.min, func.max
+        else:
+            raise NotImplementedError(f"Rate limit buckets are not supported on {dialect}")
+        refilled = least(capacity, table.c.tokens + greatest(0.0, now - table.c.updated_at) * rate)
+        stmt = insert(table).values(key=key, tokens=capacity - 1, updated_at=now, allowed=True)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                'allowed': refilled >= 1,
+                'tokens': refilled - case((refilled >= 1, 1), else_=0),
+                'updated_at': greatest(table.c.updated_at, now),
+            },
+        ).returning(table.c.allowed, table.c.tokens)
+        with self.db.engine.begin() as conn:
+            allowed, tokens = conn.execute(stmt).one()
+        return bool(allowed), tokens
+
+    def prune(self, before):
+        table = self.model.__table__
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.updated_at < before))
+
+
+def create_bucket_store(backend, db=None, model=None, path=None):
+    """Build the bucket store named by `backend`: memory, file or sql"""
+    if backend == 'memory':
+        return MemoryBucketStore()
+    if backend == 'file':
+        return FileBucketStore(path or 'rate_limits.db')
+    if backend == 'sql':
+        if db is None or model is None:
+            raise ValueError("The sql rate limit backend needs a database and a RateLimitBucket model")
+        return SqlBucketStore(db, model)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+def request_queue_seconds(header):
+    """Seconds since the proxy stamped the request, from e.g. `X-Request-Start: t=1700000000.123`.
+
+    Accepts seconds, milliseconds or microseconds since the epoch, with or
+    without the "t=" prefix nginx and Heroku-style routers use; None when
+    the header is missing or unreadable.
+    """
+    value = request.headers.get(header, '').strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        stamp = float(value)
+    except ValueError:
+        return None
+    while stamp > 1e11:
+        stamp /= 1000.0
+    return max(0.0, time.time() - stamp)
+
+
+class LoadShedder:
+    """Turns away low-priority requests while requests queue for too long.
+
+    Like CoDel, it watches the smallest queue time seen over each `window`:
+    a burst raises the largest, but only a standing queue raises the
+    smallest. While that minimum is above `target` seconds the worker counts
+    as overloaded; low-priority requests are refused and normal ones are
+    refused if they themselves waited over twice the target. Critical
+    requests are always served. More than `max_in_flight` concurrent
+    requests in this process (if set) counts as overload too. Queue time is
+    read from `header` only if one is given, and only the proxy may set it:
+    a client could otherwise send one old stamp per window and have everyone
+    shed.
+    """
+
+    def __init__(self, target=0.5, window=1.0, max_in_flight=0, header=None):
+        self.target = target
+        self.window = window
+        self.max_in_flight = max_in_flight
+        self.header = header
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+        self._window_started = time.monotonic()
+        self._window_min = None
+        self._overloaded = False
+
+    def observe(self, queued):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_started >= self.window:
+                # Samples in a window decide the next one; no samples means no queue
+                self._overloaded = self._window_min is not None and self._window_min > self.target
+                self._window_started, self._window_min = now, None
+            if queued is not None and (self._window_min is None or queued < self._window_min):
+                self._window_min = queued
+            return self._overloaded
+
+    def admit(self, priority):
+        """Whether to serve a request of `priority`; call finish() after every admitted one"""
+        queued = request_queue_seconds(self.header) if self.header else None
+        overloaded = self.observe(queued)
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                overloaded = True
+            admitted = (
+                priority == 'critical' or not overloaded
+                or (priority != 'low' and (queued is None or queued <= 2 * self.target))
+            )
+            if admitted:
+                self.in_flight += 1
+            else:
+                self.shed += 1
+            return admitted
+
+    def finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class RateLimiter:
+    """Per-endpoint token buckets per user, plus load shedding, before each request.
+
+    A request is keyed by the user id of a valid token (see auth.identify())
+    or else the client address, so one account cannot dodge its quota by
+    hopping addresses and users behind one carrier NAT do not share a
+    bucket. Each endpoint's quota (see DEFAULT_LIMITS) is a bucket of that
+    many tokens refilled evenly over the period. Over quota gets 429 with
+    Retry-After; shed requests get 503. Allowed requests carry
+    X-RateLimit-Limit and X-RateLimit-Remaining.
+    """
+
+    def __init__(self):
+        self.store = None
+        self.limits = dict(DEFAULT_LIMITS)
+        self.priorities = dict(DEFAULT_PRIORITIES)
+        self.shedder = LoadShedder()
+        self.identify = lambda: None
+        self.rejected = 0
+        self._pruned = time.monotonic()
+
+    def init_app(self, app, store, identify=None):
+        self.store = store
+        self.identify = identify or (lambda: None)
+        self.limits = {**DEFAULT_LIMITS, **parse_limits(app.config.get('RATE_LIMITS'))}
+        self.priorities = {**DEFAULT_PRIORITIES, **parse_priorities(app.config.get('LOAD_SHED_PRIORITIES'))}
+        self.shedder = LoadShedder(
+            target=app.config.get('LOAD_SHED_QUEUE_MS', 500) / 1000.0,
+            max_in_flight=app.config.get('LOAD_SHED_MAX_IN_FLIGHT', 0),
+            header=app.config.get('LOAD_SHED_QUEUE_HEADER') or None,
+        )
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['rate_limiter'] = self
+
+    def _lookup(self, table, endpoint, default):
+        if endpoint in table:
+            return endpoint, table[endpoint]
+        name = endpoint.rsplit('.', 1)[-1]
+        if name in table:
+            return name, table[name]
+        return 'default', default
+
+    def _before_request(self):
+        endpoint = request.endpoint or 'unmatched'
+        _, priority = self._lookup(self.priorities, endpoint, 'normal')
+        if not self.shedder.admit(priority):
+            return jsonify({"message": "Server busy, please try again"}), 503, {'Retry-After': '1'}
+        g.rate_limit_admitted = True
+
+        rule, limit = self._lookup(self.limits, endpoint, self.limits.get('default'))
+        if limit is None:
+            return None
+        capacity, period = limit
+        user_id = self.identify()
+        who = f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+        now = time.time()
+        try:
+            allowed, tokens = self.store.take(f'{rule}:{who}', capacity, capacity / period, now)
+            self._maybe_prune(now)
+        except Exception:
+            # A broken shared store must not take the API down with it
+            log.exception("Rate limit store failed")
+            return None
+        if not allowed:
+            self.rejected += 1
+            retry_after = max(1, round((1 - tokens) * period / capacity))
+            return jsonify({"message": "Too many requests, please slow down"}), 429, {
+                'Retry-After': str(retry_after), 'X-RateLimit-Limit': str(capacity), 'X-RateLimit-Remaining': '0',
+            }
+        g.rate_limit = (capacity, int(tokens))
+        return None
+
+    def _maybe_prune(self, now):
+        if time.monotonic() - self._pruned < PRUNE_INTERVAL:
+            return
+        self._pruned = time.monotonic()
+        # A bucket idle for a whole period is full again, the same as no bucket
+        longest = max((limit[1] for limit in self.limits.values() if limit), default=0)
+        self.store.prune(now - longest)
+
+    def _after_request(self, response):
+        limit = g.get('rate_limit')
+        if limit is not None:
+            response.headers['X-RateLimit-Limit'] = str(limit[0])
+            response.headers['X-RateLimit-Remaining'] = str(limit[1])
+        return response
+
+    def _teardown_request(self, exc):
+        if g.pop('rate_limit_admitted', None):
+            self.shedder.finish()
+
+
+# One per process; quotas, store and shedding thresholds come from init_app()
+rate_limiter = RateLimiter()
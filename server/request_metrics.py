@@ -0,0 +1,304 @@
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+# Histogram upper bounds; each also gets a +Inf bucket
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+# Deepest stack kept per profiler sample
+MAX_STACK_DEPTH = 128
+
+# The RequestStats of the request running in this thread or greenlet, if any
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """What one request spent, filled in by the engine and hasher hooks"""
+
+    __slots__ = ('started', 'db_seconds', 'statements', 'bcrypt_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.bcrypt_seconds = 0.0
+
+
+def current_stats():
+    return _current.get()
+
+
+class Histogram:
+    """A Prometheus histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            base = _labels(self.label_names, labels)
+            running = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                running += bucket
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {running}')
+            lines.append(f'{self.name}_sum{{{base}}} {_number(total)}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving requests, for slow-request flame graphs.
+
+    One daemon thread wakes every `interval` seconds and records the current
+    stack of each thread that has called begin() and not yet end(). end()
+    returns the samples as collapsed stacks ("outer;inner;leaf count" lines),
+    the input flamegraph.pl and speedscope read. Sampling costs nothing while
+    no request is being profiled.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self):
+        with self._lock:
+            self._samples[threading.get_ident()] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self):
+        with self._lock:
+            samples = self._samples.pop(threading.get_ident(), None)
+        return samples or Counter()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                watched = list(self._samples)
+            if not watched:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for ident in watched:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                with self._lock:
+                    samples = self._samples.get(ident)
+                    if samples is not None:
+                        samples[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+
+def collapsed(samples):
+    """Collapsed-stack text for `samples`, one "stack count" line each"""
+    return ''.join(f'{stack} {count}\n' for stack, count in samples.most_common())
+
+
+class RequestMetrics:
+    """Per-endpoint request timings exposed in the Prometheus text format.
+
+    For every request it records wall time, time spent in database
+    statements and how many were run, response bytes and time spent waiting
+    on bcrypt, labelled by endpoint (the Flask view, so /products/12 and
+    /products/13 share a series). Database statements are counted on every
+    engine in the process and attributed to the request whose thread or
+    greenlet ran them. With PROFILE_SLOW_MS set, requests are sampled and the
+    collapsed stacks of those slower than that are written to PROFILE_DIR.
+    Counts are per process; scrape each worker, as with pool_metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.duration = Histogram(
+            'http_request_duration_seconds', 'Wall time to answer a request.', ('endpoint', 'method'), SECONDS_BUCKETS)
+        self.db_time = Histogram(
+            'http_request_db_seconds', 'Time a request spent executing SQL.', ('endpoint',), SECONDS_BUCKETS)
+        self.statements = Histogram(
+            'http_request_sql_statements', 'SQL statements a request executed.', ('endpoint',), STATEMENT_BUCKETS)
+        self.response_size = Histogram(
+            'http_response_size_bytes', 'Response body size.', ('endpoint',), BYTES_BUCKETS)
+        self.bcrypt_time = Histogram(
+            'http_request_bcrypt_seconds', 'Time a request waited on password hashing.', ('endpoint',), SECONDS_BUCKETS)
+        self.profiler = None
+        self.slow_seconds = None
+        self.profile_dir = None
+        self._watching = False
+
+    def init_app(self, app, hasher=None):
+        slow_ms = app.config.get('PROFILE_SLOW_MS') or 0
+        if slow_ms > 0:
+            self.slow_seconds = slow_ms / 1000.0
+            self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+            self.profiler = SamplingProfiler(app.config.get('PROFILE_INTERVAL_MS', 5) / 1000.0)
+        if hasher is not None:
+            hasher.on_timing = self.record_bcrypt
+        self.watch()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['request_metrics'] = self
+
+    # Hooks
+
+    def watch(self):
+        """Attribute SQL statements on every engine to the current request"""
+        if self._watching:
+            return self
+        self._watching = True
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if _current.get() is not None:
+                conn.info.setdefault('request_metrics_started', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            stats = _current.get()
+            started = conn.info.get('request_metrics_started')
+            if stats is not None and started:
+                stats.db_seconds += time.perf_counter() - started.pop()
+                stats.statements += 1
+
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        return self
+
+    def record_bcrypt(self, seconds):
+        stats = _current.get()
+        if stats is not None:
+            stats.bcrypt_seconds += seconds
+
+    def _before_request(self):
+        g.request_metrics_token = _current.set(RequestStats())
+        if self.profiler is not None:
+            self.profiler.begin()
+
+    def _after_request(self, response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        # Streamed bodies (the order stream) have no length to report
+        size = None if response.is_streamed else response.calculate_content_length()
+        with self._lock:
+            self.requests[(endpoint, request.method, response.status_code)] += 1
+            self.duration.observe((endpoint, request.method), elapsed)
+            self.db_time.observe((endpoint,), stats.db_seconds)
+            self.statements.observe((endpoint,), stats.statements)
+            self.bcrypt_time.observe((endpoint,), stats.bcrypt_seconds)
+            if size is not None:
+                self.response_size.observe((endpoint,), size)
+        if self.profiler is not None:
+            samples = self.profiler.end()
+            if elapsed >= self.slow_seconds and samples:
+                self._dump_profile(endpoint, elapsed, samples)
+        return response
+
+    def _teardown_request(self, exc):
+        if self.profiler is not None:
+            self.profiler.end()
+        token = g.pop('request_metrics_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    def _dump_profile(self, endpoint, elapsed, samples):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint.replace('.', '-')}-{elapsed * 1000:.0f}ms.folded"
+            with open(os.path.join(self.profile_dir, name), 'w') as f:
+                f.write(collapsed(samples))
+        except OSError:
+            log.warning("Could not write profile", exc_info=True)
+
+    # Exposition
+
+    def render(self, pool_snapshot=None):
+        """All series in the Prometheus text exposition format"""
+        with self._lock:
+            lines = ['# HELP http_requests_total Requests answered.', '# TYPE http_requests_total counter']
+            for labels, count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{{{_labels(('endpoint', 'method', 'status'), labels)}}} {count}")
+            for histogram in (self.duration, self.db_time, self.statements, self.response_size, self.bcrypt_time):
+                lines.extend(histogram.render())
+        if pool_snapshot is not None:
+            lines.extend(_pool_lines(pool_snapshot))
+        return '\n'.join(lines) + '\n'
+
+
+def _pool_lines(snapshot):
+    """db_engine.pool_metrics' snapshot as Prometheus series"""
+    lines = [
+        '# HELP db_pool_checkouts_total Connections checked out of the pool.',
+        '# TYPE db_pool_checkouts_total counter',
+        f"db_pool_checkouts_total {snapshot['checkouts']}",
+        '# HELP db_pool_timeouts_total Checkouts that gave up waiting for a connection.',
+        '# TYPE db_pool_timeouts_total counter',
+        f"db_pool_timeouts_total {snapshot['timeouts']}",
+        '# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection.',
+        '# TYPE db_pool_checkout_wait_seconds histogram',
+    ]
+    for bound, count in snapshot['wait_ms_buckets'].items():
+        le = bound if bound == '+Inf' else _number(float(bound) / 1000.0)
+        lines.append(f'db_pool_checkout_wait_seconds_bucket{{le="{le}"}} {count}')
+    lines.append(f"db_pool_checkout_wait_seconds_sum {_number(snapshot['wait_ms_total'] / 1000.0)}")
+    lines.append(f"db_pool_checkout_wait_seconds_count {snapshot['checkouts']}")
+    for field in ('size', 'checked_out', 'idle', 'overflow'):
+        lines.append(f'# HELP db_pool_{field} Connections per pool: {field.replace("_", " ")}.')
+        lines.append(f'# TYPE db_pool_{field} gauge')
+        for index, pool in enumerate(snapshot['pools']):
+            lines.append(f'db_pool_{field}{{pool="{index}"}} {pool[field]}')
+    return lines
+
+
+# One per process, shared by every app the process creates
+request_metrics = RequestMetrics().watch()
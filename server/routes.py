@@ -1,17 +1,42 @@
+import logging
+
 from flask import request, jsonify
-from app import app, db, bcrypt
-from flask_jwt_extended import (
-    create_access_token,
-    jwt_required,
-    get_jwt_identity,
-    get_jwt
-)
+from app import app, db, password_hasher, delivery_zones, nearby_vendor_ids
+from flask_jwt_extended import create_access_token
 from flask_cors import CORS
-from models import User, Product, Order, Delivery, Cart
+from models import User, Product, Cart
+from catalog_query import (
+    CatalogQueryError, parse_product_query, product_page, add_pagination_headers, encode_cursor, decode_cursor,
+)
+from search_index import ProductSearchIndex
+from password_hashing import HasherBusy
+from cart_store import SqlCartStore
+from auth import auth, current_user_id
+from orders import (
+    OrderError, HISTORY_PAGE_SIZE, place_cart_order, order_history, cart_lines, checkout as checkout_orders,
+)
+from order_archive import archived_history
+
+log = logging.getLogger(__name__)
 
 # Allow requests from your React app
 CORS(app, origins=["http://localhost:3000"], supports_credentials=True)
 
+
+def serialize_product(p):
+    return {"id": p.id, "name": p.name, "description": p.description, "price": p.price}
+
+
+def load_search_documents():
+    rows = db.session.query(Product.id, Product.name, Product.description, Product.price)
+    return [serialize_product(row) for row in rows]
+
+
+cart_store = SqlCartStore(db, Cart)
+
+# Built on the first search, then kept in step with committed product changes
+search_index = ProductSearchIndex(load_search_documents, refresh_interval=300).watch(Product, serialize_product)
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({"message": "Mama Mboga Delivery App API is running!", "status": "success"}), 200
@@ -35,17 +60,18 @@ def register():
             return jsonify({"message": "Email already exists"}), 400
         if len(data['password']) < 6:
             return jsonify({"message": "Password must be at least 6 characters"}), 400
-       
-        hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
         if data['role'] != 'customer':
             return jsonify({"message": "Only customers can register"}), 400
        
+        hashed_password = password_hasher.hash(data['password'])
         new_user = User(email=data['email'], password=hashed_password, role=data['role'])
         db.session.add(new_user)
         db.session.commit()
         return jsonify({"message": "User created successfully"}), 201
+    except HasherBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503, {'Retry-After': '1'}
     except Exception as e:
-        print("Error in register:", e)
+        log.exception("Register failed")
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
 
 @app.route('/login', methods=['POST'])
@@ -56,7 +82,14 @@ def login():
             return jsonify({"message": "Missing email or password"}), 400
        
         user = User.query.filter_by(email=data['email']).first()
-        if user and bcrypt.check_password_hash(user.password, data['password']):
+        if user and password_hasher.check(user.password, data['password']):
+            # Upgrade hashes made with an outdated cost while we have the password
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(data['password'])
+                    db.session.commit()
+                except HasherBusy:
+                    pass
             token = create_access_token(
                 identity=str(user.id),
                 additional_claims={
@@ -71,24 +104,25 @@ def login():
         
         return jsonify({"message": "Invalid credentials"}), 401
 
+    except HasherBusy:
+        return jsonify({"message": "Server busy, please try again"}), 503, {'Retry-After': '1'}
     except Exception as e:
-        print("Error in login:", e)
+        log.exception("Login failed")
         return jsonify({"message": f"An error occurred during login: {str(e)}"}), 500
 
 @app.route('/products', methods=['GET'])
 def get_products():
     try:
-        products = Product.query.all()
-        return jsonify([
-            {
-                "id": p.id,
-                "name": p.name,
-                "description": p.description,
-                "price": p.price
-            } for p in products
-        ]), 200
-    except Exception as e:
-        print("Error in get_products:", e)
+        params = parse_product_query(request.args)
+    except CatalogQueryError as e:
+        return jsonify({"message": str(e)}), 400
+    try:
+        near = params[-1]
+        products, next_cursor = product_page(Product, params, vendor_ids=nearby_vendor_ids(near) if near else None)
+        response = jsonify([serialize_product(p) for p in products])
+        return add_pagination_headers(response, next_cursor), 200
+    except Exception:
+        log.exception("Product listing failed")
         # Return sample products if database is not available
         sample_products = [
             {"id": 1, "name": "Tomato", "description": "Fresh red tomatoes", "price": 3.5},
@@ -99,176 +133,120 @@ def get_products():
         ]
         return jsonify(sample_products), 200
 
+@app.route('/products/search', methods=['GET'])
+def search_products():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"message": "Search query is required"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        except ValueError:
+            return jsonify({"message": "Invalid limit"}), 400
+
+        search_index.ensure_built()
+        return jsonify(search_index.search(query, limit=limit)), 200
+    except Exception as e:
+        log.exception("Search failed")
+        return jsonify({"message": f"An error occurred: {str(e)}"}), 500
+
 @app.route('/order', methods=['POST'])
-@jwt_required()
+@auth.roles('customer')
 def place_order():
     try:
-        # Get the user id from the token and convert it to an integer for DB queries.
-        user_id = int(get_jwt_identity())
-        claims = get_jwt()  # Additional claims (such as role)
-        print("User ID:", user_id)
-        print("Claims:", claims)
-
-        # Check if the user role is 'customer'
-        if claims.get('role') != 'customer':
-            return jsonify({"message": "Unauthorized"}), 403
+        user_id = current_user_id()
 
         # Get the JSON payload from the request
         data = request.get_json()
-        print("Received order payload:", data)
         if not data or 'cart_items' not in data:
             return jsonify({"message": "Cart items are required"}), 400
 
-        order_count = 0
-
-        # Iterate over each item in the cart_items array
-        for item in data['cart_items']:
-            if 'product_id' not in item or 'quantity' not in item:
-                return jsonify({"message": "Product ID and quantity are required"}), 400
-
-            # Create a new order
-            new_order = Order(
-                customer_id=user_id,
-                product_id=item['product_id'],
-                status='processing'
-            )
-            db.session.add(new_order)
-            db.session.commit()  # Commit so that new_order.id is generated
-            print(f"Created order: {new_order.id} for product {item['product_id']} with quantity {item['quantity']}")
-
-            # Create a corresponding delivery record
-            new_delivery = Delivery(order_id=new_order.id, delivery_status='on the way')
-            db.session.add(new_delivery)
-            db.session.commit()
-            print(f"Created delivery for order: {new_order.id}")
-
-            order_count += 1
-
-        print(f"Total orders created: {order_count}")
-        return jsonify({"message": "Order placed successfully"}), 201
+        body, status_code = place_cart_order(
+            user_id, data['cart_items'], idempotency_key=request.headers.get('Idempotency-Key'),
+            zones=delivery_zones, reservation_ttl=app.config['STOCK_RESERVATION_TTL'],
+        )
+        log.info("Orders created", extra={'user_id': user_id, 'orders': len(body['order_ids'])})
+        return jsonify(body), status_code
 
+    except OrderError as e:
+        return jsonify({"message": e.message}), e.status_code
     except Exception as e:
-        print("Error in place_order:", e)
+        log.exception("Place order failed")
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
 
 @app.route('/orders', methods=['GET'])
-@jwt_required()
+@auth.roles('customer')
 def view_orders():
     try:
-        user_id = int(get_jwt_identity())
-        claims = get_jwt()
-        if claims.get('role') != 'customer':
-            return jsonify({"message": "Unauthorized"}), 403
-
-        orders = Order.query.filter_by(customer_id=user_id).all()
-        orders_list = [
-            {
-                "id": o.id,
-                "status": o.status,
-                "product_id": o.product_id,
-                "product_name": o.product.name,
-                "delivery_status": o.delivery.delivery_status if o.delivery else 'N/A'
-            }
-            for o in orders
-        ]
-        return jsonify(orders_list), 200
+        user_id = current_user_id()
+        try:
+            limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), 200)
+            before = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except (ValueError, CatalogQueryError):
+            return jsonify({"message": "Invalid limit or cursor"}), 400
+        # Recent orders come from the order table; older ones only when asked for
+        history = archived_history if request.args.get('archived') in ('1', 'true') else order_history
+        orders, next_id = history(user_id, limit=limit, before=before)
+        response = jsonify(orders)
+        return add_pagination_headers(response, encode_cursor(next_id) if next_id else None), 200
     except Exception as e:
-        print("Error in view_orders:", e)
+        log.exception("View orders failed")
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
 
 @app.route('/cart', methods=['POST'])
-@jwt_required()
+@auth.required()
 def add_to_cart():
     try:
-        user_id = int(get_jwt_identity())
+        user_id = current_user_id()
         data = request.get_json()
         if 'product_id' not in data or 'quantity' not in data:
             return jsonify({"message": "Product ID and quantity are required"}), 400
 
-        existing_cart_item = Cart.query.filter_by(user_id=user_id, product_id=data['product_id']).first()
-        if existing_cart_item:
-            existing_cart_item.quantity += data['quantity']
-            db.session.commit()
+        quantity = cart_store.add(user_id, data['product_id'], data['quantity'])
+        if quantity > data['quantity']:
             return jsonify({"message": "Cart updated"}), 200
-
-        new_cart_item = Cart(user_id=user_id, product_id=data['product_id'], quantity=data['quantity'])
-        db.session.add(new_cart_item)
-        db.session.commit()
         return jsonify({"message": "Product added to cart"}), 201
     except Exception as e:
-        print("Error in add_to_cart:", e)
+        log.exception("Add to cart failed")
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
 
 @app.route('/cart', methods=['GET'])
-@jwt_required()
+@auth.required()
 def get_cart():
     try:
-        user_id = int(get_jwt_identity())
-        cart_items = Cart.query.filter_by(user_id=user_id).all()
+        user_id = current_user_id()
+        cart_items = cart_lines(user_id)
         if not cart_items:
             return jsonify({"message": "Your cart is empty"}), 404
-        return jsonify([
-            {
-                'product_id': item.product.id,
-                'product_name': item.product.name,
-                'price': item.product.price,
-                'quantity': item.quantity
-            } for item in cart_items
-        ]), 200
+        return jsonify(cart_items), 200
     except Exception as e:
-        print("Error in get_cart:", e)
+        log.exception("Cart fetch failed")
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
 
 @app.route('/cart/<int:product_id>', methods=['DELETE'])
-@jwt_required()
+@auth.required()
 def remove_from_cart(product_id):
     try:
-        user_id = int(get_jwt_identity())
-        cart_item = Cart.query.filter_by(user_id=user_id, product_id=product_id).first()
-        if not cart_item:
+        user_id = current_user_id()
+        if not cart_store.remove(user_id, product_id):
             return jsonify({"message": "Product not in cart"}), 404
-        db.session.delete(cart_item)
-        db.session.commit()
         return jsonify({"message": "Product removed from cart"}), 200
     except Exception as e:
-        print("Error in remove_from_cart:", e)
+        log.exception("Remove from cart failed")
         return jsonify({"message": f"An error occurred: {str(e)}"}), 500
     
 @app.route('/checkout', methods=['POST'])
-@jwt_required()
+@auth.roles('customer')
 def checkout():
     try:
-        # Get the customer ID from the token (convert to integer)
-        user_id = int(get_jwt_identity())
-        claims = get_jwt()
-        if claims.get('role') != 'customer':
-            return jsonify({"message": "Unauthorized"}), 403
-
-        # Fetch all orders for the customer with status 'processing'
-        orders = Order.query.filter_by(customer_id=user_id, status='processing').all()
-        if not orders:
-            return jsonify({"message": "No orders to checkout"}), 400
-
-        for order in orders:
-            # Update order status to 'completed'
-            order.status = 'completed'
-            db.session.add(order)
-           
-            # Access the delivery as a single object now
-            if order.delivery:
-                order.delivery.delivery_status = 'in transit'
-                db.session.add(order.delivery)
-            else:
-                # Create a new delivery record if it doesn't exist
-                new_delivery = Delivery(order_id=order.id, delivery_status='in transit')
-                db.session.add(new_delivery)
-
-        db.session.commit()
-        return jsonify({"message": "Checkout successful. Delivery has started."}), 200
-
+        user_id = current_user_id()
+        queued = checkout_orders(user_id)
+        return jsonify({"message": "Checkout accepted. Delivery will start shortly.", "orders": queued}), 202
 
+    except OrderError as e:
+        return jsonify({"message": e.message}), e.status_code
     except Exception as e:
-        print("Error in checkout:", e)
+        log.exception("Checkout failed")
         return jsonify({"message": f"An error occurred during checkout: {str(e)}"}), 500
 
 
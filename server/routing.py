@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import bindparam, update
+
+from models import db, Delivery, Rider, ACTIVE_DELIVERY_STATUSES
+from dispatch import distance_matrix
+
+# Smallest gain in km a 2-opt move must make; stops float noise from looping
+MIN_GAIN_KM = 1e-6
+
+
+def route_length(dist, order):
+    """Length of the open path visiting `order` in turn"""
+    order = np.asarray(order)
+    return float(dist[order[:-1], order[1:]].sum()) if order.size > 1 else 0.0
+
+
+def nearest_neighbour(dist, start=0):
+    """Open path from `start` that always moves to the closest unvisited point"""
+    n = dist.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+    return np.array(order, dtype=np.int64)
+
+
+def two_opt(dist, order, deadline=None):
+    """Improve an open path with fixed first point by reversing segments.
+
+    Each step takes the best reversal starting at position i, scoring every
+    segment end j in one vectorised expression. The path gets a zero-cost
+    end point appended so the open tail needs no special case. Stops at a
+    local optimum or once `time.perf_counter()` passes `deadline`; returns
+    the path and whether it converged.
+    """
+    n = dist.shape[0]
+    padded = np.zeros((n + 1, n + 1), dtype=np.float64)
+    padded[:n, :n] = dist
+    path = np.append(np.asarray(order, dtype=np.int64), n)
+    last = path.size - 1
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, last - 1):
+            if deadline is not None and time.perf_counter() > deadline:
+                return path[:-1], False
+            a, b = path[i - 1], path[i]
+            ends, after = path[i + 1:last], path[i + 2:last + 1]
+            # Replacing a-b and c-d with a-c and b-d reverses b..c
+            gain = padded[a, b] + padded[ends, after] - padded[a, ends] - padded[b, after]
+            best = int(np.argmax(gain))
+            if gain[best] > MIN_GAIN_KM:
+                j = i + 1 + best
+                path[i:j + 1] = path[i:j + 1][::-1].copy()
+                improved = True
+    return path[:-1], True
+
+
+def solve_route(dist, time_budget_ms=None):
+    """Near-shortest open path from point 0 through every other point.
+
+    Nearest neighbour gives the starting tour and 2-opt improves it for at
+    most `time_budget_ms`; on timeout the best path found so far is kept.
+    Returns (path, converged).
+    """
+    deadline = time.perf_counter() + time_budget_ms / 1000 if time_budget_ms else None
+    if dist.shape[0] < 4:
+        return nearest_neighbour(dist), True
+    return two_opt(dist, nearest_neighbour(dist), deadline)
+
+
+@dataclass
+class RoutePlan:
+    # Stop index of each delivery's pickup (None once picked up) and dropoff
+    pickup_stops: dict
+    dropoff_stops: dict
+    converged: bool
+
+
+class RoutePlanner:
+    """Orders each rider's active deliveries into one multi-stop route.
+
+    A route first collects from every market still to visit, then drops off
+    in a sequence solved over the rider's own distance matrix. Plans are
+    cached per batch (delivery ids and their stages) so a batch that
+    has not changed is never solved twice; at most `max_entries` batches are
+    kept, least recently used first out. Every solve is bounded by
+    `time_budget_ms`.
+    """
+
+    def __init__(self, time_budget_ms=50, max_entries=4096):
+        self.time_budget_ms = time_budget_ms
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, origin, deliveries):
+        """Plan one batch from the rider's position `origin` (lat, lon).
+
+        `deliveries` holds (id, status, pickup_lat, pickup_lon, dropoff_lat,
+        dropoff_lon) tuples. Deliveries without dropoff coordinates go last,
+        in id order.
+        """
+        # The batch alone is the key: a rider moving does not make the plan stale
+        key = tuple(sorted((d[0], d[1]) for d in deliveries))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        deliveries = sorted(deliveries, key=lambda d: d[0])
+        pickup_stops, dropoff_stops = {}, {}
+        converged = True
+
+        to_collect = [d for d in deliveries if d[1] == 'assigned' and d[2] is not None and d[3] is not None]
+        markets = list(dict.fromkeys((d[2], d[3]) for d in to_collect))
+        position = origin
+        if markets:
+            path, done = self._solve(position, markets)
+            converged &= done
+            stop_of_market = {markets[p - 1]: stop for stop, p in enumerate(path[1:])}
+            for d in to_collect:
+                pickup_stops[d[0]] = stop_of_market[(d[2], d[3])]
+            position = markets[path[-1] - 1]
+
+        next_stop = len(markets)
+        located = [d for d in deliveries if d[4] is not None and d[5] is not None]
+        if located:
+            path, done = self._solve(position, [(d[4], d[5]) for d in located])
+            converged &= done
+            for p in path[1:]:
+                dropoff_stops[located[p - 1][0]] = next_stop
+                next_stop += 1
+        for d in deliveries:
+            if d[0] not in dropoff_stops:
+                dropoff_stops[d[0]] = next_stop
+                next_stop += 1
+
+        plan = RoutePlan(pickup_stops, dropoff_stops, converged)
+        with self._lock:
+            self._cache[key] = plan
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return plan
+
+    def _solve(self, origin, points):
+        if origin is None:
+            # No known position: start from the first point instead
+            origin = points[0]
+        coords = np.array([origin] + points, dtype=np.float64)
+        return solve_route(distance_matrix(coords, coords), self.time_budget_ms)
+
+    def _unplanned_riders(self, limit):
+        return [
+            rider_id for (rider_id,) in
+            db.session.query(Delivery.rider_id)
+            .filter(Delivery.delivery_status.in_(ACTIVE_DELIVERY_STATUSES), Delivery.dropoff_stop.is_(None))
+            .distinct()
+            .limit(limit)
+            .all()
+        ]
+
+    def _batches(self, rider_ids):
+        rows = (
+            db.session.query(
+                Delivery.rider_id, Delivery.id, Delivery.delivery_status,
+                Delivery.pickup_latitude, Delivery.pickup_longitude,
+                Delivery.dropoff_latitude, Delivery.dropoff_longitude,
+            )
+            .filter(Delivery.delivery_status.in_(ACTIVE_DELIVERY_STATUSES), Delivery.rider_id.in_(rider_ids))
+            .all()
+        )
+        batches = {}
+        for rider_id, *delivery in rows:
+            batches.setdefault(rider_id, []).append(tuple(delivery))
+        return batches
+
+    def plan_pending(self, budget_ms=2000, limit=1000):
+        """Re-plan riders whose batch gained deliveries since it was planned.
+
+        Works through up to `limit` riders with an unplanned delivery until
+        `budget_ms` runs out, writes the new stop order with one executemany
+        UPDATE and commits. Riders left over are picked up by the next call.
+        Returns the number of riders planned.
+        """
+        deadline = time.perf_counter() + budget_ms / 1000
+        rider_ids = self._unplanned_riders(limit)
+        if not rider_ids:
+            db.session.rollback()
+            return 0
+        batches = self._batches(rider_ids)
+        origins = {
+            rider_id: (lat, lon) if lat is not None and lon is not None else None
+            for rider_id, lat, lon in
+            db.session.query(Rider.id, Rider.latitude, Rider.longitude).filter(Rider.id.in_(rider_ids))
+        }
+
+        params, planned = [], 0
+        for rider_id in rider_ids:
+            if time.perf_counter() > deadline:
+                break
+            plan = self.plan(origins.get(rider_id), batches.get(rider_id, []))
+            params.extend(
+                {'delivery_id': delivery_id, 'pickup': plan.pickup_stops.get(delivery_id), 'dropoff': stop}
+                for delivery_id, stop in plan.dropoff_stops.items()
+            )
+            planned += 1
+        if params:
+            table = Delivery.__table__
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('delivery_id'))
+                .values(pickup_stop=bindparam('pickup'), dropoff_stop=bindparam('dropoff')),
+                params,
+            )
+        db.session.commit()
+        return planned
@@ -0,0 +1,203 @@
+from datetime import date, datetime
+
+from sqlalchemy import Date, Float, Integer, bindparam, case, delete, func, insert, select
+
+from models import Product, Order, OrderArchive, VendorSalesDaily
+
+# Order ids aggregated per statement when rebuilding, so no single query
+# holds the whole order table
+REBUILD_WINDOW = 50_000
+# Rollup rows per INSERT when rebuilding
+REBUILD_BATCH = 1000
+# Longest date range one sales report covers
+REPORT_MAX_DAYS = 366
+
+METRICS = ('orders', 'units', 'completed_orders', 'completed_units', 'expired_orders', 'expired_units', 'revenue')
+# The counters each order outcome adds to
+OUTCOMES = {
+    'placed': ('orders', 'units'),
+    'completed': ('completed_orders', 'completed_units'),
+    'expired': ('expired_orders', 'expired_units'),
+}
+
+# Rollups are written through their table: nothing is cached per entity, and
+# an upsert of many rows is one statement
+rollups = VendorSalesDaily.__table__
+products = Product.__table__
+
+
+def _upsert(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        raise NotImplementedError(f"Sales rollups are not supported on {dialect}")
+    return upsert(rollups)
+
+
+def _as_date(value):
+    # SQLite's date() gives text, Postgres a date
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def record_sales(session, outcome, lines):
+    """Add order lines that were placed, completed or expired to the daily rollups.
+
+    `lines` are (product_id, quantity, unit_price, created_at) of the orders.
+    Each counts toward the day it was placed, whenever its outcome arrives,
+    so the rollups always equal a rebuild_sales() from the order tables.
+    Lines are summed per product and day first and written with one upsert
+    that adds to existing rows, in the caller's transaction: the rollups
+    commit exactly when the orders do. A completed line without a unit
+    price earns the product's current price. Orders without created_at
+    predate the rollups and are left out. Returns the number of rollup rows
+    touched.
+    """
+    grouped = {}
+    for product_id, quantity, unit_price, created_at in lines:
+        if created_at is None:
+            continue
+        count, units, priced, unpriced = grouped.get((product_id, created_at.date()), (0, 0, 0.0, 0))
+        if unit_price is None:
+            unpriced += quantity
+        else:
+            priced += quantity * unit_price
+        grouped[(product_id, created_at.date())] = (count + 1, units + quantity, priced, unpriced)
+    if not grouped:
+        return 0
+
+    count_column, units_column = OUTCOMES[outcome]
+    product_id = bindparam('r_product_id', type_=Integer)
+    values = dict.fromkeys(METRICS, 0)
+    values.update({
+        'vendor_id': select(products.c.vendor_id).where(products.c.id == product_id).scalar_subquery(),
+        'day': bindparam('r_day', type_=Date),
+        'product_id': product_id,
+        count_column: bindparam('r_count', type_=Integer),
+        units_column: bindparam('r_units', type_=Integer),
+    })
+    changed = [count_column, units_column]
+    if outcome == 'completed':
+        current_price = select(products.c.price).where(products.c.id == product_id).scalar_subquery()
+        values['revenue'] = bindparam('r_priced', type_=Float) + bindparam('r_unpriced', type_=Integer) * func.coalesce(
+            current_price, 0.0)
+        changed.append('revenue')
+    stmt = _upsert(session).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollups.c.vendor_id, rollups.c.day, rollups.c.product_id],
+        set_={column: rollups.c[column] + stmt.excluded[column] for column in changed},
+    )
+    session.execute(stmt, [
+        {'r_product_id': product_id, 'r_day': day, 'r_count': count, 'r_units': units,
+         'r_priced': priced, 'r_unpriced': unpriced}
+        for (product_id, day), (count, units, priced, unpriced) in sorted(grouped.items())
+    ])
+    return len(grouped)
+
+
+def _aggregate(session, source, since, until, window, totals):
+    """Add the orders in `source` (Order or OrderArchive) to `totals`; returns how many were read"""
+    bounds = [source.created_at.isnot(None)]
+    if since is not None:
+        bounds.append(source.created_at >= datetime.combine(since, datetime.min.time()))
+    if until is not None:
+        bounds.append(source.created_at < datetime.combine(until, datetime.min.time()))
+    low, high = session.execute(select(func.min(source.id), func.max(source.id)).where(*bounds)).one()
+    if low is None:
+        return 0
+
+    completed, expired = source.status == 'completed', source.status == 'expired'
+    day = func.date(source.created_at)
+    aggregate = (
+        select(
+            Product.vendor_id, day, source.product_id,
+            func.count(source.id),
+            func.sum(source.quantity),
+            func.sum(case((completed, 1), else_=0)),
+            func.sum(case((completed, source.quantity), else_=0)),
+            func.sum(case((expired, 1), else_=0)),
+            func.sum(case((expired, source.quantity), else_=0)),
+            func.sum(case((completed, source.quantity * func.coalesce(source.unit_price, Product.price)), else_=0.0)),
+        )
+        .join(Product, Product.id == source.product_id)
+        .where(*bounds, source.id >= bindparam('low'), source.id < bindparam('high'))
+        .group_by(Product.vendor_id, day, source.product_id)
+    )
+    read = 0
+    for start in range(low, high + 1, window):
+        for vendor_id, placed_on, product_id, *metrics in session.execute(
+                aggregate, {'low': start, 'high': start + window}):
+            key = (vendor_id, _as_date(placed_on), product_id)
+            previous = totals.get(key)
+            totals[key] = metrics if previous is None else [a + b for a, b in zip(previous, metrics)]
+            read += metrics[0]
+    return read
+
+
+def rebuild_sales(session, since=None, until=None, window=REBUILD_WINDOW):
+    """Recompute the rollups of orders placed on days in [since, until) from the order tables.
+
+    For a backfill, or to repair rollups after orders were changed by hand.
+    The orders, hot and archived, are aggregated by the database, GROUP BY
+    vendor, product and day over one `window` of order ids at a time, so
+    each statement reads a bounded slice and returns at most one row per
+    product and day in it; the slices are merged here. The old rollups of
+    those days are then replaced in the caller's transaction. Orders placed
+    or completed on those days while this runs can be missed, so rebuild
+    closed days or run it while orders are paused. Returns (orders read,
+    rollup rows written).
+    """
+    totals = {}
+    read = sum(_aggregate(session, source, since, until, window, totals) for source in (Order, OrderArchive))
+
+    replace = delete(rollups)
+    if since is not None:
+        replace = replace.where(rollups.c.day >= since)
+    if until is not None:
+        replace = replace.where(rollups.c.day < until)
+    session.execute(replace)
+    rows = [
+        {'vendor_id': vendor_id, 'day': placed_on, 'product_id': product_id,
+         **dict(zip(METRICS, [int(value) for value in metrics[:-1]] + [float(metrics[-1])]))}
+        for (vendor_id, placed_on, product_id), metrics in sorted(totals.items())
+    ]
+    for start in range(0, len(rows), REBUILD_BATCH):
+        session.execute(insert(rollups), rows[start:start + REBUILD_BATCH])
+    return read, len(rows)
+
+
+def sales_report(session, vendor_id, since, until, product_id=None):
+    """A vendor's sales per product and day in [since, until], from the rollups alone.
+
+    One index range scan of the vendor's rollup rows; the per-product and
+    overall totals are summed from them here.
+    """
+    query = (
+        select(rollups.c.day, rollups.c.product_id, *(rollups.c[metric] for metric in METRICS))
+        .where(rollups.c.vendor_id == vendor_id, rollups.c.day >= since, rollups.c.day <= until)
+        .order_by(rollups.c.day, rollups.c.product_id)
+    )
+    if product_id is not None:
+        query = query.where(rollups.c.product_id == product_id)
+    days, per_product = [], {}
+    totals = dict.fromkeys(METRICS, 0)
+    for day, product_id, *values in session.execute(query):
+        days.append({'day': day.isoformat(), 'product_id': product_id, **dict(zip(METRICS, values))})
+        product = per_product.get(product_id)
+        if product is None:
+            product = per_product[product_id] = {'product_id': product_id, **dict.fromkeys(METRICS, 0)}
+        for metric, value in zip(METRICS, values):
+            product[metric] += value
+            totals[metric] += value
+    # Cents, without the float noise of summing many prices
+    for entry in (*days, *per_product.values(), totals):
+        entry['revenue'] = round(entry['revenue'], 2)
+    return {
+        'from': since.isoformat(),
+        'to': until.isoformat(),
+        'totals': totals,
+        'products': sorted(per_product.values(), key=lambda product: product['product_id']),
+        'days': days,
+    }
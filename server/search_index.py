@@ -0,0 +1,293 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+# Minimum trigram similarity (Dice coefficient) for a term to count as a typo match
+MIN_SIMILARITY = 0.45
+# Similarity given to terms within a small edit distance that trigrams miss,
+# typically transpositions such as "onoins" -> "onions"
+EDIT_SIMILARITY = 0.6
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(term):
+    padded = f'${term}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Optimal string alignment distance (Levenshtein plus transpositions)"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class ProductSearchIndex:
+    """In-process inverted index over product names and descriptions.
+
+    Terms map to the products containing them, and a trigram index over the
+    vocabulary finds terms close to a misspelt query token ("tomatos" ->
+    "tomatoes") without touching the database. `loader()` yields product dicts
+    with id, name, description and price and is only used for full rebuilds;
+    committed ORM changes to the watched model are applied incrementally.
+    """
+
+    def __init__(self, loader, refresh_interval=None):
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._rebuilding = False
+        self._clear()
+        self.built_at = None
+        self.refresh_interval = refresh_interval
+
+    def _clear(self):
+        self._docs = {}
+        self._doc_terms = {}
+        self._postings = defaultdict(dict)
+        self._grams = defaultdict(set)
+        self._ranked = {}
+
+    # Maintenance
+
+    def rebuild(self, products=None):
+        """Replace the index contents with `products` (default: the loader's)"""
+        products = list(self._loader() if products is None else products)
+        fresh = ProductSearchIndex(self._loader)
+        for product in products:
+            fresh._add(product)
+        with self._lock:
+            self._docs, self._doc_terms = fresh._docs, fresh._doc_terms
+            self._postings, self._grams = fresh._postings, fresh._grams
+            self._ranked = {}
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built_at is None:
+            self.rebuild()
+        elif (self.refresh_interval is not None and not self._rebuilding
+              and time.monotonic() - self.built_at > self.refresh_interval):
+            # Pick up changes committed by other workers without blocking queries
+            self._rebuilding = True
+            threading.Thread(
+                target=self._background_rebuild, args=(current_app._get_current_object(),), daemon=True
+            ).start()
+
+    def _background_rebuild(self, app):
+        try:
+            # The loader queries through Flask-SQLAlchemy's session
+            with app.app_context():
+                self.rebuild()
+        except Exception:
+            log.exception("Search index refresh failed")
+        finally:
+            self._rebuilding = False
+
+    def upsert(self, product):
+        with self._lock:
+            self._remove(product['id'])
+            self._add(product)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _add(self, product):
+        weights = {}
+        for term in tokenize(product.get('description')):
+            weights[term] = DESCRIPTION_WEIGHT
+        for term in tokenize(product.get('name')):
+            weights[term] = weights.get(term, 0) + NAME_WEIGHT
+        doc_id = product['id']
+        self._docs[doc_id] = product
+        self._doc_terms[doc_id] = tuple(weights)
+        for term, weight in weights.items():
+            if term not in self._postings:
+                for gram in trigrams(term):
+                    self._grams[gram].add(term)
+            self._postings[term][doc_id] = weight
+            self._ranked.pop(term, None)
+
+    def _remove(self, doc_id):
+        if self._docs.pop(doc_id, None) is None:
+            return
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            self._ranked.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                for gram in trigrams(term):
+                    self._grams[gram].discard(term)
+                    if not self._grams[gram]:
+                        del self._grams[gram]
+
+    def __len__(self):
+        return len(self._docs)
+
+    # Queries
+
+    def _similar_terms(self, token):
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for term in self._grams.get(gram, ()):
+                shared[term] += 1
+        matches = []
+        for term, common in shared.items():
+            similarity = 2.0 * common / (len(grams) + len(term))
+            if term.startswith(token):
+                # Treat the query token as a prefix so results appear while typing
+                similarity = max(similarity, 0.9)
+            if term == token:
+                similarity = 1.0
+            elif (similarity < MIN_SIMILARITY and common >= 2 and abs(len(term) - len(token)) <= 2
+                    and edit_distance(token, term) <= max(1, len(token) // 4)):
+                similarity = EDIT_SIMILARITY
+            if similarity >= MIN_SIMILARITY:
+                matches.append((term, similarity))
+        return matches
+
+    def search(self, query, limit=20):
+        """Return up to `limit` product dicts ranked by relevance to `query`"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            total_docs = len(self._docs) or 1
+            token_terms = []
+            for token in tokens:
+                terms = [
+                    (term, self._postings[term], similarity * math.log(1 + total_docs / len(self._postings[term])))
+                    for term, similarity in self._similar_terms(token)
+                ]
+                if terms:
+                    token_terms.append(terms)
+            if not token_terms:
+                return []
+            if len(token_terms) == 1:
+                return self._search_single(token_terms[0], limit)
+
+            # Score only products matching every token when there are any, so a
+            # common word like "fresh" does not drag its whole posting list in:
+            # start from the token with the fewest postings and probe the rest.
+            token_terms.sort(key=lambda terms: sum(len(postings) for _, postings, _ in terms))
+            candidates = set().union(*(postings.keys() for _, postings, _ in token_terms[0]))
+            for terms in token_terms[1:]:
+                candidates = {
+                    doc_id for doc_id in candidates
+                    if any(doc_id in postings for _, postings, _ in terms)
+                }
+            if not candidates:
+                candidates = set().union(*(postings.keys() for terms in token_terms for _, postings, _ in terms))
+
+            scores = dict.fromkeys(candidates, 0.0)
+            coverage = dict.fromkeys(candidates, 0)
+            for terms in token_terms:
+                for doc_id in candidates:
+                    best = 0.0
+                    for _, postings, weight in terms:
+                        value = postings.get(doc_id, 0.0) * weight
+                        if value > best:
+                            best = value
+                    if best:
+                        scores[doc_id] += best
+                        coverage[doc_id] += 1
+            top = heapq.nlargest(limit, candidates, key=lambda doc_id: (coverage[doc_id], scores[doc_id], -doc_id))
+            return [self._docs[doc_id] for doc_id in top]
+
+    def _ranked_postings(self, term):
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            ranked = sorted(self._postings[term].items(), key=lambda item: (-item[1], item[0]))
+            self._ranked[term] = ranked
+        return ranked
+
+    def _search_single(self, terms, limit):
+        """Top products for a one-token query without scoring every posting.
+
+        Each term's postings are kept ranked, so merging the ranked lists of
+        the matching terms yields the best products first.
+        """
+        def stream(term, weight):
+            for doc_id, doc_weight in self._ranked_postings(term):
+                yield -doc_weight * weight, doc_id
+
+        streams = [stream(term, weight) for term, _, weight in terms]
+        results = []
+        seen = set()
+        for _, doc_id in heapq.merge(*streams):
+            if doc_id not in seen:
+                seen.add(doc_id)
+                results.append(self._docs[doc_id])
+                if len(results) == limit:
+                    break
+        return results
+
+    # ORM integration
+
+    def watch(self, model, serialize):
+        """Apply committed inserts, updates and deletes of `model` to the index.
+
+        `serialize(instance)` must return the product dict to index.
+        """
+        def after_flush(session, flush_context):
+            changes = session.info.setdefault('search_index_changes', {})
+            for obj in list(session.new) + list(session.dirty):
+                if isinstance(obj, model):
+                    changes[obj.id] = serialize(obj)
+            for obj in session.deleted:
+                if isinstance(obj, model):
+                    changes[obj.id] = None
+
+        def do_orm_execute(orm_execute_state):
+            if orm_execute_state.is_update or orm_execute_state.is_delete:
+                mapper = orm_execute_state.bind_mapper
+                if mapper is not None and issubclass(mapper.class_, model):
+                    # Bulk statements do not say which rows changed
+                    orm_execute_state.session.info['search_index_stale'] = True
+
+        def after_commit(session):
+            changes = session.info.pop('search_index_changes', {})
+            if session.info.pop('search_index_stale', False):
+                self.built_at = None
+                return
+            if self.built_at is None:
+                return
+            for doc_id, product in changes.items():
+                if product is None:
+                    self.remove(doc_id)
+                else:
+                    self.upsert(product)
+
+        def after_rollback(session, previous_transaction):
+            session.info.pop('search_index_changes', None)
+            session.info.pop('search_index_stale', None)
+
+        event.listen(Session, 'after_flush', after_flush)
+        event.listen(Session, 'do_orm_execute', do_orm_execute)
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_soft_rollback', after_rollback)
+        return self
@@ -1,28 +1,68 @@
-from app import app, db
-from models import Product
+from sqlalchemy import insert
+
+from password_hashing import hash_password
+
+DEFAULT_VENDOR_EMAIL = 'vendor@example.com'
+DEFAULT_VENDOR_PASSWORD = 'password123'
+# Where the default vendor's deliveries are picked up: Marikiti market, Nairobi
+DEFAULT_VENDOR_LOCATION = (-1.2833, 36.8290)
+
+SAMPLE_PRODUCTS = [
+    {"name": "Tomato", "description": "Fresh red tomatoes", "price": 3.5},
+    {"name": "Cabbage", "description": "Green cabbage", "price": 2.0},
+    {"name": "Onion", "description": "White onions", "price": 1.5},
+    {"name": "Potato", "description": "Fresh potatoes", "price": 4.0},
+    {"name": "Carrot", "description": "Organic carrots", "price": 3.0},
+]
+
+
+def seed_vendor(db, User, rounds):
+    """Create the default vendor unless a vendor exists; returns (vendor_id, created).
+
+    The default vendor gets DEFAULT_VENDOR_LOCATION, also when an earlier
+    seed created it without one, so its orders have a pickup point.
+    """
+    vendor_id = db.session.query(User.id).filter_by(role='vendor').order_by(User.id).limit(1).scalar()
+    if vendor_id is not None:
+        db.session.query(User).filter(
+            User.email == DEFAULT_VENDOR_EMAIL, User.role == 'vendor', User.latitude.is_(None)
+        ).update({'latitude': DEFAULT_VENDOR_LOCATION[0], 'longitude': DEFAULT_VENDOR_LOCATION[1]},
+                 synchronize_session=False)
+        return vendor_id, False
+    vendor = User(
+        email=DEFAULT_VENDOR_EMAIL,
+        password=hash_password(DEFAULT_VENDOR_PASSWORD, rounds),
+        role='vendor',
+        latitude=DEFAULT_VENDOR_LOCATION[0],
+        longitude=DEFAULT_VENDOR_LOCATION[1],
+    )
+    db.session.add(vendor)
+    db.session.flush()
+    return vendor.id, True
+
+
+def seed_products(db, Product, vendor_id, products=SAMPLE_PRODUCTS):
+    """Insert `products` for the vendor in one multi-row INSERT if there are none yet"""
+    if db.session.query(Product.id).limit(1).first() is not None:
+        return 0
+    db.session.execute(insert(Product).values([dict(product, vendor_id=vendor_id) for product in products]))
+    return len(products)
+
+
+def seed(db, User, Product, rounds=12):
+    """Seed the default vendor and sample products in one transaction.
+
+    Safe to run on every deploy: existing vendors and products are left alone.
+    Returns (vendor_created, products_added).
+    """
+    vendor_id, vendor_created = seed_vendor(db, User, rounds)
+    products_added = seed_products(db, Product, vendor_id)
+    db.session.commit()
+    return vendor_created, products_added
 
-def seed_products():
-    """Seed the database with sample products"""
-    with app.app_context():
-        # Check if products already exist
-        if Product.query.count() > 0:
-            print("Products already exist in database")
-            return
-        
-        sample_products = [
-            {"name": "Tomatoes", "description": "Fresh red tomatoes", "price": 50.0},
-            {"name": "Onions", "description": "Fresh white onions", "price": 40.0},
-            {"name": "Carrots", "description": "Fresh orange carrots", "price": 60.0},
-            {"name": "Spinach", "description": "Fresh green spinach", "price": 30.0},
-            {"name": "Potatoes", "description": "Fresh potatoes", "price": 45.0}
-        ]
-        
-        for product_data in sample_products:
-            product = Product(**product_data)
-            db.session.add(product)
-        
-        db.session.commit()
-        print(f"Added {len(sample_products)} products to database")
 
 if __name__ == "__main__":
-    seed_products()
\ No newline at end of file
+    from app import app, db, User, Product, password_hasher
+    with app.app_context():
+        vendor_created, products_added = seed(db, User, Product, password_hasher.rounds)
+        print(f"Vendor created: {vendor_created}, products added: {products_added}")
@@ -0,0 +1,345 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Grid cell size; 0.005 degrees is about 550 m, a couple of minutes' ride
+CELL_DEGREES = 0.005
+# Zones are large, so they are bucketed on a coarser grid
+ZONE_CELL_DEGREES = 0.05
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Even-odd ray casting; `polygon` is a list of (lat, lon) vertices"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+def _cell(lat, lon, size=CELL_DEGREES):
+    return math.floor(lat / size), math.floor(lon / size)
+
+
+class VendorLocationIndex:
+    """In-process grid index of vendor positions for nearest-vendor queries.
+
+    Vendors are bucketed into fixed cells of CELL_DEGREES; a query visits
+    rings of cells outward from the query point and stops once no unvisited
+    cell can hold anything closer, so it only ever measures the vendors
+    around the point. Distances use an equirectangular projection centred on
+    the query, within metres of the great-circle distance across a city and
+    free of trigonometry per vendor. `loader()` yields (vendor_id, latitude,
+    longitude) tuples and is only used for full rebuilds; committed moves of
+    the watched model are applied incrementally.
+    """
+
+    def __init__(self, loader, refresh_interval=None):
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._rebuilding = False
+        self._points = {}
+        self._cells = defaultdict(dict)
+        # (min_row, min_col, max_row, max_col) of every cell ever occupied;
+        # only grows between rebuilds, which keeps it a safe search bound
+        self._extent = None
+        self.built_at = None
+        self.refresh_interval = refresh_interval
+
+    def _grow_extent(self, cell):
+        if self._extent is None:
+            self._extent = cell + cell
+        else:
+            min_row, min_col, max_row, max_col = self._extent
+            self._extent = (min(min_row, cell[0]), min(min_col, cell[1]), max(max_row, cell[0]), max(max_col, cell[1]))
+
+    # Maintenance
+
+    def rebuild(self, vendors=None):
+        """Replace the index contents with `vendors` (default: the loader's)"""
+        vendors = list(self._loader() if vendors is None else vendors)
+        points, cells = {}, defaultdict(dict)
+        for vendor_id, lat, lon in vendors:
+            points[vendor_id] = (lat, lon)
+            cells[_cell(lat, lon)][vendor_id] = (lat, lon)
+        with self._lock:
+            self._points, self._cells, self._extent = points, cells, None
+            for cell in cells:
+                self._grow_extent(cell)
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built_at is None:
+            self.rebuild()
+        elif (self.refresh_interval is not None and not self._rebuilding
+              and time.monotonic() - self.built_at > self.refresh_interval):
+            # Pick up moves committed by other workers without blocking queries
+            self._rebuilding = True
+            threading.Thread(
+                target=self._background_rebuild, args=(current_app._get_current_object(),), daemon=True
+            ).start()
+
+    def _background_rebuild(self, app):
+        try:
+            # The loader queries through Flask-SQLAlchemy's session
+            with app.app_context():
+                self.rebuild()
+        except Exception:
+            log.exception("Vendor location index refresh failed")
+        finally:
+            self._rebuilding = False
+
+    def upsert(self, vendor_id, lat, lon):
+        with self._lock:
+            self._remove(vendor_id)
+            self._points[vendor_id] = (lat, lon)
+            cell = _cell(lat, lon)
+            self._cells[cell][vendor_id] = (lat, lon)
+            self._grow_extent(cell)
+
+    def remove(self, vendor_id):
+        with self._lock:
+            self._remove(vendor_id)
+
+    def _remove(self, vendor_id):
+        point = self._points.pop(vendor_id, None)
+        if point is None:
+            return
+        cell = _cell(*point)
+        members = self._cells[cell]
+        members.pop(vendor_id, None)
+        if not members:
+            del self._cells[cell]
+
+    def __len__(self):
+        return len(self._points)
+
+    # Queries
+
+    def _ring(self, centre, radius):
+        row, col = centre
+        if radius == 0:
+            yield centre
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def nearest(self, lat, lon, k=10, max_km=None):
+        """Up to `k` (vendor_id, distance_km) pairs, closest first"""
+        with self._lock:
+            if not self._points or k < 1:
+                return []
+            scale = math.cos(math.radians(lat))
+            limit2 = (max_km / KM_PER_DEGREE) ** 2 if max_km is not None else math.inf
+            centre = _cell(lat, lon)
+            min_row, min_col, max_row, max_col = self._extent
+            # Beyond this ring every occupied cell has been visited
+            last_ring = max(centre[0] - min_row, max_row - centre[0], centre[1] - min_col, max_col - centre[1])
+            best = []  # max-heap of (-squared distance, vendor_id)
+            radius = 0
+            while radius <= last_ring:
+                # Anything in ring `radius` or beyond is at least this far away;
+                # a cell is CELL_DEGREES tall and CELL_DEGREES * scale wide
+                bound = max(0, radius - 1) * CELL_DEGREES * min(1.0, scale)
+                bound2 = bound * bound
+                if bound2 > limit2 or (len(best) == k and bound2 >= -best[0][0]):
+                    break
+                if (2 * radius + 1) ** 2 > 4 * len(self._cells):
+                    # Sparse data far from the point: cheaper to finish on the occupied cells
+                    cells = [members for cell, members in self._cells.items()
+                             if max(abs(cell[0] - centre[0]), abs(cell[1] - centre[1])) >= radius]
+                    radius = last_ring
+                else:
+                    cells = [self._cells[cell] for cell in self._ring(centre, radius) if cell in self._cells]
+                for members in cells:
+                    for vendor_id, (vlat, vlon) in members.items():
+                        dy, dx = vlat - lat, (vlon - lon) * scale
+                        d2 = dx * dx + dy * dy
+                        if d2 > limit2:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-d2, vendor_id))
+                        elif d2 < -best[0][0]:
+                            heapq.heapreplace(best, (-d2, vendor_id))
+                radius += 1
+            return [(vendor_id, math.sqrt(-neg) * KM_PER_DEGREE) for neg, vendor_id in sorted(best, reverse=True)]
+
+    def within(self, lat, lon, radius_km, limit=None):
+        """(vendor_id, distance_km) pairs within `radius_km`, closest first.
+
+        With `limit`, only the closest `limit` are found, which stops the
+        search early in dense areas.
+        """
+        if limit is not None:
+            return self.nearest(lat, lon, k=limit, max_km=radius_km)
+        with self._lock:
+            if not self._points:
+                return []
+            scale = math.cos(math.radians(lat))
+            span = radius_km / KM_PER_DEGREE
+            limit2 = span * span
+            lon_span = span / max(scale, 1e-6)
+            low, high = _cell(lat - span, lon - lon_span), _cell(lat + span, lon + lon_span)
+            box_cells = (high[0] - low[0] + 1) * (high[1] - low[1] + 1)
+            if box_cells > len(self._cells):
+                cells = [members for (row, col), members in self._cells.items()
+                         if low[0] <= row <= high[0] and low[1] <= col <= high[1]]
+            else:
+                cells = [self._cells[(row, col)] for row in range(low[0], high[0] + 1)
+                         for col in range(low[1], high[1] + 1) if (row, col) in self._cells]
+            found = []
+            for members in cells:
+                for vendor_id, (vlat, vlon) in members.items():
+                    dy, dx = vlat - lat, (vlon - lon) * scale
+                    d2 = dx * dx + dy * dy
+                    if d2 <= limit2:
+                        found.append((d2, vendor_id))
+            found.sort()
+            return [(vendor_id, math.sqrt(d2) * KM_PER_DEGREE) for d2, vendor_id in found]
+
+    # ORM integration
+
+    def watch(self, model, role='vendor'):
+        """Apply committed position changes of `model` rows with `role`.
+
+        Rows need `id`, `role`, `latitude` and `longitude` attributes; a row
+        that loses its position or role leaves the index.
+        """
+        def after_flush(session, flush_context):
+            changes = session.info.setdefault('vendor_index_changes', {})
+            for obj in list(session.new) + list(session.dirty):
+                if isinstance(obj, model):
+                    located = obj.role == role and obj.latitude is not None and obj.longitude is not None
+                    changes[obj.id] = (obj.latitude, obj.longitude) if located else None
+            for obj in session.deleted:
+                if isinstance(obj, model):
+                    changes[obj.id] = None
+
+        def do_orm_execute(orm_execute_state):
+            if orm_execute_state.is_update or orm_execute_state.is_delete:
+                mapper = orm_execute_state.bind_mapper
+                if mapper is not None and issubclass(mapper.class_, model):
+                    # Bulk statements do not say which rows changed
+                    orm_execute_state.session.info['vendor_index_stale'] = True
+
+        def after_commit(session):
+            changes = session.info.pop('vendor_index_changes', {})
+            if session.info.pop('vendor_index_stale', False):
+                self.built_at = None
+                return
+            if self.built_at is None:
+                return
+            for vendor_id, position in changes.items():
+                if position is None:
+                    self.remove(vendor_id)
+                else:
+                    self.upsert(vendor_id, *position)
+
+        def after_rollback(session, previous_transaction):
+            session.info.pop('vendor_index_changes', None)
+            session.info.pop('vendor_index_stale', None)
+
+        event.listen(Session, 'after_flush', after_flush)
+        event.listen(Session, 'do_orm_execute', do_orm_execute)
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_soft_rollback', after_rollback)
+        return self
+
+
+class DeliveryZoneIndex:
+    """Delivery zone polygons bucketed by the grid cells their bounds cover.
+
+    `locate()` only tests the zones registered in the point's cell, first
+    against their bounding box and then with ray casting. `loader()` yields
+    zone dicts with id, name and polygon ([[lat, lon], ...]). Zones change
+    rarely, so any committed change to the watched model marks the index
+    for a full rebuild on next use.
+    """
+
+    def __init__(self, loader, refresh_interval=None):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._zones = {}
+        self._cells = {}
+        self.built_at = None
+        self.refresh_interval = refresh_interval
+
+    def rebuild(self, zones=None):
+        zones = list(self._loader() if zones is None else zones)
+        indexed, cells = {}, defaultdict(list)
+        for zone in zones:
+            polygon = [tuple(vertex) for vertex in zone['polygon']]
+            lats, lons = [v[0] for v in polygon], [v[1] for v in polygon]
+            bounds = (min(lats), min(lons), max(lats), max(lons))
+            indexed[zone['id']] = (zone, polygon, bounds)
+            low = _cell(bounds[0], bounds[1], ZONE_CELL_DEGREES)
+            high = _cell(bounds[2], bounds[3], ZONE_CELL_DEGREES)
+            for row in range(low[0], high[0] + 1):
+                for col in range(low[1], high[1] + 1):
+                    cells[(row, col)].append(zone['id'])
+        with self._lock:
+            self._zones, self._cells = indexed, dict(cells)
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built_at is None or (
+                self.refresh_interval is not None and time.monotonic() - self.built_at > self.refresh_interval):
+            self.rebuild()
+
+    def __len__(self):
+        return len(self._zones)
+
+    def locate(self, lat, lon):
+        """The zone dict containing the point, or None"""
+        with self._lock:
+            for zone_id in self._cells.get(_cell(lat, lon, ZONE_CELL_DEGREES), ()):
+                zone, polygon, (min_lat, min_lon, max_lat, max_lon) = self._zones[zone_id]
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon and point_in_polygon(lat, lon, polygon):
+                    return zone
+            return None
+
+    def watch(self, model):
+        """Rebuild on next use after any committed change to `model` rows"""
+        def after_flush(session, flush_context):
+            if any(isinstance(obj, model) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+                session.info['zone_index_stale'] = True
+
+        def after_commit(session):
+            if session.info.pop('zone_index_stale', False):
+                self.built_at = None
+
+        def after_rollback(session, previous_transaction):
+            session.info.pop('zone_index_stale', None)
+
+        event.listen(Session, 'after_flush', after_flush)
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_soft_rollback', after_rollback)
+        return self
@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+
+from werkzeug.exceptions import NotFound
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only .gz variants are built
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# Content-Encoding of each precompressed variant, by file suffix, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Build outputs named after their content hash (main.3f2a9c1e.js,
+# 787.1b4e0f2a.chunk.css) never change, so browsers may keep them for a year
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}(\.chunk)?\.[A-Za-z0-9]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Types worth compressing at build time
+COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|xml|manifest\+json)|image/svg\+xml)')
+MIN_COMPRESS_BYTES = 1024
+
+
+@dataclass
+class Variant:
+    path: str
+    size: int
+    etag: str
+    data: bytes = None
+
+
+@dataclass
+class StaticFile:
+    mimetype: str
+    mtime: float
+    cache_control: str
+    # '' for the file as is, else the Content-Encoding of a precompressed copy
+    variants: dict = field(default_factory=dict)
+
+
+def _etag(path, stat):
+    return hashlib.sha1(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:20]
+
+
+class StaticFiles:
+    """The React build, indexed once and served without per-request filesystem checks.
+
+    load() walks `root` and records every file with its type, cache policy
+    and precompressed .br/.gz siblings; every variant up to `memory_limit`
+    bytes is read into memory, within a total of `memory_budget` bytes.
+    Requests are then answered from the index: the smallest variant the
+    client accepts, strong ETags per variant, If-None-Match/If-Modified-Since
+    and byte ranges (on the identity variant, see serve()). Hashed build outputs are cached for a year as
+    immutable; everything else revalidates. Unknown paths get index.html so
+    client-side routes load the app, except under static/, where a missing
+    asset is a 404 rather than HTML.
+    """
+
+    def __init__(self, root, memory_limit=64 * 1024, memory_budget=32 * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.memory_limit = memory_limit
+        self.memory_budget = memory_budget
+        self.files = {}
+        self.memory_used = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def load(self):
+        files, used = {}, 0
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(suffixes):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                stat = os.stat(path)
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                entry = StaticFile(
+                    mimetype=mimetype, mtime=stat.st_mtime,
+                    cache_control=IMMUTABLE if HASHED_NAME.search(name) else REVALIDATE,
+                )
+                entry.variants[''] = Variant(path, stat.st_size, _etag(relative, stat))
+                for encoding, suffix in ENCODINGS:
+                    if os.path.isfile(path + suffix):
+                        compressed = os.stat(path + suffix)
+                        # A stale sibling from an earlier build would serve old content
+                        if compressed.st_mtime >= stat.st_mtime:
+                            entry.variants[encoding] = Variant(
+                                path + suffix, compressed.st_size, _etag(relative + suffix, compressed))
+                # Decided per variant: a 400 KB bundle's 90 KB .br copy still fits
+                for variant in entry.variants.values():
+                    if variant.size <= self.memory_limit and used + variant.size <= self.memory_budget:
+                        with open(variant.path, 'rb') as f:
+                            variant.data = f.read()
+                        used += variant.size
+                files[relative] = entry
+        # Swapped in whole, so requests during a reload see the old index or the new
+        self.files, self.memory_used = files, used
+        log.info("Indexed static files", extra={
+            'root': self.root, 'files': len(files), 'memory_bytes': used,
+            'precompressed': sum(len(entry.variants) > 1 for entry in files.values()),
+        })
+        return self
+
+    def lookup(self, path):
+        """The entry to serve for URL path `path`, or None for a 404"""
+        entry = self.files.get(path)
+        if entry is None and not path.startswith('static/'):
+            entry = self.files.get('index.html')
+        return entry
+
+    def serve(self, request, path):
+        entry = self.lookup(path.lstrip('/') or 'index.html')
+        if entry is None:
+            raise NotFound()
+        encoding = ''
+        # Ranges address bytes of the representation; resuming a compressed
+        # download is rare, so range requests get the identity variant
+        if len(entry.variants) > 1 and 'Range' not in request.headers:
+            accepted = request.accept_encodings
+            for candidate, _ in ENCODINGS:
+                if candidate in entry.variants and accepted[candidate]:
+                    encoding = candidate
+                    break
+        variant = entry.variants[encoding]
+        if variant.data is not None:
+            body, passthrough = variant.data, False
+        else:
+            body, passthrough = wrap_file(request.environ, open(variant.path, 'rb')), True
+        response = Response(body, mimetype=entry.mimetype, direct_passthrough=passthrough)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if len(entry.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = entry.cache_control
+        response.set_etag(variant.etag)
+        response.last_modified = entry.mtime
+        response.content_length = variant.size
+        response.make_conditional(request, accept_ranges=True, complete_length=variant.size)
+        if response.status_code == 304 and passthrough:
+            body.close()
+        return response
+
+
+def compress_tree(root, min_size=MIN_COMPRESS_BYTES):
+    """Write .gz (and, with brotli installed, .br) copies of compressible files under `root`.
+
+    Done once after `npm run build`, at the highest levels, since the cost is
+    paid at build time rather than per request. Returns (files, bytes in,
+    smallest bytes out).
+    """
+    files = size_in = size_out = 0
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for directory, _, names in os.walk(root):
+        for name in names:
+            mimetype = mimetypes.guess_type(name)[0] or ''
+            if name.endswith(suffixes) or not COMPRESSIBLE.match(mimetype):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < min_size:
+                continue
+            outputs = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', brotli.compress(data, quality=11)))
+            smallest = len(data)
+            for suffix, compressed in outputs:
+                # Only keep variants that actually save bytes
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    smallest = min(smallest, len(compressed))
+            files += 1
+            size_in += len(data)
+            size_out += smallest
+    return files, size_in, size_out
@@ -1,12 +1,161 @@
-from flask import jsonify
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it the stdlib encoder is used
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are gzipped
+    brotli = None
+
+# Bodies smaller than this gain little from compression and cost a CPU hop
+COMPRESS_MIN_BYTES = 1024
+# Per-request compression favours speed: the ratio gained by higher levels is
+# small next to their cost, unlike the build-time static_files.compress_tree()
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Besides text/*; event streams are excluded by being streamed
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'image/svg+xml'}
+
 
 def success_response(message, data=None, status_code=200):
     """Standard success response format"""
     response = {"success": True, "message": message}
     if data is not None:
         response["data"] = data
-    return jsonify(response), status_code
+    return json_response(response, status_code)
 
 def error_response(message, status_code=400):
     """Standard error response format"""
-    return jsonify({"success": False, "message": message}), status_code
\ No newline at end of file
+    return json_response({"success": False, "message": message}, status_code)
+
+def json_response(payload, status_code=200):
+    """`payload` as a JSON response, encoded by the app's JSON provider"""
+    return current_app.json.response(payload), status_code
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with orjson when it is installed.
+
+    jsonify() and every other use of app.json go through it. Output matches
+    the default provider's except that keys keep their insertion order:
+    datetimes are still HTTP dates and anything orjson cannot encode (ints
+    past 64 bits, non-string keys) falls back to the stdlib encoder.
+    """
+
+    sort_keys = False
+
+    def _orjson(self, obj, indent=False):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and set(kwargs) <= {'indent', 'separators'}:
+            try:
+                return self._orjson(obj, indent=bool(kwargs.get('indent'))).decode()
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = self._orjson(obj, indent=indent) + b'\n'
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class ResponseCompressor:
+    """Compresses text and JSON responses for clients that accept it.
+
+    Bodies of at least `min_bytes` are sent with brotli when the client and
+    server both support it, else gzip. Responses with a strong ETag (the
+    catalog) have the same bytes every time until the ETag changes, so their
+    compressed bodies are kept, up to `max_entries` of them, least recently
+    used first out. A compressed response's ETag is made weak, since its bytes
+    differ from the identity body; If-None-Match compares weakly, so 304s
+    still work.
+    """
+
+    def __init__(self, min_bytes=COMPRESS_MIN_BYTES, max_entries=256):
+        self.min_bytes = min_bytes
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.min_bytes = app.config.get('COMPRESS_MIN_BYTES', self.min_bytes)
+        self.max_entries = app.config.get('COMPRESS_CACHE_ENTRIES', self.max_entries)
+        app.after_request(self._after_request)
+        app.extensions['response_compressor'] = self
+
+    def encoding_for(self, accept_encodings):
+        if brotli is not None and accept_encodings['br']:
+            return 'br'
+        if accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def _after_request(self, response):
+        mimetype = response.mimetype or ''
+        if (not (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES) or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300 or response.status_code in (204, 206)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding_for(request.accept_encodings)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_bytes:
+            return response
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            compressed = self._cached((etag, encoding), lambda: compress(body, encoding))
+        else:
+            compressed = compress(body, encoding)
+        if len(compressed) >= len(body):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _cached(self, key, build):
+        with self._lock:
+            compressed = self._cache.get(key)
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return compressed
+        compressed = build()
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = compressed
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return compressed
+
+
+# One per process; limits are set from the app config in init_app()
+response_compressor = ResponseCompressor()
@@ -2,4 +2,16 @@
 # Start script for Render deployment
 
 cd server
-gunicorn --bind 0.0.0.0:$PORT app:app
\ No newline at end of file
+# Render's proxy sits in front of gunicorn; without this every anonymous
+# client shares the proxy's address and so one rate limit bucket
+export PROXY_HOPS=${PROXY_HOPS:-1}
+# Apply pending migrations and seed an empty database once per deploy,
+# before any worker starts; workers themselves never touch the schema
+flask --app app db upgrade
+flask --app app seed
+# Order side effects run from the job queue and riders are assigned by the
+# dispatcher; on a single service both share the instance with gunicorn
+flask --app app jobs work &
+flask --app app dispatch &
+# Threaded workers: each open order stream holds a thread, not the worker
+gunicorn -k gthread --threads 100 --bind 0.0.0.0:$PORT 'app:create_app()'
\ No newline at end of file